@@ -0,0 +1,69 @@
+"""
+本地快车道路由基准：统计规则分类器的命中率、命中准确率与单次分类延迟 (p50/p95)。
+
+标注样本取自路由提示词中的 Few-Shot 示例与 README 压测剧本中的真实提问。
+命中的请求完全跳过一次 LLM 路由往返，节省的时间即该次网络调用的端到端延迟。
+
+用法:
+    python benchmarks/bench_fast_router.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.core.intent_classifier import FastIntentClassifier  # noqa: E402
+
+# (输入, 期望 task_type, 期望 need_rag)
+LABELED_QUERIES = [
+    ("数据清洗红线都有什么", "CHAT", True),
+    ("和我聊聊游戏", "CHAT", False),
+    ("生成完整的可视化图表", "PLOT", False),
+    ("帮我把空值填上", "DATA_OP", False),
+    ("帮我画个图，顺便分析下预警省份", "PLOT", False),
+    ("画个柱状图", "PLOT", False),
+    ("你好", "CHAT", False),
+    ("TEGDP 的计算口径是什么？", "CHAT", True),
+    ("按省份汇总 GDP 并排序", "DATA_OP", False),
+    ("帮我删除重复行", "DATA_OP", False),
+    ("查一下咱们内部知识库，关于环保数据清洗的红线要求和图表配色规范分别是什么？", "CHAT", True),
+    ("根据知识库的清洗红线，帮我把底表里所有不合格的脏数据（异常/空值/待核查/GDP小于等于0）全部剔除。"
+     "清理干净后，按照公式新增一列‘绿色发展指数’，并永久更新到底表中。不要画图，给我看看前5行。", "DATA_OP", True),
+    ("提取 2023 年的数据，帮我严格按照集团的可视化规范，画一个绿色发展指数排名前 10 的柱状图，从高到低排名。"
+     "并且在总结里告诉我，有没有需要触发预警的省份？", "PLOT", True),
+    ("上面这个图里排名前三的省份，你觉得哪个地方的美食最好吃？", "CHAT", False),
+    ("回到数据分析。帮我算一下这五年（2019-2023）全国每年的总 GDP 是多少？提取成表格，并画一条折线图。", "PLOT", False),
+    ("如果原神里的‘纳西妲’当了北京的环保局长，你觉得 2024 年它们的排放量会降到多少？给我画个预测分布图看看。", "PLOT", False),
+    ("假设在纳西妲的管理下，北京 2024 年工业排放量统一降低 30%（基于它们2023年的排放量）。"
+     "请你生成 北京 的模拟数据，并画图对比一下 2023 与 2024 的排放量。", "PLOT", False),
+    ("最后检查一下，我们系统底层的全量数据，目前总共有多少条有效记录？有没有被刚才的虚构数据给污染了？", "DATA_OP", False),
+]
+
+
+def main(repeats: int = 2000):
+    classifier = FastIntentClassifier()
+    hits, correct = 0, 0
+    latencies = []
+
+    for query, task_type, need_rag in LABELED_QUERIES:
+        route, confidence = classifier.classify(query)
+        for _ in range(repeats):
+            start = time.perf_counter_ns()
+            classifier.classify(query)
+            latencies.append(time.perf_counter_ns() - start)
+
+        if confidence >= classifier.threshold:
+            hits += 1
+            correct += route["task_type"] == task_type and route["need_rag"] == need_rag
+        print(f"{'HIT ' if confidence >= classifier.threshold else 'LLM '} {confidence:.2f} {route} <- {query[:30]}")
+
+    latencies_us = np.array(latencies) / 1000
+    print(f"\n快车道命中率: {hits}/{len(LABELED_QUERIES)} ({hits / len(LABELED_QUERIES):.0%})，"
+          f"命中准确率: {correct}/{hits}")
+    print(f"本地分类延迟: p50={np.percentile(latencies_us, 50):.1f}us  p95={np.percentile(latencies_us, 95):.1f}us")
+
+
+if __name__ == "__main__":
+    main()
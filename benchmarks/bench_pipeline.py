@@ -0,0 +1,207 @@
+"""
+端到端流水线基准：在 1k / 100k / 1M / 10M 行规模下测量 Agent 链路各阶段的耗时，结果输出为 JSON。
+
+覆盖阶段: load_data (首次解析) / restore_data (列式缓存命中) / get_data_metadata (冷 / 热) /
+semantic_router (快车道 / LLM) / retrieve_knowledge / execute_agentic_code (统计 / 绘图) / UI 防腐转换 / 分页。
+
+LLM 调用通过 `llm_replay.RecordReplayLLM` 回放 `fixtures/pipeline_cassette.json` 中的录制结果，
+知识库向量化使用确定性的哈希函数，整个基准不访问网络；数据由 generate_mock_data.py 的分块生成器按规模放大。
+
+用法:
+    python benchmarks/bench_pipeline.py --sizes 1000 100000 --out bench_results/pipeline.json
+    python benchmarks/bench_pipeline.py --compare bench_results/baseline.json --threshold 1.25
+    python benchmarks/bench_pipeline.py --record    # 使用 DEEPSEEK_API_KEY 重新录制 cassette
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(BENCH_DIR), BENCH_DIR]
+from generate_mock_data import generate_chunks, write_chunks  # noqa: E402
+from llm_replay import RecordReplayLLM  # noqa: E402
+from src.core.analyzer import AIDrivenFormAnalyzer  # noqa: E402
+from src.core.batch_runner import _PathUpload  # noqa: E402
+from src.utils.helpers import DataFramePager, make_dataframe_safe_for_ui  # noqa: E402
+
+DEFAULT_CASSETTE = os.path.join(BENCH_DIR, "fixtures", "pipeline_cassette.json")
+KNOWLEDGE_BASE = os.path.join(os.path.dirname(BENCH_DIR), "data", "kb_samples", "环境发展知识库.md")
+
+ROUTER_QUERY = "帮我看看这份报表里哪些省份值得关注"  # 快车道无法判定，回退 LLM 路由
+RAG_QUERIES = ["数据清洗红线都有什么", "TEGDP 的计算口径是什么？", "图表配色规范", "绿色发展指数预警阈值"]
+EXEC_QUERIES = {"execute_data_op": "按年份汇总 GDP 并排序", "execute_plot": "画出各年份 GDP 总量的折线图"}
+
+
+def write_dataset(path: str, rows: int, seed: int):
+    write_chunks(generate_chunks(rows, seed), path, "csv")
+
+
+class HashEmbedding:
+    """确定性的哈希向量化函数：避免下载嵌入模型，检索耗时只反映本地索引开销。"""
+
+    def __call__(self, input):
+        return [[b / 255 for b in hashlib.md5(text.encode("utf-8")).digest()[:8]] for text in input]
+
+
+def measure(fn, repeats: int) -> dict:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples = np.array(samples)
+    return {"runs": repeats, "min_ms": round(float(samples.min()), 3), "p50_ms": round(float(np.median(samples)), 3),
+            "mean_ms": round(float(samples.mean()), 3), "max_ms": round(float(samples.max()), 3)}
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 以 KB 为单位，macOS 上以字节为单位
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def bench_size(rows: int, llm, work_dir: str, seed: int, repeats: int, ingest_mode: str) -> dict:
+    path = os.path.join(work_dir, f"bench_{rows}.csv")
+    start = time.perf_counter()
+    write_dataset(path, rows, seed)
+    stats = {"generate_s": round(time.perf_counter() - start, 3), "file_mb": round(os.path.getsize(path) / 2 ** 20, 2)}
+
+    analyzer = AIDrivenFormAnalyzer(api_key="sk-bench", embedding_function=HashEmbedding(),
+                                    session_id=f"bench_{rows}")
+    analyzer.temp_dir = work_dir
+    analyzer.client = llm
+    analyzer.ingest_mode = ingest_mode
+    heavy = 1 if rows >= 1_000_000 else repeats
+
+    stages = {"load_data": measure(lambda: analyzer.load_data(path), 1),
+              "restore_data": measure(lambda: analyzer.restore_data(path), heavy)}
+
+    def cold_metadata():
+        analyzer._metadata_cache.clear()
+        analyzer.get_data_metadata()
+
+    stages["metadata_cold"] = measure(cold_metadata, heavy)
+    stages["metadata_warm"] = measure(analyzer.get_data_metadata, repeats)
+
+    stages["router_fast"] = measure(lambda: analyzer.semantic_router("画个柱状图"), repeats)
+    fast_router, analyzer.fast_router = analyzer.fast_router, None
+    stages["router_llm"] = measure(lambda: analyzer.semantic_router(ROUTER_QUERY), repeats)
+    analyzer.fast_router = fast_router
+
+    analyzer.load_custom_knowledge(_PathUpload(KNOWLEDGE_BASE))
+    queries = iter(RAG_QUERIES * repeats)
+    stages["retrieve_knowledge"] = measure(lambda: analyzer.retrieve_knowledge(next(queries)), repeats)
+
+    metadata = analyzer.get_data_metadata()
+    for stage, query in EXEC_QUERIES.items():
+        def execute():
+            success, _, _ = analyzer.execute_agentic_code(query=query, metadata=metadata, max_retries=1,
+                                                          task_type="PLOT" if "plot" in stage else "DATA_OP")
+            if not success:
+                raise RuntimeError(f"{stage} 执行失败")
+        stages[stage] = measure(execute, heavy)
+
+    stages["ui_safe_convert"] = measure(lambda: make_dataframe_safe_for_ui(analyzer.raw_data), heavy)
+    stages["ui_first_page"] = measure(lambda: DataFramePager().get_page(analyzer.raw_data, "bench", 0), repeats)
+
+    stats["stages"] = stages
+    stats["peak_rss_mb"] = peak_rss_mb()
+    os.remove(path)
+    return stats
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=BENCH_DIR, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "pandas": pd.__version__,
+            "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """对比两次结果的 p50，返回耗时比超过阈值的 (规模, 阶段, 比值) 列表。"""
+    regressions = []
+    for size, current in results["sizes"].items():
+        previous = baseline.get("sizes", {}).get(size)
+        if previous is None:
+            continue
+        for stage, timing in current["stages"].items():
+            before = previous["stages"].get(stage)
+            # 亚毫秒级阶段的抖动大于实际差异，不参与回归判定
+            if before is None or before["p50_ms"] < 1.0:
+                continue
+            ratio = timing["p50_ms"] / before["p50_ms"]
+            if ratio > threshold:
+                regressions.append((size, stage, round(ratio, 2)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--repeats", type=int, default=5, help="轻量阶段的重复次数 (百万行以上的重阶段只跑 1 次)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ingest-mode", choices=["standard", "chunked"], default="standard")
+    parser.add_argument("--cassette", default=DEFAULT_CASSETTE)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="回放时模拟的单次 LLM 延迟 (秒)")
+    parser.add_argument("--record", action="store_true", help="未命中的请求调用真实接口并写回 cassette")
+    parser.add_argument("--out", default=None, help="结果 JSON 路径 (默认只打印)")
+    parser.add_argument("--compare", default=None, help="基线结果 JSON，p50 变慢超过阈值时以非零状态退出")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    upstream = None
+    if args.record:
+        from openai import OpenAI
+        from src.core.resource_pool import DEEPSEEK_BASE_URL
+        upstream = OpenAI(api_key=os.environ["DEEPSEEK_API_KEY"], base_url=DEEPSEEK_BASE_URL)
+    llm = RecordReplayLLM(args.cassette, mode="record" if args.record else "replay", upstream=upstream,
+                          latency_s=args.llm_latency)
+
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    results = {"environment": environment(), "config": vars(args), "sizes": {}}
+    try:
+        for rows in args.sizes:
+            stats = bench_size(rows, llm, work_dir, args.seed, args.repeats, args.ingest_mode)
+            results["sizes"][str(rows)] = stats
+            print(f"\n== {rows:,} 行 (文件 {stats['file_mb']} MB, 生成 {stats['generate_s']}s, "
+                  f"峰值 RSS {stats['peak_rss_mb']} MB)")
+            for stage, timing in stats["stages"].items():
+                print(f"  {stage:<20} p50 {timing['p50_ms']:>10.2f} ms   min {timing['min_ms']:>10.2f} ms")
+        # 未命中的回放会被分析器降级处理，计时不再反映真实链路，直接判定基准无效
+        llm.check_complete()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for size, stage, ratio in regressions:
+            print(f"⚠️ 回归: {size} 行 / {stage} 变慢 {ratio}x")
+        if regressions:
+            sys.exit(1)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+知识检索基准：对比内置词典的逐词子串扫描与 Aho-Corasick 自动机，并测量 BM25 倒排索引的构建与查询延迟。
+
+在 1k / 10k / 100k 条术语 (及同等数量的知识条目) 规模下分别统计 p50 / p95 单次查询延迟。
+向量检索依赖嵌入模型与网络下载，不在本基准内；BM25 命中决定性时混合检索会直接跳过向量查询，
+此处一并统计被跳过的查询比例。
+
+用法:
+    python benchmarks/bench_retrieval.py --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.core.lexical_index import AhoCorasickMatcher, BM25Index  # noqa: E402
+
+CHARS = "能源消耗工业产值绿色发展指数排放总量增长率利润税收人口就业投资出口进口财政收入支出城乡居民可支配"
+
+
+def make_corpus(size: int, rng: random.Random):
+    terms = {f"{''.join(rng.choices(CHARS, k=rng.randint(3, 6)))}{i}": f"术语 {i} 的业务口径说明" for i in range(size)}
+    docs = [f"规则{i}: {''.join(rng.choices(CHARS, k=24))}" for i in range(size)]
+    return terms, docs
+
+
+def percentiles(samples_ns):
+    samples_us = np.array(samples_ns) / 1000
+    return np.percentile(samples_us, 50), np.percentile(samples_us, 95)
+
+
+def timed(fn, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter_ns()
+        fn(query)
+        samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+def main(sizes, n_queries: int = 200, seed: int = 7):
+    rng = random.Random(seed)
+    print(f"{'规模':>8} | {'子串扫描 p50/p95':>18} | {'AC p50/p95':>16} | {'AC 构建':>8} | "
+          f"{'BM25 p50/p95':>18} | {'BM25 构建':>9} | 跳过向量")
+    for size in sizes:
+        terms, docs = make_corpus(size, rng)
+        term_list = list(terms)
+        queries = [f"请问{rng.choice(term_list)}和{''.join(rng.choices(CHARS, k=6))}是什么口径" for _ in range(n_queries)]
+
+        def substring_scan(query):
+            return [k for k in terms if k.lower() in query.lower()]
+
+        start = time.perf_counter()
+        matcher = AhoCorasickMatcher(terms)
+        ac_build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = BM25Index()
+        index.add(docs)
+        bm25_build = time.perf_counter() - start
+
+        scan_p50, scan_p95 = percentiles(timed(substring_scan, queries[:50]))
+        ac_p50, ac_p95 = percentiles(timed(matcher.find_all, queries))
+        bm25_queries = [docs[rng.randrange(size)].split(": ", 1)[1][:12] for _ in range(n_queries)]
+        bm25_p50, bm25_p95 = percentiles(timed(lambda q: index.search(q, top_k=3), bm25_queries))
+        skipped = sum(1 for q in bm25_queries if (hits := index.search(q, top_k=3)) and hits[0][2] >= 0.8)
+
+        print(f"{size:>8} | {scan_p50:>8.0f}/{scan_p95:<7.0f}us | {ac_p50:>6.1f}/{ac_p95:<6.1f}us | {ac_build:>7.2f}s | "
+              f"{bm25_p50:>8.0f}/{bm25_p95:<7.0f}us | {bm25_build:>8.2f}s | {skipped / n_queries:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    main(args.sizes, args.queries)
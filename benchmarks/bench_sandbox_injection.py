@@ -0,0 +1,70 @@
+"""
+沙箱数据注入基准：对比 deep (完整深拷贝) 与 cow (写时复制视图) 两种注入策略。
+
+用法:
+    python benchmarks/bench_sandbox_injection.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.core.analyzer import AIDrivenFormAnalyzer  # noqa: E402
+
+READ_ONLY_CODE = "```python\nresult_df = df.groupby('省份')['GDP_亿元'].mean().reset_index()\n```"
+WRITE_CODE = "```python\ndf['GDP_万元'] = df['GDP_亿元'] * 10000\nresult_df = df.head(5)\n```"
+
+
+def build_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    return pd.DataFrame({
+        "年份": rng.integers(2019, 2024, rows),
+        "省份": rng.choice(["北京市", "上海市", "广东省", "江苏省"], rows),
+        "GDP_亿元": rng.uniform(1000, 120000, rows),
+        "工业排放量_万吨": rng.uniform(100, 20000, rows),
+    })
+
+
+def run_case(df: pd.DataFrame, mode: str, code: str, repeats: int) -> dict:
+    analyzer = AIDrivenFormAnalyzer(api_key="sk-benchmark")
+    analyzer.raw_data = df
+    analyzer.sandbox_copy_mode = mode
+
+    response = MagicMock()
+    response.choices[0].message.content = code
+    analyzer.client.chat.completions.create = MagicMock(return_value=response)
+
+    latencies = []
+    tracemalloc.start()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        success, _, _ = analyzer.execute_agentic_code(query="benchmark", metadata="{}")
+        latencies.append(time.perf_counter() - start)
+        assert success
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"mode": mode, "median_ms": round(float(np.median(latencies)) * 1000, 1),
+            "peak_alloc_mb": round(peak / 1024 / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    df = build_frame(args.rows)
+    print(f"数据规模: {args.rows} 行, {df.memory_usage(deep=True).sum() / 1024 / 1024:.1f} MB")
+    for label, code in [("只读统计", READ_ONLY_CODE), ("写入新列", WRITE_CODE)]:
+        for mode in ["deep", "cow"]:
+            print(label, run_case(df, mode, code, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+`client.chat.completions.create` 的录制 / 回放替身，让端到端基准完全离线、结果确定。
+
+录制模式把真实接口的回复 (含 token 用量) 写入 cassette 文件；回放模式按请求键返回录制的回复，
+未命中时直接报错，避免基准在不知情的情况下访问网络。分析器会吞掉 LLM 调用异常 (路由降级为 CHAT、
+代码生成进入重试)，因此未命中的键同时记录在 `missing` 中，基准结束前需调用 `check_complete()`。
+
+请求键由 "阶段 | 重试轮次 | 用户问题" 组成，而不是整段提示词的哈希：提示词中内嵌了数据元信息
+(行数、缺失值统计、抽样行)，会随数据规模变化，按整段哈希则每个规模都要单独录制一遍。
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+# 路由提示词与代码生成提示词中引用用户问题的固定句式
+QUERY_PATTERNS = (
+    ("router", re.compile(r'输入意图[:：]\s*"(.*?)"', re.S)),
+    ("codegen", re.compile(r'最新需求[:：]\s*"(.*?)"', re.S)),
+)
+
+
+class CassetteMissError(KeyError):
+    """回放模式下 cassette 中没有对应的录制结果。"""
+
+
+def request_key(messages: list) -> str:
+    """从请求消息中提取与数据规模无关的回放键。"""
+    text = "\n".join(message["content"] for message in messages)
+    for stage, pattern in QUERY_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return f"{stage}|{text.count('次重试]')}|{match.group(1).strip()}"
+    return "raw|" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _response(content: str, usage: dict):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+        usage=SimpleNamespace(**usage) if usage else None,
+    )
+
+
+def _stream(content: str, piece: int = 32):
+    for start in range(0, len(content), piece):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[start:start + piece]))])
+
+
+class RecordReplayLLM:
+    """
+    可直接赋给 `analyzer.client` 的 OpenAI 客户端替身。
+
+    Args:
+        cassette_path (str): 录制文件路径 (JSON)。
+        mode (str, optional): "replay" 只读回放；"record" 未命中时调用 upstream 并写回 cassette。
+        upstream (optional): 录制模式下的真实 OpenAI 客户端。
+        latency_s (float, optional): 回放时模拟的单次调用延迟，默认 0 (只测本地开销)。
+    """
+
+    def __init__(self, cassette_path: str, mode: str = "replay", upstream=None, latency_s: float = 0.0):
+        if mode not in ("replay", "record"):
+            raise ValueError(f"未知模式: {mode}")
+        if mode == "record" and upstream is None:
+            raise ValueError("录制模式需要提供 upstream 客户端")
+        self.cassette_path = cassette_path
+        self.mode = mode
+        self.upstream = upstream
+        self.latency_s = latency_s
+        self.calls = 0
+        self.misses = 0
+        self.missing = []  # 回放模式下未命中的请求键
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(cassette_path):
+            with open(cassette_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("entries", {})
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages: list, stream: bool = False, **kwargs):
+        key = request_key(messages)
+        with self._lock:
+            self.calls += 1
+            entry = self.entries.get(key)
+        if entry is None:
+            if self.mode == "replay":
+                with self._lock:
+                    self.missing.append(key)
+                raise CassetteMissError(f"cassette 中没有该请求: {key}，请以录制模式重新生成 {self.cassette_path}")
+            entry = self._record(key, messages, **kwargs)
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if stream:
+            return _stream(entry["content"])
+        return _response(entry["content"], entry.get("usage"))
+
+    def _record(self, key: str, messages: list, **kwargs) -> dict:
+        # 录制时统一走非流式请求，流式参数不适用
+        kwargs.pop("stream_options", None)
+        kwargs.pop("extra_body", None)
+        response = self.upstream.chat.completions.create(messages=messages, stream=False, **kwargs)
+        usage = getattr(response, "usage", None)
+        entry = {
+            "content": response.choices[0].message.content,
+            "usage": {name: getattr(usage, name) for name in ("prompt_tokens", "completion_tokens", "total_tokens")}
+            if usage is not None else None,
+        }
+        with self._lock:
+            self.misses += 1
+            self.entries[key] = entry
+            self.save()
+        return entry
+
+    def check_complete(self):
+        """
+        确认本次运行的所有请求都命中了 cassette。
+
+        Raises:
+            CassetteMissError: 存在未命中的请求 (即使分析器内部已经吞掉了当时抛出的异常)。
+        """
+        if self.missing:
+            raise CassetteMissError(f"{len(self.missing)} 个请求未命中 cassette {self.cassette_path}: "
+                                    f"{sorted(set(self.missing))}")
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.cassette_path)), exist_ok=True)
+        with open(self.cassette_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": self.entries}, f, ensure_ascii=False, indent=2, sort_keys=True)
@@ -1,58 +1,201 @@
-import pandas as pd
-import numpy as np
+"""
+生成包含逼真业务噪点的历年各省份 GDP 与工业排放数据 (压测数据生成器)。
+
+按 (随机种子, 块序号) 分块向量化生成，每块独立写出，内存占用只与块大小有关；
+同一种子下任意行数的输出前缀完全相同。
+
+用法:
+    python generate_mock_data.py                                   # 默认：31 省 × 5 年的 Excel 样例
+    python generate_mock_data.py --rows 10000000 --format parquet --seed 42
+    python generate_mock_data.py --rows 1000000 --years 2010 2023 --nan-rate 0.1 --format csv
+"""
+import argparse
 import os
+import time
+
+import numpy as np
+import pandas as pd
+
+PROVINCES = [
+    "北京市", "天津市", "河北省", "山西省", "内蒙古自治区", "辽宁省", "吉林省", "黑龙江省",
+    "上海市", "江苏省", "浙江省", "安徽省", "福建省", "江西省", "山东省", "河南省",
+    "湖北省", "湖南省", "广东省", "广西壮族自治区", "海南省", "重庆市", "四川省", "贵州省",
+    "云南省", "西藏自治区", "陕西省", "甘肃省", "青海省", "宁夏回族自治区", "新疆维吾尔自治区"
+]
+COASTAL_PROVINCES = ["广东省", "江苏省", "山东省", "浙江省"]
+OUTPUT_DIR = "data/mock_data"
+OUTPUT_STEM = "历年各省份GDP和工业排放数据"
+REMARKS = ["已核实", "待核查", "数据异常"]
+XLSX_MAX_ROWS = 1_048_575  # Excel 单表行数上限 (不含表头)
+
+
+def generate_chunks(rows: int = None, seed: int = None, year_start: int = 2019, year_end: int = 2023,
+                    nan_rate: float = 0.05, outlier_rate: float = 0.05, noise: float = 0.0,
+                    chunksize: int = 1_000_000):
+    """
+    分块生成数据框。
+
+    行按 年份 × 省份 铺开 (与原始样例顺序一致)，行数超过一个完整面板时循环重复。
+
+    Args:
+        rows (int, optional): 总行数，默认恰好一个面板 (省份数 × 年份数)。
+        seed (int, optional): 随机种子，为 None 时每次运行结果不同。
+        year_start (int, optional): 起始年份。
+        year_end (int, optional): 结束年份 (含)。
+        nan_rate (float, optional): "待核查" 行比例，这些行的排放量为空值。
+        outlier_rate (float, optional): "数据异常" 行比例，这些行的 GDP 为 -999。
+        noise (float, optional): 数值列的相对高斯扰动标准差 (0 表示不扰动)。
+        chunksize (int, optional): 每块行数。
+
+    Yields:
+        pd.DataFrame: 列为 年份 / 省份 / GDP_亿元 / 工业排放量_万吨 / 备注。
+    """
+    if year_end < year_start:
+        raise ValueError("结束年份不能早于起始年份")
+    if nan_rate < 0 or outlier_rate < 0 or nan_rate + outlier_rate > 1:
+        raise ValueError("空值比例与异常值比例须非负且之和不超过 1")
+
+    provinces = np.array(PROVINCES)
+    n_provinces, n_years = len(provinces), year_end - year_start + 1
+    rows = n_provinces * n_years if rows is None else rows
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    coastal = np.isin(provinces, COASTAL_PROVINCES)
+
+    for chunk_id, start in enumerate(range(0, rows, chunksize)):
+        n = min(chunksize, rows - start)
+        # 每个随机量使用独立的子流，末尾不满的块与完整块的前 n 个值一致，保证输出前缀与总行数无关
+        rngs = [np.random.default_rng([seed, chunk_id, stream]) for stream in range(6)]
+        idx = np.arange(start, start + n)
+        province_idx = idx % n_provinces
+
+        # 模拟基础数据：东部沿海高GDP，中西部偏低；排放量与GDP正相关并加入随机扰动
+        is_coastal = coastal[province_idx]
+        gdp = np.where(is_coastal, rngs[0].uniform(10000, 120000, n), rngs[1].uniform(1000, 50000, n))
+        emission = gdp * rngs[2].uniform(0.08, 0.25, n)
+        if noise:
+            gdp *= 1 + rngs[3].normal(0, noise, n)
+            emission *= 1 + rngs[4].normal(0, noise, n)
+
+        # 脏数据（用于测试 AI 清洗能力）：尾部 nan_rate 为待核查空值，其前 outlier_rate 为异常负值
+        draw = rngs[5].random(n)
+        is_missing = draw >= 1 - nan_rate
+        is_outlier = (draw >= 1 - nan_rate - outlier_rate) & ~is_missing
+        gdp = gdp.round(2)
+        gdp[is_outlier] = -999
+        emission = emission.round(2)
+        emission[is_missing] = np.nan
+        remark_codes = np.where(is_missing, 1, np.where(is_outlier, 2, 0))
+
+        # 文本列以分类编码构造，避免逐行生成 Python 字符串对象
+        yield pd.DataFrame({
+            "年份": year_start + (idx // n_provinces) % n_years,
+            "省份": pd.Categorical.from_codes(province_idx, categories=provinces),
+            "GDP_亿元": gdp,
+            "工业排放量_万吨": emission,
+            "备注": pd.Categorical.from_codes(remark_codes, categories=REMARKS),
+        })
+
+
+def _plain_schema(chunk: pd.DataFrame):
+    """分类列按普通字符串写出 (CSV 编码器不支持字典类型)。"""
+    import pyarrow as pa
+    fields = []
+    for name, dtype in chunk.dtypes.items():
+        arrow_type = pa.string() if isinstance(dtype, pd.CategoricalDtype) else pa.from_numpy_dtype(dtype)
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def write_chunks(chunks, output_path: str, fmt: str) -> int:
+    """将数据块依次写出 (CSV 追加 / Parquet 行组 / Excel 流式写入)，返回总行数。"""
+    total = 0
+    if fmt == "csv":
+        # Arrow 的 CSV 编码器比 DataFrame.to_csv 快数倍；文件头写入 BOM，Excel 可直接打开
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        with open(output_path, "wb") as f:
+            f.write("\ufeff".encode("utf-8"))
+            writer = None
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False).cast(_plain_schema(chunk))
+                if writer is None:
+                    writer = pa_csv.CSVWriter(f, table.schema, write_options=pa_csv.WriteOptions(quoting_style="needed"))
+                writer.write_table(table)
+                total += len(chunk)
+            if writer is not None:
+                writer.close()
+    elif fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema, compression="zstd")
+                writer.write_table(table)
+                total += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    elif fmt == "xlsx":
+        # openpyxl 只写模式逐行流式落盘；超过 Excel 单表上限时自动分表
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet, sheet_rows = None, XLSX_MAX_ROWS
+        for chunk in chunks:
+            for start in range(0, len(chunk), XLSX_MAX_ROWS):
+                part = chunk.iloc[start:start + XLSX_MAX_ROWS]
+                for row in part.astype(object).where(part.notna(), None).itertuples(index=False):
+                    if sheet_rows >= XLSX_MAX_ROWS:
+                        sheet = workbook.create_sheet(f"Sheet{len(workbook.worksheets) + 1}")
+                        sheet.append(list(chunk.columns))
+                        sheet_rows = 0
+                    sheet.append(row)
+                    sheet_rows += 1
+            total += len(chunk)
+        workbook.save(output_path)
+    else:
+        raise ValueError(f"不支持的输出格式: {fmt}")
+    return total
+
+
+def generate_environmental_data(rows: int = None, seed: int = None, year_start: int = 2019, year_end: int = 2023,
+                                nan_rate: float = 0.05, outlier_rate: float = 0.05, noise: float = 0.0,
+                                fmt: str = "xlsx", output_path: str = None, chunksize: int = 1_000_000) -> str:
+    """生成包含逼真业务噪点的历年各省份GDP与排放数据，返回输出文件路径"""
+    if output_path is None:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        output_path = os.path.join(OUTPUT_DIR, f"{OUTPUT_STEM}.{fmt}")
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    start = time.perf_counter()
+    chunks = generate_chunks(rows, seed, year_start, year_end, nan_rate, outlier_rate, noise, chunksize)
+    total = write_chunks(chunks, output_path, fmt)
+    seconds = time.perf_counter() - start
+    size_mb = os.path.getsize(output_path) / 1024 / 1024
+    print(f"✅ 成功生成带业务噪点的测试报表: {output_path} (共 {total} 行, {size_mb:.1f} MB, "
+          f"{seconds:.1f}s, {size_mb / max(seconds, 1e-9):.0f} MB/s)")
+    return output_path
 
 
-def generate_environmental_data():
-    """生成包含逼真业务噪点的历年各省份GDP与排放数据"""
-
-    provinces = [
-        "北京市", "天津市", "河北省", "山西省", "内蒙古自治区", "辽宁省", "吉林省", "黑龙江省",
-        "上海市", "江苏省", "浙江省", "安徽省", "福建省", "江西省", "山东省", "河南省",
-        "湖北省", "湖南省", "广东省", "广西壮族自治区", "海南省", "重庆市", "四川省", "贵州省",
-        "云南省", "西藏自治区", "陕西省", "甘肃省", "青海省", "宁夏回族自治区", "新疆维吾尔自治区"
-    ]
-    years = [2019, 2020, 2021, 2022, 2023]
-
-    data = []
-    for year in years:
-        for prov in provinces:
-            # 模拟基础数据：东部沿海高GDP，中西部偏低
-            base_gdp = np.random.uniform(10000, 120000) if prov in ["广东省", "江苏省", "山东省",
-                                                                    "浙江省"] else np.random.uniform(1000, 50000)
-            # 排放量与GDP有一定正相关，但加入随机扰动
-            base_emission = base_gdp * np.random.uniform(0.08, 0.25)
-
-            # 90% 的正常数据，10% 的脏数据（用于测试 AI 清洗能力）
-            rand_val = np.random.rand()
-            if rand_val > 0.95:
-                remark = "待核查"
-                base_emission = np.nan  # 故意制造空值
-            elif rand_val > 0.90:
-                remark = "数据异常"
-                base_gdp = -999  # 故意制造异常负值
-            else:
-                remark = "已核实"
-
-            data.append({
-                "年份": year,
-                "省份": prov,
-                "GDP_亿元": round(base_gdp, 2),
-                "工业排放量_万吨": round(base_emission, 2) if pd.notna(base_emission) else np.nan,
-                "备注": remark
-            })
-
-    df = pd.DataFrame(data)
-
-    # 确保目录存在
-    output_dir = "data/mock_data"
-    os.makedirs(output_dir, exist_ok=True)
-
-    # 导出为 Excel
-    output_path = os.path.join(output_dir, "历年各省份GDP和工业排放数据.xlsx")
-    df.to_excel(output_path, index=False)
-    print(f"✅ 成功生成带业务噪点的测试报表: {output_path} (共 {len(df)} 行)")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=None, help="总行数 (默认一个完整面板：省份数 × 年份数)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--years", type=int, nargs=2, default=[2019, 2023], metavar=("START", "END"))
+    parser.add_argument("--nan-rate", type=float, default=0.05, help="待核查 (排放量为空) 行比例")
+    parser.add_argument("--outlier-rate", type=float, default=0.05, help="数据异常 (GDP 为 -999) 行比例")
+    parser.add_argument("--noise", type=float, default=0.0, help="数值列的相对高斯扰动标准差")
+    parser.add_argument("--format", choices=["xlsx", "csv", "parquet"], default="xlsx")
+    parser.add_argument("--out", default=None, help=f"输出路径 (默认 {OUTPUT_DIR}/{OUTPUT_STEM}.<格式>)")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+    return generate_environmental_data(args.rows, args.seed, args.years[0], args.years[1], args.nan_rate,
+                                       args.outlier_rate, args.noise, args.format, args.out, args.chunksize)
 
 
 if __name__ == "__main__":
-    generate_environmental_data()
\ No newline at end of file
+    main()
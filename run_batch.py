@@ -0,0 +1,13 @@
+from run import patch_macos_proxy_issue
+
+
+def main():
+    # 与 run.py 一致：在任何第三方网络库加载前先修补代理环境变量
+    patch_macos_proxy_issue()
+
+    from src.core.batch_runner import main as batch_main
+    batch_main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+"""
+异步任务队列 HTTP 服务：供其它内部服务以任务 (job) 的方式调用分析引擎。
+
+仅依赖标准库 asyncio 实现 HTTP/1.1 (每个请求一个连接)。任务按会话排队，排队总数有上限，
+超过时立即返回 429 (背压)；固定数量的 worker 只从"当前没有任务在执行"的会话中取任务，
+在线程池中执行阻塞的分析调用。分析器实例按 session_id 复用，同一会话的任务按提交顺序串行执行，
+不同会话并行，一个繁忙的会话不会占住 worker 阻塞其它会话。
+load 任务的服务端路径 (path) 只允许位于启动时指定的上传目录内。
+
+接口:
+    GET    /health                    服务状态 (队列深度、worker 数、任务计数)
+    GET    /metrics                   Prometheus 文本格式的链路指标 (阶段耗时、token 用量、重试次数等)
+    POST   /sessions                  创建会话 {"api_key": 可选} -> {"session_id"}
+    DELETE /sessions/{id}             释放会话
+    POST   /jobs                      提交任务 {"session_id", "type": "load"|"route"|"execute"|"undo"|"redo", "params": {...}}
+    GET    /jobs/{id}                 查询任务状态
+    GET    /jobs/{id}/result          获取结果 (JSON)；?format=csv 下载完整表格，?format=png 下载图表
+
+用法:
+    python run_api.py --port 8765 --workers 4 --queue-size 64
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from src.core.telemetry import METRICS
+from src.utils.export_cache import export_figure
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPES = ("load", "route", "execute", "undo", "redo")
+STATUS_TEXT = {200: "OK", 201: "Created", 202: "Accepted", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+               405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 429: "Too Many Requests",
+               500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    """携带 HTTP 状态码的请求错误。"""
+
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class _Upload(io.BytesIO):
+    """把请求体中的 base64 文件包装成与 Streamlit 上传对象相同的接口。"""
+
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name = name
+
+
+class _Job:
+    def __init__(self, job_type: str, session_id: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.type = job_type
+        self.session_id = session_id
+        self.params = params
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.artifacts = {}  # 完整表格 / 图表等大对象，仅在下载时序列化
+
+    def describe(self) -> dict:
+        info = {"job_id": self.id, "type": self.type, "session_id": self.session_id, "status": self.status,
+                "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at}
+        if self.started_at:
+            info["queue_wait_s"] = round(self.started_at - self.created_at, 3)
+        if self.finished_at:
+            info["run_s"] = round(self.finished_at - self.started_at, 3)
+        if self.error:
+            info["error"] = self.error
+        return info
+
+
+def make_analyzer_factory(resources=None, llm_cache=None, model: str = "deepseek-chat", cache_dir: str = None):
+    """
+    构造默认的分析器工厂；传入 SharedResources 时所有会话共用连接池与向量化模型。
+
+    列式缓存写入服务自己的目录 cache_dir (默认为会话临时目录根下的 .columnar_cache，各会话共用)，
+    不写到上传目录中源文件的旁边。
+    """
+    from src.core.analyzer import AIDrivenFormAnalyzer
+    from src.utils.columnar_cache import CACHE_DIR_NAME
+
+    if cache_dir is None:
+        cache_dir = os.path.join(resources.temp_root if resources is not None else "./temp_data", CACHE_DIR_NAME)
+
+    def factory(session_id: str, api_key: str):
+        analyzer = AIDrivenFormAnalyzer(api_key=api_key, model=model, llm_cache=llm_cache,
+                                        resources=resources, session_id=session_id)
+        analyzer.columnar_cache_dir = cache_dir
+        return analyzer
+    return factory
+
+
+class JobQueueServer:
+    """有界队列 + 固定 worker 池的分析任务服务。"""
+
+    def __init__(self, analyzer_factory=None, default_api_key: str = None,
+                 max_workers: int = 4, max_queue: int = 64, max_finished_jobs: int = 1000,
+                 max_body_mb: float = 64, preview_rows: int = 50, upload_dir: str = None):
+        """
+        Args:
+            analyzer_factory (callable, optional): `factory(session_id, api_key)`，返回分析器实例 (测试时可注入桩 LLM)；
+                默认每个会话新建独立的 AIDrivenFormAnalyzer。
+            default_api_key (str, optional): 创建会话时未提供 api_key 则使用该值。
+            max_workers (int, optional): 并发执行任务的 worker 数。
+            max_queue (int, optional): 排队 (尚未开始执行) 的任务总数上限，超过时拒绝新任务 (HTTP 429)。
+            max_finished_jobs (int, optional): 保留的已完成任务数，超过后淘汰最早完成的任务。
+            max_body_mb (float, optional): 请求体大小上限 (MB)。
+            preview_rows (int, optional): JSON 结果中表格预览的默认行数。
+            upload_dir (str, optional): load 任务允许读取的服务端目录 (相对路径相对该目录解析)；
+                为 None 时禁止按 path 加载，只能通过请求体上传文件。
+        """
+        self.analyzer_factory = analyzer_factory or make_analyzer_factory()
+        self.default_api_key = default_api_key
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_finished_jobs = max_finished_jobs
+        self.max_body_bytes = int(max_body_mb * 1024 * 1024)
+        self.preview_rows = preview_rows
+        self.upload_dir = os.path.realpath(upload_dir) if upload_dir else None
+
+        self.sessions = {}
+        self.jobs = OrderedDict()
+        self.counters = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0}
+        # 每个会话一条待执行队列；会话在 _pending 中即表示它已在就绪队列中或正在执行，不会被两个 worker 同时取走
+        self._pending = {}
+        self._queued = 0
+        self._ready = None
+        self._workers = []
+        self._executor = None
+        self._server = None
+
+    # ---------------- 生命周期 ----------------
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765):
+        """启动 worker 与 HTTP 监听；port 为 0 时由系统分配 (见 `self.port`)。"""
+        self._ready = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job-worker")
+        self._workers = [asyncio.create_task(self._worker_loop()) for _ in range(self.max_workers)]
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+        logger.info(f"任务队列服务已启动: http://{self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def serve_forever(self, host: str, port: int):
+        await self.start(host, port)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    # ---------------- 会话与任务 ----------------
+
+    async def create_session(self, api_key: str = None) -> str:
+        api_key = api_key or self.default_api_key
+        if not api_key:
+            raise HTTPError(400, "缺少 api_key (请求体未提供且服务未配置默认密钥)")
+        session_id = uuid.uuid4().hex
+        # 分析器构造会初始化客户端与向量库，放到线程中执行，不阻塞事件循环
+        self.sessions[session_id] = await asyncio.to_thread(self.analyzer_factory, session_id, api_key)
+        return session_id
+
+    def submit(self, job_type: str, session_id: str, params: dict) -> _Job:
+        if job_type not in JOB_TYPES:
+            raise HTTPError(400, f"未知任务类型: {job_type}，可选 {list(JOB_TYPES)}")
+        if session_id not in self.sessions:
+            raise HTTPError(404, f"会话不存在: {session_id}")
+        params = params or {}
+        if job_type == "load" and "path" in params:
+            params["path"] = self._resolve_upload_path(params["path"])
+        if self._queued >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise HTTPError(429, f"任务队列已满 ({self.max_queue})，请稍后重试", headers={"Retry-After": "1"})
+
+        job = _Job(job_type, session_id, params)
+        pending = self._pending.get(session_id)
+        if pending is None:
+            pending = self._pending[session_id] = deque()
+            self._ready.put_nowait(session_id)
+        pending.append(job)
+        self._queued += 1
+        self.jobs[job.id] = job
+        self.counters["submitted"] += 1
+        return job
+
+    def _resolve_upload_path(self, path: str) -> str:
+        """将 load 任务的 path 解析为上传目录内的真实路径；目录外 (含符号链接逃逸) 的路径一律拒绝。"""
+        if self.upload_dir is None:
+            raise HTTPError(403, "服务未配置上传目录，不允许按服务端路径加载，请使用 content_base64 上传")
+        resolved = os.path.realpath(os.path.join(self.upload_dir, str(path)))
+        if os.path.commonpath([resolved, self.upload_dir]) != self.upload_dir:
+            raise HTTPError(403, f"路径不在允许的上传目录内: {path}")
+        return resolved
+
+    async def _worker_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # 就绪队列中只有当前没有任务在执行的会话，取到的会话在本任务结束前不会被其它 worker 取走
+            session_id = await self._ready.get()
+            pending = self._pending[session_id]
+            job = pending.popleft()
+            self._queued -= 1
+            try:
+                job.status, job.started_at = "running", time.time()
+                if session_id not in self.sessions:
+                    raise HTTPError(404, f"会话已释放: {session_id}")
+                job.result = await loop.run_in_executor(self._executor, self._run_job, job)
+                job.status = "succeeded"
+                self.counters["succeeded"] += 1
+            except asyncio.CancelledError:
+                raise
+            except HTTPError as e:
+                job.status, job.error = "failed", e.message
+                self.counters["failed"] += 1
+            except Exception as e:
+                logger.exception(f"任务执行异常: {job.id}")
+                job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+                self.counters["failed"] += 1
+            finally:
+                if job.status in ("succeeded", "failed"):
+                    job.finished_at = time.time()
+                    job.params = {}  # 释放请求体 (可能含 base64 文件)
+                    self._evict_finished()
+                # 会话还有排队任务时重新排到就绪队列末尾 (会话之间轮转)，否则让出调度位
+                if pending:
+                    self._ready.put_nowait(session_id)
+                else:
+                    del self._pending[session_id]
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    def _run_job(self, job: _Job) -> dict:
+        """在线程池中执行阻塞的分析调用。"""
+        analyzer = self.sessions.get(job.session_id)
+        if analyzer is None:
+            raise HTTPError(404, f"会话已释放: {job.session_id}")
+        params = job.params
+
+        if job.type == "load":
+            if "path" in params:
+                analyzer.load_data(params["path"])
+            elif "content_base64" in params:
+                analyzer.load_data(_Upload(params.get("filename", "upload.csv"),
+                                           base64.b64decode(params["content_base64"])))
+            else:
+                raise HTTPError(400, "load 任务需要 path 或 filename + content_base64")
+            df = analyzer.raw_data
+            return {"rows": len(df), "columns": [str(col) for col in df.columns], "data_version": analyzer.data_version,
+                    "version_id": analyzer.version_id}
+        if job.type in ("undo", "redo"):
+            changed = analyzer.undo_data() if job.type == "undo" else analyzer.redo_data()
+            return {"changed": changed, "version_id": analyzer.version_id,
+                    "can_undo": analyzer.versions.can_undo, "can_redo": analyzer.versions.can_redo}
+
+        query = params.get("query")
+        if not query:
+            raise HTTPError(400, f"{job.type} 任务需要 query")
+        analyzer.tracer.start_turn(query)
+        try:
+            result = self._run_turn(job, analyzer, query, params)
+        except Exception:
+            analyzer.tracer.end_turn(status="error", job_id=job.id)
+            raise
+        trace = analyzer.tracer.end_turn(status="success" if result.get("success", True) else "failed", job_id=job.id)
+        result["trace"] = {key: trace[key] for key in ("trace_id", "duration_s", "breakdown", "attempts",
+                                                       "prompt_tokens", "completion_tokens")}
+        return result
+
+    def _run_turn(self, job: _Job, analyzer, query: str, params: dict) -> dict:
+        preflight = analyzer.prepare_turn(query, params.get("router_query"))
+        if job.type == "route":
+            return {"route": preflight["route"], "rag_context": preflight["rag_context"],
+                    "seconds": preflight["seconds"]}
+
+        route = preflight["route"]
+        task_type = params.get("task_type") or route.get("task_type", "DATA_OP")
+        if task_type == "CHAT":
+            return {"success": False, "route": route, "text": "路由判定为 CHAT，未执行代码。"}
+        success, res_dict, code = analyzer.execute_agentic_code(
+            query=query, metadata=preflight["metadata"], rag_context=preflight["rag_context"],
+            task_type=task_type, preprocess_mode=params.get("preprocess_mode") or route.get("preprocess_mode", "NONE"),
+            max_retries=params.get("max_retries", 3), chat_context=params.get("chat_context", ""),
+            num_candidates=params.get("num_candidates", 1))
+        if not success or not isinstance(res_dict, dict):
+            return {"success": False, "route": route, "code": code,
+                    "text": res_dict if isinstance(res_dict, str) else "沙箱执行失败"}
+
+        result = {"success": True, "route": route, "code": code, "text": res_dict.get("text", ""),
+                  "version_id": analyzer.version_id}
+        df, fig = res_dict.get("df"), res_dict.get("fig")
+        if df is not None and hasattr(df, "to_csv"):
+            job.artifacts["df"] = df
+            result["table"] = {"total_rows": len(df), "columns": [str(col) for col in df.columns]}
+        if fig is not None:
+            job.artifacts["fig"] = fig
+            result["has_figure"] = True
+        return result
+
+    # ---------------- HTTP 层 ----------------
+
+    def health(self) -> dict:
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"status": "ok", "workers": self.max_workers, "queue_depth": self._queued,
+                "queue_capacity": self.max_queue, "sessions": len(self.sessions), "jobs": statuses,
+                "counters": dict(self.counters)}
+
+    def render_metrics(self) -> str:
+        """链路指标 + 服务自身的队列指标 (Prometheus 文本格式)。"""
+        lines = [METRICS.render_prometheus().rstrip("\n"),
+                 "# TYPE afa_job_queue_depth gauge", f"afa_job_queue_depth {self._queued}",
+                 "# TYPE afa_job_sessions gauge", f"afa_job_sessions {len(self.sessions)}",
+                 "# TYPE afa_jobs_total counter"]
+        lines += [f'afa_jobs_total{{outcome="{key}"}} {value}' for key, value in self.counters.items()]
+        return "\n".join(lines) + "\n"
+
+    async def handle(self, method: str, target: str, body: bytes = b"") -> tuple:
+        """
+        路由一个 HTTP 请求 (与传输层解耦，便于直接调用测试)。
+
+        Returns:
+            tuple: (状态码, 响应体 bytes, Content-Type, 额外响应头 dict)。
+        """
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            payload = json.loads(body.decode("utf-8")) if body else {}
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise HTTPError(400, "请求体不是合法的 JSON")
+
+        if parts == ["health"] and method == "GET":
+            return self._json(200, self.health())
+        if parts == ["metrics"] and method == "GET":
+            return 200, self.render_metrics().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8", {}
+        if parts == ["sessions"] and method == "POST":
+            return self._json(201, {"session_id": await self.create_session(payload.get("api_key"))})
+        if len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+            analyzer = self.sessions.pop(parts[1], None)
+            if analyzer is None:
+                raise HTTPError(404, f"会话不存在: {parts[1]}")
+            # 已排队的任务由 worker 取到时以"会话已释放"失败
+            if getattr(analyzer, "resources", None) is not None:
+                await asyncio.to_thread(analyzer.resources.release_session, parts[1])
+            return self._json(200, {"session_id": parts[1], "released": True})
+        if parts == ["jobs"] and method == "POST":
+            job = self.submit(payload.get("type"), payload.get("session_id"), payload.get("params"))
+            return self._json(202, job.describe())
+        if len(parts) >= 2 and parts[0] == "jobs" and method == "GET":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HTTPError(404, f"任务不存在: {parts[1]}")
+            if len(parts) == 2:
+                return self._json(200, job.describe())
+            if len(parts) == 3 and parts[2] == "result":
+                return await self._job_result(job, query)
+        if parts and parts[0] in ("health", "metrics", "sessions", "jobs"):
+            raise HTTPError(405, f"不支持的方法: {method} {url.path}")
+        raise HTTPError(404, f"未知路径: {url.path}")
+
+    async def _job_result(self, job: _Job, query: dict) -> tuple:
+        if job.status in ("queued", "running"):
+            raise HTTPError(409, f"任务尚未完成 (当前状态: {job.status})")
+        if job.status == "failed":
+            return self._json(200, {**job.describe(), "result": None})
+        # 表格序列化与图表渲染与结果大小成正比，放到线程中执行，不阻塞事件循环
+        return await asyncio.to_thread(self._render_result, job, query)
+
+    def _render_result(self, job: _Job, query: dict) -> tuple:
+        fmt = query.get("format", "json")
+        if fmt == "csv":
+            if "df" not in job.artifacts:
+                raise HTTPError(404, "该任务没有表格结果")
+            return 200, job.artifacts["df"].to_csv(index=False).encode("utf-8-sig"), "text/csv; charset=utf-8", {}
+        if fmt == "png":
+            if "fig" not in job.artifacts:
+                raise HTTPError(404, "该任务没有图表结果")
+            return 200, export_figure(job.artifacts["fig"], dpi=int(query.get("dpi", 150))), "image/png", {}
+
+        result = dict(job.result or {})
+        if "df" in job.artifacts:
+            rows = int(query.get("rows", self.preview_rows))
+            preview = job.artifacts["df"].head(rows)
+            result["table"] = {**result.get("table", {}),
+                               "preview": json.loads(preview.to_json(orient="records", force_ascii=False))}
+        return self._json(200, {**job.describe(), "result": result})
+
+    @staticmethod
+    def _json(status: int, data) -> tuple:
+        return status, json.dumps(data, ensure_ascii=False, default=str).encode("utf-8"), \
+            "application/json; charset=utf-8", {}
+
+    @classmethod
+    def _error(cls, status: int, message: str, headers: dict = None) -> tuple:
+        status, payload, content_type, _ = cls._json(status, {"error": message})
+        return status, payload, content_type, headers or {}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                request_line = (await reader.readline()).decode("latin-1").strip()
+                if not request_line:
+                    return
+                method, target, _ = request_line.split(" ", 2)
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1")
+                    if line in ("\r\n", "\n", ""):
+                        break
+                    key, _, value = line.partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0) or 0)
+                if length > self.max_body_bytes:
+                    raise HTTPError(413, f"请求体超过 {self.max_body_bytes // 1024 // 1024} MB 上限")
+                body = await reader.readexactly(length) if length else b""
+                status, payload, content_type, extra = await self.handle(method.upper(), target, body)
+            except HTTPError as e:
+                status, payload, content_type, extra = self._error(e.status, e.message, e.headers)
+            except (ValueError, asyncio.IncompleteReadError):
+                status, payload, content_type, extra = self._error(400, "无法解析的 HTTP 请求")
+            except Exception as e:
+                logger.exception("请求处理异常")
+                status, payload, content_type, extra = self._error(500, str(e))
+
+            head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", f"Content-Type: {content_type}",
+                    f"Content-Length: {len(payload)}", "Connection: close"]
+            head += [f"{key}: {value}" for key, value in extra.items()]
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI Form Analyzer 异步任务队列服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4, help="并发执行任务的 worker 数")
+    parser.add_argument("--queue-size", type=int, default=64, help="等待队列上限，超过时返回 429")
+    parser.add_argument("--upload-dir", default=None,
+                        help="load 任务允许按 path 读取的服务端目录 (不指定时只能通过请求体上传文件)")
+    parser.add_argument("--model", default="deepseek-chat")
+    parser.add_argument("--api-key", default=os.environ.get("DEEPSEEK_API_KEY"),
+                        help="默认 API 密钥 (默认读取环境变量 DEEPSEEK_API_KEY)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    from src.core.llm_cache import LLMResponseCache
+    from src.core.resource_pool import SharedResources
+    resources = SharedResources(temp_root="./temp_data/api_sessions", kb_persist_dir="./temp_data/chroma_kb")
+    factory = make_analyzer_factory(resources=resources, llm_cache=LLMResponseCache(), model=args.model)
+    server = JobQueueServer(analyzer_factory=factory, default_api_key=args.api_key,
+                            max_workers=args.workers, max_queue=args.queue_size, upload_dir=args.upload_dir)
+    asyncio.run(server.serve_forever(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
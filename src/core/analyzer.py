@@ -2,16 +2,48 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import json
+import hashlib
 import httpx
+import inspect
 import os
-import chromadb
 from openai import OpenAI
 import logging
 import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.utils.helpers import extract_json_from_response
+from src.utils.columnar_cache import (file_content_hash, get_cache_path, prune_columnar_cache, read_columnar_cache,
+                                      write_columnar_cache)
+from src.utils.chunked_ingest import chunked_read
+from src.utils.excel_reader import SheetBook, list_sheet_names, read_excel_sheet, sheet_variable_names
+from src.core.knowledge_store import open_kb_collection
+from src.core.lexical_index import AhoCorasickMatcher, BM25Index, reciprocal_rank_fusion
+from src.core.intent_classifier import FastIntentClassifier
+from src.core.llm_cache import LLMResponseCache
+from src.core.data_versions import DataVersionStore
+from src.core.lazy_engine import LAZY_TABLE_NAME, LazyTable, PendingUpdate, ingest_csv, to_pandas
+from src.core.sandbox_pool import RssSampler, SandboxPool
+from src.core.telemetry import Tracer, estimate_tokens, usage_attrs
 
 logger = logging.getLogger(__name__)
 
+def enable_copy_on_write():
+    """
+    进程级开启 pandas Copy-on-Write，只开不关 (pandas 3.0 起为默认行为)。
+
+    该选项是进程全局的：若在各次执行中进出 option_context，并行候选线程会互相覆盖设置，
+    沙箱中的零拷贝视图可能在 CoW 已被关闭时写入，直接改写全局底表。
+    """
+    if not pd.get_option("mode.copy_on_write"):
+        pd.set_option("mode.copy_on_write", True)
+
+
+# 沙箱内置变量名，工作表变量不能与之重名
+SANDBOX_RESERVED_NAMES = {"df", "raw_df", "sheets", "con", "pd", "np", "plt", "update_df", "result_df", "fig"}
+
 
 class AIDrivenFormAnalyzer:
     """
@@ -20,127 +52,544 @@ class AIDrivenFormAnalyzer:
     集成了防腐数据适配、智能路由、轻量级 RAG 和安全的 Python 沙箱执行器。
     """
 
-    def __init__(self, api_key: str, model: str = "deepseek-chat"):
+    def __init__(self, api_key: str, model: str = "deepseek-chat", llm_cache: LLMResponseCache = None,
+                 sandbox_pool: SandboxPool = None, kb_persist_dir: str = None, embedding_function=None,
+                 resources=None, session_id: str = None, temp_dir: str = None):
         """
         初始化分析器实例。
 
         Args:
             api_key (str): 大模型 API 调用凭证。
             model (str, optional): 使用的模型版本。默认 "deepseek-chat"。
+            llm_cache (LLMResponseCache, optional): 路由与代码生成共用的响应缓存，为 None 时不缓存。
+            sandbox_pool (SandboxPool, optional): 进程池沙箱，为 None 时在当前进程内执行生成代码。
+            kb_persist_dir (str, optional): 知识库向量持久化目录，为 None 时使用进程内临时库。
+            embedding_function (optional): 知识库向量化函数 (可传入已预热的共享实例)，为 None 时使用默认模型。
+            resources (SharedResources, optional): 进程级共享资源池。配置后复用其中的 HTTP 连接池与知识库集合，
+                并将临时文件写入会话私有目录 (此时忽略 kb_persist_dir / embedding_function)。
+            session_id (str, optional): 会话 id，与 resources 配合使用。
+            temp_dir (str, optional): 临时目录 (上传副本、版本落盘与惰性引擎文件)，为 None 时使用 ./temp_data；
+                配置 resources 时使用其会话私有目录。
         """
         self.api_key = api_key
         self.model = model
+        self.llm_cache = llm_cache
 
-        # 数据状态管理
-        self.raw_data = None
-        self.processed_data = None
+        # 数据状态管理：raw_data / processed_data 每次被整体替换都会递增 data_version，并在版本历史中生成快照；
+        # 快照 id (version_id) 随撤销 / 重做回到旧值，可作为各层按底表内容缓存的键
+        self.data_version = 0
+        self.versions = DataVersionStore(on_discard=self._discard_version)
+        self._raw_data = None
+        self._processed_data = None
+        self._metadata_cache = OrderedDict()  # version_id -> (profile, metadata_json)
         self.last_executed_code = ""
 
+        # 数据加载策略："standard" 整表读取；"chunked" 流式分块读取并降精度 (适用于超大文件)
+        self.ingest_mode = "standard"
+        self.ingest_chunksize = 100_000
+        self.ingest_memory_limit_mb = None
+        self.last_ingest_stats = {}
+        # 列式缓存目录：None 时写在源文件同级的 .columnar_cache (源文件位于会话临时目录)；
+        # 批处理等源文件目录可能只读 / 共享的场景应指定集中目录
+        self.columnar_cache_dir = None
+
+        # Excel 读取策略：引擎 "auto" 优先 calamine，不可用时回退 openpyxl/xlrd；
+        # 多工作表模式 "all" 加载时并行读取全部工作表；"lazy" 其余工作表在生成代码引用时才加载；"first" 只读首表
+        self.excel_engine = "auto"
+        self.excel_sheet_mode = "all"
+        self.excel_workers = None
+        self.sheets = None  # SheetBook：工作表名 -> 数据框，首个工作表即 raw_data
+
+        # 执行引擎："pandas" 底表整表载入内存；"duckdb" 惰性引擎，底表以列式文件交给 DuckDB 查询 (适用于超出内存的表)，
+        # 此时 raw_data / processed_data 只是当前版本的前 lazy_preview_rows 行预览
+        self.execution_engine = "pandas"
+        self.lazy_memory_limit_mb = None
+        self.lazy_preview_rows = 1000
+        self.lazy_result_max_rows = 1_000_000
+        self.lazy_table = None
+        self._lazy_tables = {}  # version_id -> LazyTable
+
+        # 沙箱数据注入策略："cow" 零拷贝写时复制视图 (依赖进程级 CoW，构造分析器时开启)；"deep" 每次执行前完整深拷贝 (旧行为)
+        self.sandbox_copy_mode = "cow"
+        enable_copy_on_write()
+
+        # 代码生成流式模式：检测到代码块闭合即断流并开始执行，节省首结果时间与输出 token
+        self.stream_codegen = False
+
+        # 进程池沙箱：配置后生成代码在隔离的 worker 进程中执行，为 None 时在当前进程内 exec
+        self.sandbox_pool = sandbox_pool
+        self._exec_lock = threading.Lock()  # 进程内 exec 依赖 pyplot / stdout 全局状态，并行候选时需串行化
+
+        # 语义路由快车道：本地规则分类置信度足够时跳过 LLM 路由调用
+        self.fast_router = FastIntentClassifier(threshold=0.8)
+        self.router_stats = {"fast_path": 0, "llm": 0}
+        self._preflight_pool = None
+
         # 知识库管理
         self.custom_kb_docs = []
+        self._kb_doc_ids = set()
+        self._kb_sources = set()      # 本会话挂载的知识库文件指纹，检索时仅在这些来源内匹配
+        self.kb_batch_size = 256      # 每批向量化/写入的条目数
+        self.kb_ingest_workers = 4    # 并行写入批次的线程数
         self.business_kb = {
             "TEGDP": "TEGDP的业务计算公式是：能源消耗 / 工业产值。请注意在数据框中创建一个新列来存放结果。",
         }
 
-        # 初始化 ChromaDB 向量库
-        try:
-            self.chroma_client = chromadb.Client()
+        # 词法检索索引：内置词典走 Aho-Corasick 精确匹配，自定义知识条目走 BM25 倒排索引 (与 custom_kb_docs 下标对齐)
+        self._glossary_matcher = None
+        self._glossary_terms = frozenset()  # 构建自动机时的词典键集合
+        self.kb_lexical_index = BM25Index()
+        self.kb_top_k = 3
+        self.kb_lexical_decisive_coverage = 0.8  # BM25 首条结果覆盖的查询词比例达到该值时跳过向量检索
+        self.retrieval_stats = {"lexical_only": 0, "hybrid": 0}
+
+        self.resources = resources
+        self.session_id = session_id or uuid.uuid4().hex
+        # 分阶段追踪：记录每轮各阶段耗时、token 用量、生成尝试次数与沙箱峰值内存
+        self.tracer = Tracer(session_id=self.session_id)
+        if resources is not None:
+            # 多会话共享：复用连接池 / 已预热的向量化模型 / 知识库集合，仅临时目录按会话隔离
+            self.temp_dir = resources.session_temp_dir(self.session_id)
+            self.chroma_client, self.collection = resources.chroma_client, resources.kb_collection
+            self.client = resources.create_llm_client(self.api_key)
+            resources.register_session(self.session_id, self)
+        else:
+            self.temp_dir = temp_dir or "./temp_data"
+
+            # 初始化 ChromaDB 向量库 (持久化模式下跨会话复用已计算的向量)
             try:
-                self.chroma_client.delete_collection("business_kb")
-            except:
-                pass
-            self.collection = self.chroma_client.create_collection("business_kb")
-        except Exception as e:
-            logger.error(f"ChromaDB 初始化失败: {e}")
-            self.collection = None
-
-        # self.client = OpenAI(api_key=self.api_key, base_url="[https://api.deepseek.com](https://api.deepseek.com)")
-        # ====== 工业级网络防抖与隔离 ======
-        # 强制配置直连客户端，无视系统的全局/局部代理环境变量，防止代理软件阻断
-        custom_http_client = httpx.Client(
-            trust_env=False,  # 核心！彻底禁用对系统代理环境变量的读取
-            transport=httpx.HTTPTransport(retries=3)  # 增加底层网络重试机制
-        )
+                self.chroma_client, self.collection = open_kb_collection(kb_persist_dir, embedding_function)
+            except Exception as e:
+                logger.error(f"ChromaDB 初始化失败: {e}")
+                self.collection = None
 
-        # 创建OpenAI客户端
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://api.deepseek.com/v1",
-            http_client=custom_http_client
-        )
+            # self.client = OpenAI(api_key=self.api_key, base_url="[https://api.deepseek.com](https://api.deepseek.com)")
+            # ====== 工业级网络防抖与隔离 ======
+            # 强制配置直连客户端，无视系统的全局/局部代理环境变量，防止代理软件阻断
+            custom_http_client = httpx.Client(
+                trust_env=False,  # 核心！彻底禁用对系统代理环境变量的读取
+                transport=httpx.HTTPTransport(retries=3)  # 增加底层网络重试机制
+            )
+
+            # 创建OpenAI客户端
+            self.client = OpenAI(
+                api_key=self.api_key,
+                base_url="https://api.deepseek.com/v1",
+                http_client=custom_http_client
+            )
+        self.versions.spill_dir = os.path.join(self.temp_dir, f"versions_{self.session_id}")
+
+    @property
+    def raw_data(self) -> pd.DataFrame:
+        """原始底表。"""
+        return self._raw_data
+
+    @raw_data.setter
+    def raw_data(self, df: pd.DataFrame):
+        """替换原始底表会开启一段新的版本历史 (此前的处理结果与撤销记录一并清空)。"""
+        self._raw_data = df
+        self._processed_data = None
+        self.versions.reset(df)
+        self.lazy_table = None
+        self._lazy_tables = {}
+        self.data_version += 1
+
+    @property
+    def processed_data(self) -> pd.DataFrame:
+        """经过预处理/沙箱覆写后的全局底表。"""
+        return self._processed_data
+
+    @processed_data.setter
+    def processed_data(self, df: pd.DataFrame):
+        self.set_processed_data(df)
 
+    @property
+    def version_id(self) -> str:
+        """当前底表版本的 id；同一份底表内容 (包括撤销 / 重做回到的旧版本) 始终对应同一个 id。"""
+        return self.versions.current_id
+
+    def set_processed_data(self, df: pd.DataFrame, label: str = "") -> str:
+        """
+        覆写全局底表并提交为新版本 (与上一版本相同的列结构共享，不复制)。
+
+        Args:
+            df (pd.DataFrame): 新底表；为 None 时回到原始底表版本 (其后的版本保留，可重做)。
+            label (str, optional): 版本说明 (如触发本次覆写的提问)。
+
+        Returns:
+            str: 当前版本 id。
+        """
+        if df is None:
+            if self.versions.root_id is not None:
+                self.versions.checkout(self.versions.root_id)
+        else:
+            self.versions.commit(df, label)
+        self._processed_data = df
+        self._sync_lazy_table()
+        self.data_version += 1
+        return self.version_id
+
+    def undo_data(self) -> bool:
+        """撤销到上一个底表版本 (只移动版本指针，不重新解析或复制数据)；没有可撤销的版本时返回 False。"""
+        if not self.versions.can_undo:
+            return False
+        self.versions.undo()
+        self._checkout_current_version()
+        return True
+
+    def redo_data(self) -> bool:
+        """重做被撤销的底表版本；没有可重做的版本时返回 False。"""
+        if not self.versions.can_redo:
+            return False
+        self.versions.redo()
+        self._checkout_current_version()
+        return True
+
+    def _checkout_current_version(self):
+        # 回到原始版本时 processed_data 置空，沿用 raw_data 的零拷贝视图注入沙箱
+        at_raw = self.versions.at_root and self._raw_data is not None
+        self._processed_data = None if at_raw else self.versions.current
+        self._sync_lazy_table()
+        self.data_version += 1
+
+    def _sync_lazy_table(self):
+        """惰性引擎下让当前惰性表跟随版本指针 (撤销 / 重做只切换列式文件，不重新读取数据)。"""
+        if self._lazy_tables:
+            self.lazy_table = self._lazy_tables.get(self.version_id, self.lazy_table)
+
+    def _discard_version(self, version_id: str):
+        """版本被丢弃时删除惰性引擎为其派生的 Parquet 文件 (源文件的列式缓存不在会话目录内，保留)。"""
+        table = self._lazy_tables.pop(version_id, None)
+        if table is None or os.path.dirname(os.path.abspath(table.path)) != os.path.abspath(self._lazy_dir()):
+            return
+        try:
+            os.remove(table.path)
+        except OSError as e:
+            logger.warning(f"惰性版本文件删除失败: {e}")
+
+    def _commit_lazy_table(self, table: LazyTable, label: str = "") -> pd.DataFrame:
+        """将惰性引擎产出的新底表提交为新版本 (版本历史中只保存其预览)，返回预览数据框。"""
+        preview = table.head(self.lazy_preview_rows)
+        version_id = self.set_processed_data(preview, label)
+        self._lazy_tables[version_id] = table
+        self.lazy_table = table
+        return preview
 
     def load_data(self, uploaded_file) -> str:
         """
         数据防腐层加载机制：加载上传文件并落盘持久化。
 
         Args:
-            uploaded_file: Streamlit 文件上传对象。
+            uploaded_file: Streamlit 文件上传对象，或本地文件路径 (批处理模式，直接就地解析，不再复制)。
 
         Returns:
             str: 物理落盘的文件绝对路径。
 
         Raises:
             ValueError: 文件格式不支持时抛出。
+            MemoryError: 分块模式下超过内存上限时抛出。
         """
-        temp_dir = "./temp_data"
-        os.makedirs(temp_dir, exist_ok=True)
+        if isinstance(uploaded_file, (str, os.PathLike)):
+            file_path = os.fspath(uploaded_file)
+            file_ext = file_path.split('.')[-1].lower()
+        else:
+            os.makedirs(self.temp_dir, exist_ok=True)
 
-        file_ext = uploaded_file.name.split('.')[-1].lower()
-        file_path = os.path.join(temp_dir, f"current_source.{file_ext}")
+            file_ext = uploaded_file.name.split('.')[-1].lower()
+            file_path = os.path.join(self.temp_dir, f"current_source.{file_ext}")
 
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+            with open(file_path, "wb") as f:
+                f.write(uploaded_file.getbuffer())
 
-        if file_ext in ['xlsx', 'xls']:
-            self.raw_data = pd.read_excel(file_path)
-        elif file_ext == 'csv':
-            self.raw_data = pd.read_csv(file_path, encoding='utf-8')
-        else:
+        if file_ext not in ['xlsx', 'xls', 'csv']:
             raise ValueError("不支持的文件格式，请使用 Excel 或 CSV 文件")
 
-        # 基础列名清理
-        self.raw_data.columns = [str(col).strip().replace('\n', '') for col in self.raw_data.columns]
+        content_hash = file_content_hash(file_path)
+        if self.execution_engine == "duckdb":
+            self._load_lazy(file_path, content_hash)
+            return file_path
+
+        self.raw_data = self._parse_source_file(file_path)
+
+        # 解析一次后写入列式缓存，后续 restore_data 直接内存映射读取
+        write_columnar_cache(self.raw_data, file_path, content_hash, self._cache_variant(), self.columnar_cache_dir)
+        self._attach_sheets(file_path, content_hash)
         return file_path
 
     def restore_data(self, file_path: str) -> bool:
-        """从本地路径静默恢复内存数据（防止 UI 刷新导致数据丢失）。"""
+        """从本地路径静默恢复内存数据（防止 UI 刷新导致数据丢失）。
+
+        优先命中按内容哈希索引的列式缓存，未命中时才重新解析原始文件并回填缓存。
+        """
         try:
-            file_ext = file_path.split('.')[-1].lower()
-            if file_ext in ['xlsx', 'xls']:
-                self.raw_data = pd.read_excel(file_path)
-            elif file_ext == 'csv':
-                self.raw_data = pd.read_csv(file_path, encoding='utf-8')
-            self.raw_data.columns = [str(col).strip().replace('\n', '') for col in self.raw_data.columns]
+            content_hash = file_content_hash(file_path)
+            if self.execution_engine == "duckdb":
+                self._load_lazy(file_path, content_hash)
+                return True
+            cached_df = read_columnar_cache(file_path, content_hash, self._cache_variant(), self.columnar_cache_dir)
+            if cached_df is not None:
+                self.raw_data = cached_df
+            else:
+                self.raw_data = self._parse_source_file(file_path)
+                write_columnar_cache(self.raw_data, file_path, content_hash, self._cache_variant(),
+                                     self.columnar_cache_dir)
+            self._attach_sheets(file_path, content_hash)
             return True
         except Exception as e:
             logger.error(f"本地数据恢复失败: {e}")
             return False
 
+    def _cache_variant(self) -> str:
+        """底表在列式缓存中的分区：分块加载会压缩列类型 (float32 / category 等)，不能与标准解析结果共用缓存。"""
+        return "chunked" if self.ingest_mode == "chunked" else None
+
+    def _parse_source_file(self, file_path: str) -> pd.DataFrame:
+        """按当前加载策略解析 Excel/CSV 源文件，并执行基础列名清理。"""
+        if self.ingest_mode == "chunked":
+            df, self.last_ingest_stats = chunked_read(
+                file_path, chunksize=self.ingest_chunksize, memory_limit_mb=self.ingest_memory_limit_mb)
+            return df
+
+        file_ext = file_path.split('.')[-1].lower()
+        if file_ext in ['xlsx', 'xls']:
+            return read_excel_sheet(file_path, 0, self.excel_engine)
+        elif file_ext == 'csv':
+            df = pd.read_csv(file_path, encoding='utf-8')
+        else:
+            raise ValueError("不支持的文件格式，请使用 Excel 或 CSV 文件")
+
+        # 基础列名清理
+        df.columns = [str(col).strip().replace('\n', '') for col in df.columns]
+        return df
+
+    def _load_lazy(self, file_path: str, content_hash: str):
+        """
+        惰性引擎加载：底表只落成列式文件，内存中仅保留前若干行预览。
+
+        优先复用 pandas 引擎写入的列式缓存；CSV 由 DuckDB 流式转换 (不经过 pandas)，
+        Excel 无法流式解析，整表读取一次后写入列式缓存。多工作表 Excel 只使用首个工作表。
+        """
+        cache_path = get_cache_path(file_path, content_hash, self._cache_variant(), self.columnar_cache_dir)
+        if not os.path.exists(cache_path):
+            if file_path.split('.')[-1].lower() == 'csv':
+                cache_path = get_cache_path(file_path, content_hash, "duckdb", self.columnar_cache_dir)
+                if not os.path.exists(cache_path):
+                    ingest_csv(file_path, cache_path, self.lazy_memory_limit_mb, self._lazy_spill_dir())
+                    prune_columnar_cache(file_path, content_hash, self.columnar_cache_dir)
+            elif write_columnar_cache(self._parse_source_file(file_path), file_path, content_hash,
+                                      self._cache_variant(), self.columnar_cache_dir) is None:
+                raise ValueError("底表无法写入列式缓存，不能使用惰性执行引擎")
+
+        table = LazyTable(cache_path, self.lazy_memory_limit_mb, self._lazy_spill_dir())
+        self.raw_data = table.head(self.lazy_preview_rows)
+        self.sheets = None
+        self.lazy_table = table
+        self._lazy_tables = {self.version_id: table}
+
+    def _lazy_dir(self) -> str:
+        """惰性引擎的会话私有目录 (派生版本的 Parquet 文件与 DuckDB 溢写文件)。"""
+        return os.path.join(self.temp_dir, f"lazy_{self.session_id}")
+
+    def _lazy_spill_dir(self) -> str:
+        return os.path.join(self._lazy_dir(), "spill")
+
+    def _attach_sheets(self, file_path: str, content_hash: str = None):
+        """多工作表 Excel：首个工作表作为 raw_data，其余工作表按 excel_sheet_mode 懒加载或并行预加载。"""
+        self.sheets = None
+        if self.excel_sheet_mode == "first" or file_path.split('.')[-1].lower() not in ['xlsx', 'xls']:
+            return
+        sheet_names = list_sheet_names(file_path, self.excel_engine)
+        if len(sheet_names) <= 1:
+            return
+        self.sheets = SheetBook(file_path, sheet_names, self.excel_engine, content_hash,
+                                loaded={sheet_names[0]: self.raw_data}, max_workers=self.excel_workers,
+                                cache_dir=self.columnar_cache_dir)
+        if self.excel_sheet_mode == "all":
+            self.sheets.load()
+        self._metadata_cache.clear()
+
+    def _sheet_catalog(self) -> dict:
+        """沙箱变量名 -> 工作表信息 (未加载的工作表只读取表头)。"""
+        catalog = {}
+        for var, sheet in sheet_variable_names(self.sheets.sheet_names, SANDBOX_RESERVED_NAMES).items():
+            entry = {"sheet": sheet, "columns": self.sheets.columns(sheet)}
+            if sheet in self.sheets.loaded_names:
+                entry["shape"] = self.sheets[sheet].shape
+            catalog[var] = entry
+        return catalog
+
+    def _sheet_frames(self, code_str: str) -> dict:
+        """
+        按生成代码实际引用的工作表构造注入沙箱的变量 (工作表变量 + `sheets` 字典)。
+
+        懒加载模式下只有被引用的工作表才会被解析；代码直接使用 `sheets` 字典时注入全部工作表。
+        """
+        if self.sheets is None:
+            return {}
+        import ast
+        tree = ast.parse(code_str)
+        identifiers = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+        literals = {node.value for node in ast.walk(tree) if isinstance(node, ast.Constant) and isinstance(node.value, str)}
+
+        use_all = "sheets" in identifiers
+        frames, by_sheet = {}, {}
+        for var, sheet in sheet_variable_names(self.sheets.sheet_names, SANDBOX_RESERVED_NAMES).items():
+            if use_all or var in identifiers or sheet in literals:
+                by_sheet[sheet] = self.sheets[sheet]
+                frames[var] = by_sheet[sheet]
+        frames["sheets"] = by_sheet
+        return frames
+
     def get_data_metadata(self, df: pd.DataFrame = None) -> str:
         """
         生成脱敏的数据元信息 (Metadata)。
         绝对禁止将全量数据传递给大模型，仅提取表结构与抽样。
+
+        未显式传入 df 时，结果按底表版本 id 缓存，同一版本 (包括撤销后回到的旧版本) 的重复查询不再重新统计。
         """
-        target_df = df if df is not None else (
-            self.processed_data if self.processed_data is not None else self.raw_data)
+        if df is not None:
+            return self._render_metadata(df, self._build_metadata_profile(df))
 
-        if target_df is None:
+        cached = self._metadata_cache.get(self.version_id)
+        if cached is not None:
+            self._metadata_cache.move_to_end(self.version_id)
+            return cached[1]
+
+        target_df = self.processed_data if self.processed_data is not None else self.raw_data
+        if self.lazy_table is not None:
+            profile = self.lazy_table.profile()
+        else:
+            profile = self._build_metadata_profile(target_df)
+        if profile is not None and self.sheets is not None:
+            profile["sheets"] = self._sheet_catalog()
+        metadata = self._render_metadata(target_df, profile)
+        self._remember_metadata(profile, metadata)
+        return metadata
+
+    def _remember_metadata(self, profile: dict, metadata: str, max_entries: int = 16):
+        if self.version_id is None:
+            return
+        self._metadata_cache[self.version_id] = (profile, metadata)
+        self._metadata_cache.move_to_end(self.version_id)
+        while len(self._metadata_cache) > max_entries:
+            self._metadata_cache.popitem(last=False)
+
+    @staticmethod
+    def _build_metadata_profile(df: pd.DataFrame) -> dict:
+        """统计底表的结构画像；数据为空时返回 None。"""
+        if df is None or df.empty:
+            return None
+        return {
+            "columns": list(df.columns),
+            "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
+            "shape": df.shape,
+            "missing_values": df.isnull().sum().to_dict(),
+            "sample_data": df.head(3).to_markdown(index=False)
+        }
+
+    @staticmethod
+    def _render_metadata(df: pd.DataFrame, profile: dict) -> str:
+        if df is None:
             return "暂无数据"
-        if target_df.empty:
+        if profile is None:
             return "⚠️ 注意：当前数据框为空 (0行)！请检查之前的清洗/过滤操作是否过于严格导致数据全部丢失。"
+        return json.dumps(profile, ensure_ascii=False, indent=2)
+
+    def _replace_after_row_removal(self, kept_df: pd.DataFrame, removed_df: pd.DataFrame):
+        """
+        以删行结果替换全局底表，并增量维护元信息缓存。
+
+        仅删除行时列与类型不变，缺失值统计只需减去被删行的贡献，无需全表重算。
+        """
+        cached = self._metadata_cache.get(self.version_id)
+        self.set_processed_data(kept_df, "静默预处理：去除全空 / 重复行")
+
+        if cached is None or cached[0] is None or kept_df.empty:
+            return
+
+        profile = dict(cached[0])
+        profile["shape"] = kept_df.shape
+        removed_missing = removed_df.isnull().sum()
+        profile["missing_values"] = {col: int(count - removed_missing.get(col, 0))
+                                     for col, count in profile["missing_values"].items()}
+        # 抽样仅取前 3 行，重算成本与表规模无关
+        profile["sample_data"] = kept_df.head(3).to_markdown(index=False)
+        self._remember_metadata(profile, self._render_metadata(kept_df, profile))
+
+    def prepare_turn(self, query: str, router_query: str = None) -> dict:
+        """
+        单轮对话的并发预执行流水线：路由、元信息画像与 RAG 检索同时进行。
 
-        metadata = {
-            "columns": list(target_df.columns),
-            "dtypes": {col: str(dtype) for col, dtype in target_df.dtypes.items()},
-            "shape": target_df.shape,
-            "missing_values": target_df.isnull().sum().to_dict(),
-            "sample_data": target_df.head(3).to_markdown(index=False)
+        本地快车道能直接判定意图时，按需检索；否则在 LLM 路由请求飞行期间投机式地启动 RAG 检索，
+        路由结果返回 need_rag=false 时丢弃该检索结果。
+
+        Args:
+            query (str): 用户最新的原始需求 (用于 RAG 检索)。
+            router_query (str, optional): 拼接了历史上下文的路由输入，默认与 query 相同。
+
+        Returns:
+            dict: 包含 route / metadata / rag_context / seconds 的预执行结果。
+        """
+        start = time.perf_counter()
+        router_query = router_query or query
+        pool = self._get_preflight_pool()
+
+        metadata_future = pool.submit(self._traced, "metadata", self.get_data_metadata)
+        with self.tracer.span("router_fast") as span:
+            route = self._fast_route(router_query)
+            span["hit"] = route is not None
+        if route is not None:
+            rag_future = pool.submit(self._traced, "rag", self.retrieve_knowledge, query) if route.get("need_rag") else None
+        else:
+            rag_future = pool.submit(self._traced, "rag", self.retrieve_knowledge, query)
+            route = self.semantic_router(router_query, fast_checked=True)
+
+        rag_context = ""
+        if rag_future is not None:
+            if route.get("need_rag", False):
+                rag_context = rag_future.result()
+            else:
+                rag_future.cancel()
+
+        return {
+            "route": route,
+            "metadata": metadata_future.result(),
+            "rag_context": rag_context,
+            "seconds": round(time.perf_counter() - start, 3),
         }
-        return json.dumps(metadata, ensure_ascii=False, indent=2)
 
-    def semantic_router(self, query: str) -> dict:
-        """多维智能语义路由网关，决定 Agent 的工作模式与预处理策略。"""
+    def _traced(self, stage: str, fn, *args):
+        """在追踪 span 内执行 fn (供线程池提交使用)。"""
+        with self.tracer.span(stage):
+            return fn(*args)
+
+    def _get_preflight_pool(self) -> ThreadPoolExecutor:
+        if self._preflight_pool is None:
+            self._preflight_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="preflight")
+        return self._preflight_pool
+
+    def _fast_route(self, query: str) -> dict:
+        """本地快车道分类；置信度不足时返回 None。"""
+        if self.fast_router is None:
+            return None
+        route, confidence = self.fast_router.classify(query)
+        if confidence < self.fast_router.threshold:
+            return None
+        self.router_stats["fast_path"] += 1
+        return route
+
+    def semantic_router(self, query: str, fast_checked: bool = False) -> dict:
+        """多维智能语义路由网关，决定 Agent 的工作模式与预处理策略。
+
+        先走本地快车道分类器，置信度达到阈值直接返回；否则回退到 LLM 精判。
+        调用方已经走过快车道且未命中时传入 fast_checked=True，不再重复分类。
+        """
+        if not fast_checked:
+            route = self._fast_route(query)
+            if route is not None:
+                return route
+
+        self.router_stats["llm"] += 1
         prompt = f"""
         你是一个企业级数据分析系统的智能路由网关。请分析用户的输入意图: "{query}"
 
@@ -172,24 +621,147 @@ class AIDrivenFormAnalyzer:
         """
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
+            ai_response = self._chat_completion(
                 messages=[
                     {"role": "system", "content": "你是一个智能语义路由器，严格输出JSON，不回答任何多余的话。"},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.0,
                 max_tokens=200,
-                stream=False
+                stage="router_llm"
             )
-            result = extract_json_from_response(response.choices[0].message.content.strip())
+            result = extract_json_from_response(ai_response.strip())
             return result if result else {"task_type": "CHAT", "need_rag": False, "preprocess_mode": "NONE"}
         except Exception as e:
             logger.error(f"路由异常: {e}")
             return {"task_type": "CHAT", "need_rag": False, "preprocess_mode": "NONE"}
 
-    def load_custom_knowledge(self, uploaded_file) -> tuple[bool, str]:
-        """加载自定义知识库并向 ChromaDB 注入向量化条目。"""
+    def _chat_completion(self, messages: list, temperature: float, max_tokens: int,
+                         stop_at_code_block: bool = False, stage: str = "llm",
+                         cancel: threading.Event = None) -> str:
+        """
+        调用大模型并返回文本；配置了响应缓存时，相同请求直接命中本地缓存。
+
+        Args:
+            stop_at_code_block (bool, optional): 为 True 时以流式方式接收，检测到第一个代码块闭合后立即断流。
+            stage (str, optional): 追踪中记录的阶段名 (如 router_llm / codegen_llm)。
+            cancel (threading.Event, optional): 置位后流式接收立即断开；被取消的不完整回复不写入缓存。
+        """
+        with self.tracer.span(stage, temperature=temperature) as span:
+            cache_key = None
+            if self.llm_cache is not None:
+                cache_key = self.llm_cache.make_key(self.model, temperature, messages, max_tokens=max_tokens)
+                cached = self.llm_cache.get(cache_key)
+                if cached is not None:
+                    span["cache_hit"] = True
+                    return cached
+
+            if stop_at_code_block:
+                span["streamed"] = True
+                content = self._stream_until_code_block(messages, temperature, max_tokens, span, cancel)
+            else:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=False
+                )
+                content = response.choices[0].message.content
+                span.update(usage_attrs(response))
+            if cancel is not None and cancel.is_set():
+                span["cancelled"] = True
+            elif cache_key is not None:
+                self.llm_cache.set(cache_key, content)
+            return content
+
+    def _stream_usage_kwargs(self) -> dict:
+        """
+        请求接口在流末尾返回 usage 分块。
+
+        openai SDK 1.26 起 create() 才有 stream_options 参数，旧版传入会直接 TypeError，此时通过 extra_body 透传。
+        """
+        options = {"include_usage": True}
+        try:
+            params = inspect.signature(self.client.chat.completions.create).parameters.values()
+        except (TypeError, ValueError):
+            params = []
+        if any(p.name == "stream_options" or p.kind == inspect.Parameter.VAR_KEYWORD for p in params):
+            return {"stream_options": options}
+        return {"extra_body": {"stream_options": options}}
+
+    def _stream_until_code_block(self, messages: list, temperature: float, max_tokens: int,
+                                 span: dict = None, cancel: threading.Event = None) -> str:
+        """
+        流式接收代码生成结果，一旦 ``` 代码块闭合就关闭连接，跳过模型随后的解释性文字。
+
+        cancel 置位 (如其它并行候选已胜出) 时同样立即断流，不再为剩余 token 付费。
+        接口只在流末尾返回 usage，提前断流时 span 中的 token 用量按提示词与已收到的文本估算 (tokens_estimated)。
+        """
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **self._stream_usage_kwargs()
+        )
+        content = ""
+        body_start = -1
+        try:
+            for chunk in stream:
+                if cancel is not None and cancel.is_set():
+                    break
+                if span is not None:
+                    span.update(usage_attrs(chunk))
+                if not chunk.choices:
+                    continue
+                scan_from = max(len(content) - 2, 0)
+                content += chunk.choices[0].delta.content or ""
+
+                if body_start < 0:
+                    fence = content.find("```")
+                    if fence < 0:
+                        continue
+                    # 开启围栏所在行 (```python) 结束后才算进入代码正文
+                    line_end = content.find("\n", fence)
+                    if line_end < 0:
+                        continue
+                    body_start = line_end + 1
+                    scan_from = body_start
+
+                close_at = content.find("```", max(scan_from, body_start))
+                if close_at >= 0:
+                    content = content[:close_at + 3]
+                    break
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+        if span is not None and not span.get("completion_tokens"):
+            span.update(prompt_tokens=estimate_tokens("\n".join(m["content"] for m in messages)),
+                        completion_tokens=estimate_tokens(content), tokens_estimated=True)
+        return content
+
+    def _invalidate_completion(self, messages: list, temperature: float, max_tokens: int):
+        """将某次请求对应的缓存条目作废。"""
+        if self.llm_cache is not None:
+            self.llm_cache.invalidate(self.llm_cache.make_key(self.model, temperature, messages, max_tokens=max_tokens))
+
+    def load_custom_knowledge(self, uploaded_file, progress_callback=None) -> tuple[bool, str]:
+        """
+        加载自定义知识库并向 ChromaDB 注入向量化条目。
+
+        表格型知识库按列向量化拼接条目文本；条目以 (文件指纹, 内容哈希) 为 id 分批并行写入。
+        向量库中已存在的条目直接复用，重复上传未变化的文件不会重新计算向量。
+
+        Args:
+            uploaded_file: Streamlit 文件上传对象。
+            progress_callback (callable, optional): 进度回调 `callback(已写入条数, 待写入总条数)`。
+
+        Returns:
+            tuple[bool, str]: (是否成功, 提示信息)。
+        """
         try:
             ext = uploaded_file.name.split('.')[-1].lower()
             sentences = []
@@ -199,34 +771,109 @@ class AIDrivenFormAnalyzer:
                 sentences = [s.strip() for s in re.split(r'([。！？!?])', content) if len(s.strip()) > 5]
             elif ext in ['csv', 'xlsx', 'xls']:
                 df = pd.read_csv(uploaded_file) if ext == 'csv' else pd.read_excel(uploaded_file)
-                sentences = [", ".join([f"{col}: {row[col]}" for col in df.columns]) for _, row in df.iterrows()]
+                sentences = self._build_table_sentences(df)
 
             if not sentences:
                 return False, "❌ 提取到的知识条目为空"
 
-            self.custom_kb_docs.extend(sentences)
+            start = time.perf_counter()
+            docs = {self._kb_doc_id(doc): doc for doc in sentences}
+            new_docs = {doc_id: doc for doc_id, doc in docs.items() if doc_id not in self._kb_doc_ids}
+            self.custom_kb_docs.extend(new_docs.values())
+            self.kb_lexical_index.add(new_docs.values())
+            self._kb_doc_ids.update(new_docs)
+
+            embedded = 0
             if self.collection:
-                self.collection.add(documents=sentences, ids=[f"doc_{i}" for i in range(len(sentences))])
-            return True, f"✅ 成功加载知识库，已注入 {len(sentences)} 条企业规则。"
+                source = hashlib.sha1(uploaded_file.getvalue()).hexdigest()[:16]
+                existing = set(self.collection.get(where={"source": source}, include=[])["ids"])
+                pending = {f"{source}_{doc_id}": doc for doc_id, doc in docs.items()
+                           if f"{source}_{doc_id}" not in existing}
+                self._upsert_in_batches(list(pending.keys()), list(pending.values()), source, progress_callback)
+                self._kb_sources.add(source)
+                embedded = len(pending)
+            elapsed = time.perf_counter() - start
+            throughput = len(docs) / elapsed if elapsed > 0 else float(len(docs))
+            return True, (f"✅ 成功加载知识库，已注入 {len(docs)} 条企业规则 "
+                          f"(新向量化 {embedded} 条，复用 {len(docs) - embedded} 条，{throughput:.0f} 条/秒)。")
         except Exception as e:
             return False, f"❌ 知识库加载失败: {str(e)}"
 
+    @staticmethod
+    def _build_table_sentences(df: pd.DataFrame) -> list[str]:
+        """按列向量化拼接 `列名: 值, 列名: 值` 形式的条目文本 (替代逐行 iterrows)。"""
+        if df.empty or len(df.columns) == 0:
+            return []
+        parts = [f"{col}: " + df[col].astype(str) for col in df.columns]
+        return parts[0].str.cat(parts[1:], sep=", ").tolist()
+
+    @staticmethod
+    def _kb_doc_id(doc: str) -> str:
+        """知识条目的稳定内容哈希，相同内容在任意会话/任意次上传中一致。"""
+        return "kb_" + hashlib.sha1(doc.encode("utf-8")).hexdigest()
+
+    def _upsert_in_batches(self, ids: list, documents: list, source: str, progress_callback=None):
+        """分批并行写入向量库 (附带来源文件指纹元数据)；每批完成后回调进度。"""
+        batches = [(ids[i:i + self.kb_batch_size], documents[i:i + self.kb_batch_size])
+                   for i in range(0, len(ids), self.kb_batch_size)]
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(1, self.kb_ingest_workers), thread_name_prefix="kb-ingest") as pool:
+            futures = {pool.submit(self.collection.upsert, ids=batch_ids, documents=batch_docs,
+                                   metadatas=[{"source": source}] * len(batch_ids)): len(batch_ids)
+                       for batch_ids, batch_docs in batches}
+            for future in as_completed(futures):
+                future.result()
+                done += futures[future]
+                if progress_callback:
+                    progress_callback(done, len(ids))
+
     def retrieve_knowledge(self, query: str) -> str:
-        """执行 RAG 检索：结合内置绝对词典与 ChromaDB 向量匹配。"""
+        """
+        执行 RAG 检索：内置词典精确匹配 + 自定义知识库的词法 / 向量混合检索。
+
+        BM25 首条结果已覆盖绝大部分查询词时视为词法命中决定性，直接跳过向量检索；
+        否则将 BM25 与 ChromaDB 的排序结果做倒数排名融合 (RRF)。
+        """
         context = ""
-        for keyword, definition in self.business_kb.items():
-            if keyword.lower() in query.lower():
-                context += f"【系统内置知识】: {definition}\n"
+        for keyword in self._get_glossary_matcher().find_all(query):
+            context += f"【系统内置知识】: {self.business_kb[keyword]}\n"
 
-        if self.collection and self.collection.count() > 0:
-            try:
-                results = self.collection.query(query_texts=[query], n_results=min(3, self.collection.count()))
-                if results and results['documents'] and results['documents'][0]:
-                    context += "【知识库检索结果】:\n" + "\n".join(results['documents'][0]) + "\n"
-            except Exception as e:
-                logger.error(f"ChromaDB 检索异常: {e}")
+        if not self._kb_sources and not self.custom_kb_docs:
+            return context.strip()
+
+        lexical_hits = self.kb_lexical_index.search(query, top_k=self.kb_top_k)
+        lexical_docs = [self.custom_kb_docs[doc_idx] for doc_idx, _, _ in lexical_hits]
+        if lexical_hits and lexical_hits[0][2] >= self.kb_lexical_decisive_coverage:
+            self.retrieval_stats["lexical_only"] += 1
+            documents = lexical_docs
+        else:
+            self.retrieval_stats["hybrid"] += 1
+            documents = reciprocal_rank_fusion([lexical_docs, self._vector_search(query)], top_k=self.kb_top_k)
+
+        if documents:
+            context += "【知识库检索结果】:\n" + "\n".join(documents) + "\n"
         return context.strip()
 
+    def _get_glossary_matcher(self) -> AhoCorasickMatcher:
+        """按需 (重新) 构建内置词典的 Aho-Corasick 自动机；词典的键集合变化 (增删或替换术语) 时自动重建。"""
+        if self._glossary_matcher is None or self.business_kb.keys() != self._glossary_terms:
+            self._glossary_terms = frozenset(self.business_kb)
+            self._glossary_matcher = AhoCorasickMatcher(self._glossary_terms)
+        return self._glossary_matcher
+
+    def _vector_search(self, query: str) -> list[str]:
+        """ChromaDB 向量检索；持久化向量库由所有会话共享，检索范围限定为本会话挂载的知识库文件。"""
+        if not self.collection or not self._kb_sources:
+            return []
+        try:
+            results = self.collection.query(query_texts=[query], n_results=min(self.kb_top_k, len(self.custom_kb_docs)),
+                                            where={"source": {"$in": sorted(self._kb_sources)}})
+            if results and results['documents'] and results['documents'][0]:
+                return results['documents'][0]
+        except Exception as e:
+            logger.error(f"ChromaDB 检索异常: {e}")
+        return []
+
     def is_safe_code(self, code_str: str) -> tuple[bool, str]:
         """利用 AST 进行静态安全扫描，防止恶意代码注入。"""
         import ast
@@ -243,28 +890,55 @@ class AIDrivenFormAnalyzer:
 
     def execute_agentic_code(self, query: str, metadata: str, rag_context: str = "",
                              task_type: str = "DATA_OP", preprocess_mode: str = "NONE",
-                             max_retries: int = 3, chat_context: str = "") -> tuple[bool, dict, str]:
+                             max_retries: int = 3, chat_context: str = "",
+                             num_candidates: int = 1) -> tuple[bool, dict, str]:
         """
         沙箱代码执行器核心链路。
         包含：自动预处理 -> LLM 代码生成 -> AST 扫描 -> 沙箱隔离执行 -> 自我反思重试。
+
+        num_candidates > 1 时先以不同温度并发生成多份候选代码并执行，取最先通过非空输出校验的一份；
+        全部失败后才进入串行的 Traceback 反思重试，首轮提示词携带最接近成功的候选代码及其报错。
+        注意：未配置进程池时沙箱执行受 `_exec_lock` 串行化，候选之间只有 LLM 请求是并发的。
         """
         if self.raw_data is None:
             return False, "核心数据丢失！请在左侧重新上传或刷新数据文件。", ""
 
-        df_current = self.processed_data if self.processed_data is not None else self.raw_data.copy()
+        df_current = self.processed_data if self.processed_data is not None else self._sandbox_view(self.raw_data)
 
         # 静默预处理逻辑
-        if preprocess_mode == "DEFAULT" and not df_current.empty:
+        # 惰性引擎下内存中只有预览，整表去重交给模型在 SQL 中完成
+        if preprocess_mode == "DEFAULT" and not df_current.empty and self.lazy_table is None:
+            preprocess_start = time.perf_counter()
             original_len = len(df_current)
-            df_current.dropna(how='all', inplace=True)
-            df_current.drop_duplicates(inplace=True)
-            self.processed_data = df_current
+            # 等价于 dropna(how='all') + drop_duplicates()：全空行之间的重复会一并被剔除
+            keep_mask = df_current.notna().any(axis=1) & ~df_current.duplicated()
+            if not keep_mask.all():
+                removed_df = df_current[~keep_mask]
+                df_current = df_current[keep_mask]
+                self._replace_after_row_removal(df_current, removed_df)
+            elif self.processed_data is None:
+                self._replace_after_row_removal(df_current, df_current.iloc[0:0])
             if len(df_current) < original_len:
                 chat_context += f"\n[系统内部提示：已静默去除了 {original_len - len(df_current)} 行全空/重复脏数据。]"
+            self.tracer.record("preprocess", time.perf_counter() - preprocess_start,
+                               removed_rows=original_len - len(df_current))
 
+        prompt_start = time.perf_counter()
         history_context = ""
         if self.last_executed_code:
             history_context = f"【上一步成功执行的代码参考】\n```python\n{self.last_executed_code}\n```\n如果需求是微调，请直接修改上述代码。"
+        sheet_rule = ""
+        if self.sheets is not None:
+            sheet_rule = ("6. **多工作表**：`df` 为首个工作表。元信息 `sheets` 中列出了工作簿的全部工作表，"
+                          "每个工作表都以其键名作为变量注入 (如 `sheet_2`)，也可以通过 `sheets[\"工作表名\"]` 访问。")
+        engine_rule = ""
+        if self.lazy_table is not None:
+            engine_rule = (f"7. **惰性引擎 (DuckDB)**：底表共 {len(self.lazy_table)} 行，不能整体载入内存。"
+                           f"`df` 不是 pandas 数据框，而是 DuckDB 表 `{LAZY_TABLE_NAME}` 的关系对象，连接为 `con`。"
+                           f"请用 `con.sql(\"SELECT ... FROM {LAZY_TABLE_NAME} WHERE ...\")` 或关系 API "
+                           "(`df.filter(...)`、`df.aggregate(...)`) 完成筛选与聚合，只选择需要的列；"
+                           "`result_df` / `update_df` 可直接赋值为 DuckDB 关系，由系统负责物化。"
+                           "绘图前先聚合再调用 `.df()` 转为 pandas，禁止对整表调用 `.df()`。")
 
         sys_prompt = f"""
                 你是一个精通 Pandas 和 Matplotlib 的高级数据工程师。
@@ -284,95 +958,285 @@ class AIDrivenFormAnalyzer:
                    - **如果你只是做局部统计/绘图**：请执行 `result_df = 统计结果表`，不要动 `update_df`。
                 4. **绘图规范**：如果涉及绘图，必须将对象赋给 `fig`。
                 5. **代码纯净度**：只输出包裹在 ```python 和 ``` 之间代码块，不要包含任何类似“我无法执行”的解释性文字。
+                {sheet_rule}
+                {engine_rule}
                 """
 
         current_prompt = sys_prompt
         last_failed_code = ""
+        self.tracer.record("prompt_build", time.perf_counter() - prompt_start, prompt_chars=len(sys_prompt))
 
-        import io
-        from contextlib import redirect_stdout
+        if num_candidates > 1:
+            winner, best_failure = self._race_candidates(sys_prompt, df_current, num_candidates)
+            if winner is not None:
+                return self._commit_outputs(*winner, label=query)
+            if best_failure is not None:
+                last_failed_code, feedback = best_failure
+                current_prompt += f"\n\n[并行候选均失败] 最接近成功的候选代码:\n```python\n{last_failed_code}\n```\n{feedback}\n请修复。"
 
         for attempt in range(max_retries):
+            messages = [{"role": "user", "content": current_prompt}]
+            self.tracer.count_attempt("retry" if attempt else "serial")
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": current_prompt}],
-                    temperature=0.1, max_tokens=5000, stream=False
-                )
-                ai_response = response.choices[0].message.content.strip()
+                ai_response = self._chat_completion(messages, temperature=0.1, max_tokens=5000,
+                                                    stop_at_code_block=self.stream_codegen,
+                                                    stage="codegen_llm").strip()
 
-                code_match = re.search(r'```python(.*?)```', ai_response, re.DOTALL) or re.search(r'```(.*?)```',
-                                                                                                  ai_response,
-                                                                                                  re.DOTALL)
-                code_str = code_match.group(1).strip() if code_match else ai_response
-                code_str = code_str.replace("plt.show()", "")
+                code_str = self._extract_code(ai_response)
                 last_failed_code = code_str
 
                 is_safe, msg = self.is_safe_code(code_str)
                 if not is_safe:
+                    self._invalidate_completion(messages, temperature=0.1, max_tokens=5000)
                     current_prompt += f"\n\n[第{attempt + 1}次重试] 安全扫描未通过：{msg}"
                     continue
 
-                plt.close('all')
-
-                # 注入沙箱环境，明确声明 update_df 和 result_df 为 None
-                # 将 update_df 初始设为 None 依然保留，但要通过 prompt 告诉 AI 不要检查它
-                local_vars = {
-                    'df': df_current.copy(),
-                    'raw_df': self.raw_data.copy(),
-                    'pd': pd, 'np': np, 'plt': plt,
-                    'update_df': None,
-                    'result_df': None,
-                    'fig': None
-                }
-
-                # 捕获 print 行为
-                f = io.StringIO()
-                with redirect_stdout(f):
-                    exec(code_str, {}, local_vars)
-                printed_text = f.getvalue().strip()
-
-                # 从沙箱中提取结果
-                output_data = local_vars.get('result_df')
-                update_data = local_vars.get('update_df')
-                output_fig = local_vars.get('fig')
-
-                if output_fig is None:
-                    fig_candidate = plt.gcf()
-                    if fig_candidate.get_axes():
-                        output_fig = fig_candidate
-
-                if output_data is None and update_data is None and output_fig is None and not printed_text:
+                outputs = self._run_sandbox(code_str, df_current)
+                if not self._has_output(outputs):
+                    self._invalidate_completion(messages, temperature=0.1, max_tokens=5000)
                     current_prompt += f"\n\n[第{attempt + 1}次重试] 代码执行没报错，但既没有生成图表(fig)，没输出报表(result_df/update_df)，也没有打印任何总结(print)！请检查。"
                     continue
 
-                # ====== 核心：数据状态机隔离生效 ======
-                sys_msg = ""
-                show_df = None
+                return self._commit_outputs(code_str, outputs, label=query)
+
+            except Exception as e:
+                import traceback
+                # 失败的生成结果不能留在缓存里，否则下次同样的提问会原样回放错误代码
+                self._invalidate_completion(messages, temperature=0.1, max_tokens=5000)
+                current_prompt += f"\n\n[第{attempt + 1}次崩溃] 报错:\n{e}\nTraceback:\n{traceback.format_exc()}\n请修复。"
+
+        # 修改 analyzer.py 约 310 行
+        return False, {"df": None, "fig": None, "text": "Agent反思重试均失败，触发兜底。"}, last_failed_code
+
+    @staticmethod
+    def _extract_code(ai_response: str) -> str:
+        """从模型回复中提取 ```python 代码块，并移除会阻塞执行的 plt.show()。"""
+        code_match = re.search(r'```python(.*?)```', ai_response, re.DOTALL) or re.search(r'```(.*?)```',
+                                                                                          ai_response,
+                                                                                          re.DOTALL)
+        code_str = code_match.group(1).strip() if code_match else ai_response
+        return code_str.replace("plt.show()", "")
 
-                # 1. 只有检测到 update_df，才真正覆写全局底表
-                if update_data is not None:
-                    self.processed_data = update_data
-                    sys_msg = f"\n[⚙️ 系统底层状态：已成功使用 {len(update_data)} 行的新数据覆盖了全局内存底表]"
-                    # 如果没有 result_df，才默认展示更新后的底表前几行
-                    show_df = update_data
+    @staticmethod
+    def _has_output(outputs: dict) -> bool:
+        """非空输出校验：至少产出图表、报表或打印总结之一。"""
+        return not (outputs['result_df'] is None and outputs['update_df'] is None
+                    and outputs['fig'] is None and not outputs['stdout'].strip())
 
-                # 2. 报表优先级最高：如果有 result_df，强制只展示它，不展示底表
-                if output_data is not None:
-                    show_df = output_data
+    def _commit_outputs(self, code_str: str, outputs: dict, label: str = "") -> tuple[bool, dict, str]:
+        """将通过校验的沙箱输出提交到数据状态机 (update_df 生成新的底表版本)，并组装前端展示结果。"""
+        output_data, update_data = outputs['result_df'], outputs['update_df']
+        output_fig, printed_text = outputs['fig'], outputs['stdout'].strip()
+
+        # ====== 核心：数据状态机隔离生效 ======
+        sys_msg = ""
+        show_df = None
+
+        # 1. 只有检测到 update_df，才真正覆写全局底表
+        if update_data is not None:
+            if isinstance(update_data, PendingUpdate):
+                # 惰性引擎：只有通过校验、真正提交的结果才写成新的列式文件
+                update_data = update_data.derive(self._lazy_dir())
+            rows = len(update_data)
+            if isinstance(update_data, LazyTable):
+                update_data = self._commit_lazy_table(update_data, label)
+            else:
+                self.set_processed_data(update_data, label)
+            sys_msg = f"\n[⚙️ 系统底层状态：已成功使用 {rows} 行的新数据覆盖了全局内存底表]"
+            # 如果没有 result_df，才默认展示更新后的底表前几行
+            show_df = update_data
 
-                self.last_executed_code = code_str
-                final_text = f"{printed_text}\n{sys_msg}".strip()
+        # 2. 报表优先级最高：如果有 result_df，强制只展示它，不展示底表
+        if output_data is not None:
+            show_df = output_data
 
-                return True, {"df": show_df, "fig": output_fig, "text": final_text}, code_str
+        self.last_executed_code = code_str
+        final_text = f"{printed_text}\n{sys_msg}".strip()
 
+        return True, {"df": show_df, "fig": output_fig, "text": final_text}, code_str
 
+    def _race_candidates(self, prompt: str, df_current: pd.DataFrame, num_candidates: int) -> tuple:
+        """
+        投机式并行候选：以递增温度并发请求多份代码并各自执行，返回最先通过校验的 (code_str, outputs)。
+
+        出现胜出者后通知其余候选停止 (断开流式请求、跳过尚未开始的执行)，并等待它们退出后再返回，
+        避免落选候选在后台继续消耗 token 或改写共享状态。
+
+        Returns:
+            tuple: (winner, best_failure)。winner 为 (code_str, outputs)，全部失败时为 None；
+                best_failure 为推进最远的失败候选的 (code_str, 报错信息)，供串行反思重试复用，没有可用代码时为 None。
+        """
+        messages = [{"role": "user", "content": prompt}]
+        temperatures = [round(min(0.1 + 0.3 * i, 1.3), 2) for i in range(num_candidates)]
+        cancel = threading.Event()
+        # 失败候选按推进阶段排序：执行无输出 > 执行崩溃 > 安全扫描未通过
+        failures = []
+
+        def run_candidate(temperature: float):
+            if cancel.is_set():
+                return None
+            self.tracer.count_attempt("candidate")
+            ai_response = self._chat_completion(messages, temperature=temperature, max_tokens=5000,
+                                                stop_at_code_block=self.stream_codegen,
+                                                stage="codegen_llm", cancel=cancel).strip()
+            if cancel.is_set():
+                return None
+            code_str = self._extract_code(ai_response)
+            is_safe, msg = self.is_safe_code(code_str)
+            if not is_safe:
+                failures.append((0, temperature, code_str, f"安全扫描未通过：{msg}"))
+                raise ValueError(msg)
+            if cancel.is_set():
+                return None
+            try:
+                outputs = self._run_sandbox(code_str, df_current)
             except Exception as e:
                 import traceback
-                current_prompt += f"\n\n[第{attempt + 1}次崩溃] 报错:\n{e}\nTraceback:\n{traceback.format_exc()}\n请修复。"
+                failures.append((1, temperature, code_str, f"报错:\n{e}\nTraceback:\n{traceback.format_exc()}"))
+                raise
+            if not self._has_output(outputs):
+                failures.append((2, temperature, code_str, "代码执行没报错，但既没有生成图表(fig)，没输出报表(result_df/update_df)，也没有打印任何总结(print)！"))
+                raise ValueError("候选代码未产生任何输出")
+            return code_str, outputs
 
-        # 修改 analyzer.py 约 310 行
-        return False, {"df": None, "fig": None, "text": "Agent反思重试均失败，触发兜底。"}, last_failed_code
+        executor = ThreadPoolExecutor(max_workers=num_candidates, thread_name_prefix="candidate")
+        futures = {executor.submit(run_candidate, t): t for t in temperatures}
+        winner = None
+        try:
+            for future in as_completed(futures):
+                try:
+                    winner = future.result()
+                except Exception as e:
+                    self._invalidate_completion(messages, temperature=futures[future], max_tokens=5000)
+                    logger.info(f"并行候选 (temperature={futures[future]}) 未通过: {e}")
+                    continue
+                if winner is not None:
+                    return winner, None
+            if not failures:
+                return None, None
+            _, _, code_str, feedback = max(failures, key=lambda item: (item[0], -item[1]))
+            return None, (code_str, feedback)
+        finally:
+            cancel.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            # 落选但执行成功的候选：放弃其输出 (惰性引擎下不会为其写出列式文件)
+            for future in futures:
+                if future.cancelled() or future.exception() is not None:
+                    continue
+                result = future.result()
+                if result is not None and result is not winner:
+                    self._release_outputs(result[1])
+
+    @staticmethod
+    def _release_outputs(outputs: dict):
+        """放弃未提交的沙箱输出 (惰性引擎下关闭待提交 update_df 持有的查询连接)。"""
+        if isinstance(outputs['update_df'], PendingUpdate):
+            outputs['update_df'].close()
+
+    def _run_sandbox(self, code_str: str, df_current: pd.DataFrame) -> dict:
+        """
+        执行已通过安全扫描的代码，返回 result_df / update_df / fig / stdout / peak_rss_mb (本次执行的 RSS 峰值)。
+
+        配置了进程池沙箱时在隔离的 worker 进程中执行 (受墙钟时间与内存上限约束)，否则在当前进程内 exec。
+        惰性引擎下始终在当前进程内执行，update_df 以 PendingUpdate 返回，提交时才写成列式文件。
+        """
+        isolated = self.sandbox_pool is not None and self.lazy_table is None
+        with self.tracer.span("sandbox_exec", isolated=isolated) as span:
+            outputs = self._exec_code(code_str, df_current)
+            span["peak_rss_mb"] = outputs.get("peak_rss_mb")
+            return outputs
+
+    def _exec_code(self, code_str: str, df_current: pd.DataFrame) -> dict:
+        if self.lazy_table is not None:
+            return self._exec_lazy(code_str)
+
+        sheet_frames = self._sheet_frames(code_str)
+        if self.sandbox_pool is not None:
+            return self.sandbox_pool.run(code_str, {'df': df_current, 'raw_df': self.raw_data, **sheet_frames})
+
+        # 注入沙箱环境，明确声明 update_df 和 result_df 为 None
+        # 将 update_df 初始设为 None 依然保留，但要通过 prompt 告诉 AI 不要检查它
+        # CoW 模式下注入的是零拷贝视图，只有生成代码真正写入时才会复制对应数据块
+        local_vars = {
+            'df': self._sandbox_view(df_current),
+            'raw_df': self._sandbox_view(self.raw_data),
+            'pd': pd, 'np': np, 'plt': plt,
+            'update_df': None,
+            'result_df': None,
+            'fig': None
+        }
+        for name, value in sheet_frames.items():
+            if isinstance(value, dict):
+                local_vars[name] = {sheet: self._sandbox_view(frame) for sheet, frame in value.items()}
+            else:
+                local_vars[name] = self._sandbox_view(value)
+
+        return self._exec_in_process(code_str, local_vars)
+
+    def _exec_lazy(self, code_str: str) -> dict:
+        """
+        惰性引擎：`df` 为 DuckDB 关系，查询的投影 / 谓词下推到列式文件扫描。
+
+        DuckDB 连接无法跨进程传递，始终在当前进程内执行；连接禁用了外部文件访问，内存受 lazy_memory_limit_mb 约束。
+        执行结束前 result_df 物化为 pandas；update_df 连同查询连接包装为 PendingUpdate，
+        只有通过校验并提交时才流式写成新的列式文件，失败的重试与落选的并行候选不会落盘。
+        """
+        con = self.lazy_table.connect()
+        try:
+            local_vars = {
+                'df': con.table(LAZY_TABLE_NAME),
+                'con': con,
+                'pd': pd, 'np': np, 'plt': plt,
+                'update_df': None,
+                'result_df': None,
+                'fig': None
+            }
+            outputs = self._exec_in_process(code_str, local_vars)
+            outputs['result_df'] = to_pandas(outputs['result_df'], self.lazy_result_max_rows)
+            if outputs['update_df'] is not None:
+                outputs['update_df'] = PendingUpdate(self.lazy_table, outputs['update_df'], con)
+                con = None  # 连接随待提交的结果交出，由 derive / close 关闭
+            return outputs
+        finally:
+            if con is not None:
+                con.close()
+
+    def _exec_in_process(self, code_str: str, local_vars: dict) -> dict:
+        import io
+        from contextlib import redirect_stdout
+
+        # 捕获 print 行为
+        f = io.StringIO()
+        with self._exec_lock:
+            plt.close('all')
+            # 按本次执行采样峰值，不重置进程级 VmHWM (其它会话线程可能正在读取)
+            with RssSampler() as sampler, redirect_stdout(f):
+                exec(code_str, {}, local_vars)
+            peak_rss_mb = round(sampler.peak_bytes / 1024 / 1024, 1)
+
+            # 从沙箱中提取结果
+            output_fig = local_vars.get('fig')
+            if output_fig is None:
+                fig_candidate = plt.gcf()
+                if fig_candidate.get_axes():
+                    output_fig = fig_candidate
+
+        return {
+            'result_df': local_vars.get('result_df'),
+            'update_df': local_vars.get('update_df'),
+            'fig': output_fig,
+            'stdout': f.getvalue(),
+            'peak_rss_mb': peak_rss_mb,
+        }
+
+    def _sandbox_view(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        为沙箱构造隔离副本：CoW 模式下为浅视图 (零拷贝)，deep 模式下为完整深拷贝。
+
+        进程级 CoW 未开启 (如被外部代码关闭) 时浅视图无法保证隔离，一律退回深拷贝。
+        """
+        shallow = self.sandbox_copy_mode == "cow" and pd.get_option("mode.copy_on_write")
+        return df.copy(deep=not shallow)
 
     def generate_chart(self, config: dict):
         """终极兜底图表渲染引擎 (不依赖大模型动态代码)。"""
@@ -0,0 +1,294 @@
+"""
+无界面批处理分析：按清单 (文件 × 问题) 在多进程中并发执行 Agent 链路，结果落盘到输出目录。
+
+清单为 JSON 文件，支持两种写法 (可混用)：
+
+    {
+        "files": ["data/北京.xlsx", "data/上海.xlsx"],
+        "queries": ["按年份汇总 GDP", "画出工业产值趋势图"],
+        "jobs": [{"file": "data/广东.csv", "query": "统计缺失值"}],
+        "knowledge_base": "data/kb_samples/环境发展知识库.md",
+        "options": {"max_retries": 3, "num_candidates": 1, "ingest_mode": "standard"}
+    }
+
+`files` 与 `queries` 做笛卡尔积，`jobs` 追加显式任务；相对路径相对于清单所在目录解析。
+
+并发粒度为"文件组"：同一文件上的全部问题在同一个 worker 中依次执行 (文件只解析一次)，
+因此单个大文件上的问题不会被分摊到多个 worker，批次总耗时不低于最大文件组的串行耗时；
+需要更高并发时可把问题分散到多份内容相同的文件，或提高 num_candidates。
+列式缓存写入输出目录下的 `.columnar_cache` (可通过 options.cache_dir 指定)，不会写到输入文件旁，
+输入目录可以是只读或共享目录；版本落盘与 DuckDB 溢写等临时文件写入输出目录下各文件组私有的 `.temp/<组>`，
+文件组结束后删除，不落在调用方的工作目录。
+
+用法:
+    python run_batch.py manifest.json --out ./batch_output --workers 4
+"""
+import argparse
+import io
+import json
+import logging
+import multiprocessing as mp
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TEMP_DIR_NAME = ".temp"
+
+DEFAULT_OPTIONS = {"max_retries": 3, "num_candidates": 1, "ingest_mode": "standard", "excel_sheet_mode": "all",
+                   "execution_engine": "pandas", "lazy_memory_limit_mb": None,
+                   "llm_cache_path": None, "cache_dir": None}
+
+
+def load_manifest(manifest_path: str) -> dict:
+    """
+    解析批处理清单，展开为按文件分组的任务。
+
+    Returns:
+        dict: {"groups": OrderedDict[文件路径 -> [(任务序号, 问题), ...]], "knowledge_base": str | None,
+               "options": dict, "total": int}
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    def resolve(path):
+        return path if os.path.isabs(path) else os.path.normpath(os.path.join(base_dir, path))
+
+    pairs = [(file, query) for file in manifest.get("files", []) for query in manifest.get("queries", [])]
+    pairs += [(job["file"], job["query"]) for job in manifest.get("jobs", [])]
+    if not pairs:
+        raise ValueError("批处理清单中没有任何任务 (需要 files × queries 或 jobs)")
+
+    groups = OrderedDict()
+    for job_id, (file, query) in enumerate(pairs):
+        groups.setdefault(resolve(file), []).append((job_id, query))
+
+    kb = manifest.get("knowledge_base")
+    return {
+        "groups": groups,
+        "knowledge_base": resolve(kb) if kb else None,
+        "options": {**DEFAULT_OPTIONS, **manifest.get("options", {})},
+        "total": len(pairs),
+    }
+
+
+class _PathUpload(io.BytesIO):
+    """把本地文件包装成与 Streamlit 上传对象相同的接口 (供知识库加载复用)。"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            super().__init__(f.read())
+        self.name = os.path.basename(path)
+
+
+def _slug(text: str, limit: int = 24) -> str:
+    return re.sub(r"[^\w一-鿿-]+", "_", text).strip("_")[:limit] or "job"
+
+
+def _save_outputs(res_dict: dict, code: str, job_dir: str) -> dict:
+    """将一次成功执行的结果写入任务目录，返回各产物路径。"""
+    os.makedirs(job_dir, exist_ok=True)
+    files = {}
+    with open(os.path.join(job_dir, "code.py"), "w", encoding="utf-8") as f:
+        f.write(code)
+    files["code"] = os.path.join(job_dir, "code.py")
+
+    df = res_dict.get("df")
+    if df is not None and hasattr(df, "to_csv"):
+        files["csv"] = os.path.join(job_dir, "result.csv")
+        df.to_csv(files["csv"], index=False, encoding="utf-8-sig")
+    fig = res_dict.get("fig")
+    if fig is not None:
+        import matplotlib.pyplot as plt
+        files["png"] = os.path.join(job_dir, "chart.png")
+        fig.savefig(files["png"], format="png", bbox_inches="tight", dpi=150)
+        plt.close(fig)
+    if res_dict.get("text"):
+        files["text"] = os.path.join(job_dir, "summary.txt")
+        with open(files["text"], "w", encoding="utf-8") as f:
+            f.write(res_dict["text"])
+    return files
+
+
+def run_file_jobs(api_key: str, model: str, file_path: str, jobs: list, out_dir: str,
+                  options: dict, knowledge_base: str = None) -> list:
+    """
+    worker 入口：加载一个数据文件，并依次执行该文件上的全部问题。
+
+    同一文件只解析一次 (命中列式缓存时直接内存映射)；每个问题都从原始底表开始，互不影响。
+    列式缓存写入 options["cache_dir"] (默认为 out_dir 下的 .columnar_cache)，不写到输入文件旁；
+    其余临时文件写入 out_dir 下本文件组私有的临时目录，结束后删除 (并行 worker 之间互不共享)。
+
+    Returns:
+        list[dict]: 每个任务的执行记录。
+    """
+    from src.core.analyzer import AIDrivenFormAnalyzer
+    from src.core.llm_cache import LLMResponseCache
+    from src.utils.columnar_cache import CACHE_DIR_NAME
+
+    llm_cache = LLMResponseCache(db_path=options["llm_cache_path"]) if options.get("llm_cache_path") else None
+    file_stem = os.path.splitext(os.path.basename(file_path))[0]
+    os.makedirs(os.path.join(out_dir, TEMP_DIR_NAME), exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix=f"{file_stem}_", dir=os.path.join(out_dir, TEMP_DIR_NAME))
+    analyzer = AIDrivenFormAnalyzer(api_key=api_key, model=model, llm_cache=llm_cache, temp_dir=temp_dir)
+    analyzer.ingest_mode = options.get("ingest_mode", "standard")
+    analyzer.excel_sheet_mode = options.get("excel_sheet_mode", "all")
+    analyzer.execution_engine = options.get("execution_engine", "pandas")
+    analyzer.lazy_memory_limit_mb = options.get("lazy_memory_limit_mb")
+    analyzer.columnar_cache_dir = options.get("cache_dir") or os.path.join(out_dir, CACHE_DIR_NAME)
+    try:
+        return _run_jobs(analyzer, file_path, file_stem, jobs, out_dir, options, knowledge_base)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _run_jobs(analyzer, file_path: str, file_stem: str, jobs: list, out_dir: str, options: dict,
+              knowledge_base: str = None) -> list:
+    """加载数据文件并依次执行其上的问题，返回执行记录。"""
+    records = []
+    try:
+        load_start = time.perf_counter()
+        if not analyzer.restore_data(file_path):
+            analyzer.load_data(file_path)
+        load_seconds = round(time.perf_counter() - load_start, 3)
+        if knowledge_base:
+            analyzer.load_custom_knowledge(_PathUpload(knowledge_base))
+    except Exception as e:
+        return [{"job_id": job_id, "file": file_path, "query": query, "status": "load_failed",
+                 "error": f"{type(e).__name__}: {e}", "latency_s": 0.0, "pid": os.getpid()} for job_id, query in jobs]
+
+    for job_id, query in jobs:
+        analyzer.processed_data = None
+        analyzer.last_executed_code = ""
+        record = {"job_id": job_id, "file": file_path, "query": query, "load_s": load_seconds, "pid": os.getpid()}
+        start = time.perf_counter()
+        try:
+            preflight = analyzer.prepare_turn(query)
+            route = preflight["route"]
+            record["route"] = route
+            if route.get("task_type") == "CHAT":
+                record["status"] = "skipped_chat"
+            else:
+                success, res_dict, code = analyzer.execute_agentic_code(
+                    query=query, metadata=preflight["metadata"], rag_context=preflight["rag_context"],
+                    task_type=route.get("task_type", "DATA_OP"), preprocess_mode=route.get("preprocess_mode", "NONE"),
+                    max_retries=options.get("max_retries", 3), num_candidates=options.get("num_candidates", 1))
+                if success and isinstance(res_dict, dict):
+                    job_dir = os.path.join(out_dir, file_stem, f"{job_id:04d}_{_slug(query)}")
+                    record["status"] = "success"
+                    record["outputs"] = _save_outputs(res_dict, code, job_dir)
+                else:
+                    record["status"] = "failed"
+                    record["error"] = res_dict if isinstance(res_dict, str) else "沙箱执行失败"
+                    record["code"] = code
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["latency_s"] = round(time.perf_counter() - start, 3)
+        records.append(record)
+    return records
+
+
+def run_batch(manifest_path: str, out_dir: str, api_key: str, model: str = "deepseek-chat",
+              max_workers: int = 4) -> dict:
+    """
+    执行批处理清单。
+
+    Args:
+        manifest_path (str): 清单路径。
+        out_dir (str): 输出目录 (写入各任务产物、jobs.jsonl 与 summary.json)。
+        api_key (str): 大模型 API 调用凭证。
+        model (str, optional): 模型版本。
+        max_workers (int, optional): 并发进程数上限；为 0 时在当前进程内串行执行 (便于调试)。
+            并发按文件分组，实际并发数不超过清单中的文件数。
+
+    Returns:
+        dict: 运行汇总 (任务数、各状态计数、吞吐量与延迟分位数)。
+    """
+    manifest = load_manifest(manifest_path)
+    os.makedirs(out_dir, exist_ok=True)
+    options, kb = manifest["options"], manifest["knowledge_base"]
+    log_path = os.path.join(out_dir, "jobs.jsonl")
+
+    start = time.perf_counter()
+    records = []
+    with open(log_path, "w", encoding="utf-8") as log:
+        def collect(file_records):
+            for record in file_records:
+                log.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                log.flush()
+                logger.info(f"[{record['status']}] {record['latency_s']:.2f}s {record['file']} <- {record['query'][:30]}")
+            records.extend(file_records)
+
+        if max_workers == 0:
+            for file_path, jobs in manifest["groups"].items():
+                collect(run_file_jobs(api_key, model, file_path, jobs, out_dir, options, kb))
+        else:
+            workers = min(max_workers, len(manifest["groups"]))
+            # spawn 启动：worker 不继承父进程的线程 / 锁状态
+            with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+                futures = {pool.submit(run_file_jobs, api_key, model, file_path, jobs, out_dir, options, kb): file_path
+                           for file_path, jobs in manifest["groups"].items()}
+                for future in as_completed(futures):
+                    try:
+                        collect(future.result())
+                    except Exception as e:
+                        file_path = futures[future]
+                        collect([{"job_id": job_id, "file": file_path, "query": query, "status": "worker_crashed",
+                                  "error": f"{type(e).__name__}: {e}", "latency_s": 0.0}
+                                 for job_id, query in manifest["groups"][file_path]])
+    # 各文件组的临时目录已在 worker 内删除，这里只移除 (崩溃 worker 残留后的) 根目录
+    shutil.rmtree(os.path.join(out_dir, TEMP_DIR_NAME), ignore_errors=True)
+
+    wall = time.perf_counter() - start
+    latencies = np.array([r["latency_s"] for r in records if r["status"] not in ("load_failed", "worker_crashed")])
+    status_counts = {}
+    for record in records:
+        status_counts[record["status"]] = status_counts.get(record["status"], 0) + 1
+    summary = {
+        "jobs": len(records),
+        "files": len(manifest["groups"]),
+        "status": status_counts,
+        "wall_seconds": round(wall, 3),
+        "throughput_jobs_per_min": round(len(records) / wall * 60, 2) if wall > 0 else None,
+        "latency_s": {
+            "mean": round(float(latencies.mean()), 3) if len(latencies) else None,
+            "p50": round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+            "p95": round(float(np.percentile(latencies, 95)), 3) if len(latencies) else None,
+            "max": round(float(latencies.max()), 3) if len(latencies) else None,
+        },
+        "log": log_path,
+    }
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI Form Analyzer 无界面批处理分析")
+    parser.add_argument("manifest", help="批处理清单 (JSON)")
+    parser.add_argument("--out", default="./batch_output", help="输出目录")
+    parser.add_argument("--workers", type=int, default=4, help="并发进程数 (0 表示当前进程内串行执行)")
+    parser.add_argument("--model", default="deepseek-chat")
+    parser.add_argument("--api-key", default=os.environ.get("DEEPSEEK_API_KEY"),
+                        help="大模型 API 密钥 (默认读取环境变量 DEEPSEEK_API_KEY)")
+    args = parser.parse_args(argv)
+    if not args.api_key:
+        parser.error("缺少 API 密钥：请通过 --api-key 或环境变量 DEEPSEEK_API_KEY 提供")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    summary = run_batch(args.manifest, args.out, args.api_key, args.model, args.workers)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return summary
+
+
+if __name__ == "__main__":
+    main()
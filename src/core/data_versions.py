@@ -0,0 +1,365 @@
+"""
+底表版本历史：每次底表被整体替换都会生成一个不可变快照，支持撤销 / 重做与按版本 id 缓存。
+
+快照按列存储并在版本之间结构共享：新版本中与父版本完全相同的列 (以及行索引) 直接引用父版本的数组，
+不做深拷贝，一次新增列的清洗操作只会多占用新列的内存。撤销 / 重做只移动当前版本指针，
+按列数组重新组装数据框的开销与行数无关。超出内存预算时，较旧版本独占的列会落盘为 Feather 文件，
+再次切换到该版本时内存映射读回。
+
+入库的列数组会被标记为只读：对已提交的数据框做就地修改 (如 `df.loc[...] = ...`) 会直接报错，
+而不是悄悄改写历史版本；需要就地修改时请先 `copy()`。
+"""
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from src.utils.helpers import estimate_frame_memory_mb
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # 缺少 pyarrow 时列数组以 pickle 落盘
+    pa = feather = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Column:
+    """一列的存储单元，可被多个版本共同引用；数组视为只读。"""
+
+    def __init__(self, values):
+        self.values = values
+        self.path = None
+        # object 列只抽样统计后按行数外推，避免对大表做 deep 统计
+        self.nbytes = int(estimate_frame_memory_mb(pd.DataFrame({"v": values}, copy=False)) * 1024 * 1024)
+
+    def load(self):
+        """返回列数组；落盘的列读回后保留引用 (落盘文件保留，再次落盘时只需释放内存)，以便新版本继续共享。"""
+        if self.values is None:
+            if self.path.endswith(".feather"):
+                values = feather.read_table(self.path, memory_map=True).to_pandas()["v"].array
+                buffer = _numpy_buffer(values)  # 与入库时一致，numpy 类型列保存原始 ndarray
+                values = buffer if buffer is not None else values
+            else:
+                with open(self.path, "rb") as f:
+                    values = pickle.load(f)
+            _freeze(values)
+            self.values = values
+        return self.values
+
+
+class _Snapshot:
+    def __init__(self, label: str, index: _Column, columns: list, parent_id: str = None):
+        self.id = uuid.uuid4().hex[:16]
+        self.label = label
+        self.index = index
+        self.columns = columns  # [(列名, _Column), ...]，保持原始列顺序
+        self.parent_id = parent_id
+        self.created_at = time.time()
+
+    @property
+    def shape(self) -> tuple:
+        length = len(self.index.values) if self.index.values is not None else None
+        return length, len(self.columns)
+
+
+def _numpy_buffer(values):
+    if isinstance(values, pd.arrays.NumpyExtensionArray):
+        return np.asarray(values)  # 零拷贝取出底层数组 (to_numpy 会额外做一次空值扫描)
+    return values if isinstance(values, np.ndarray) else None
+
+
+def _buffers(values) -> list:
+    """列数组背后的 ndarray 缓冲区 (numpy 列为其本身，扩展类型为数据 / 掩码 / 编码数组)。"""
+    buffer = _numpy_buffer(values)
+    if buffer is not None:
+        return [buffer]
+    buffers = (getattr(values, attr, None) for attr in ("_ndarray", "_data", "_mask"))
+    return [buffer for buffer in buffers if isinstance(buffer, np.ndarray)]
+
+
+def _freeze(values):
+    """把列数组连同其底层缓冲区链标记为只读。"""
+    for buffer in _buffers(values):
+        while isinstance(buffer, np.ndarray):
+            buffer.flags.writeable = False
+            buffer = buffer.base
+
+
+def _same_array(new, old) -> bool:
+    """判断两列数据是否一致：先比较底层缓冲区 (零拷贝视图直接命中)，再退化为逐值比较。"""
+    if len(new) != len(old) or new.dtype != old.dtype:
+        return False
+    new_buffer, old_buffer = _numpy_buffer(new), _numpy_buffer(old)
+    if new_buffer is not None and old_buffer is not None:
+        # 只比较地址与布局 (冻结前后的只读标记不同，不影响是否为同一块内存)
+        new_layout, old_layout = new_buffer.__array_interface__, old_buffer.__array_interface__
+        if all(new_layout[key] == old_layout[key] for key in ("shape", "strides", "typestr")) \
+                and new_layout["data"][0] == old_layout["data"][0]:
+            return True
+    return pd.Series(new, copy=False).equals(pd.Series(old, copy=False))
+
+
+class DataVersionStore:
+    """
+    线性版本历史 (撤销后提交新版本会丢弃被撤销的分支)。
+
+    首个版本为原始底表 (`reset`)，之后每次 `commit` 追加一个版本；`undo` / `redo` 在历史上移动当前指针。
+    """
+
+    def __init__(self, memory_budget_mb: float = 1024, max_versions: int = 50, spill_dir: str = None,
+                 on_discard=None):
+        """
+        Args:
+            memory_budget_mb (float, optional): 所有版本在内存中的列数组总预算 (MB)，当前版本始终常驻内存。
+            max_versions (int, optional): 保留的最大版本数，超出时丢弃最早的非原始版本。
+            spill_dir (str, optional): 落盘目录，为 None 时在首次落盘时于 ./temp_data 下创建临时目录。
+            on_discard (callable, optional): 版本被丢弃时以版本 id 回调 (撤销后提交、超出版本数上限、重置历史)，
+                供调用方清理挂在该版本上的外部资源。
+        """
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self.max_versions = max_versions
+        self.spill_dir = spill_dir
+        self.on_discard = on_discard
+        self._snapshots = []
+        self._position = -1
+        self._frames = OrderedDict()  # 版本 id -> 已组装的数据框 (只缓存最近访问的少数几个)
+        self.spills = 0
+
+    # ---------- 版本操作 ----------
+
+    def reset(self, df: pd.DataFrame, label: str = "原始数据") -> str:
+        """以新的原始底表开始一段全新的历史。"""
+        self._discard(self._snapshots)
+        self._snapshots, self._position = [], -1
+        self._frames.clear()
+        if df is None:
+            return None
+        return self._append(df, label, parent=None)
+
+    def commit(self, df: pd.DataFrame, label: str = "") -> str:
+        """在当前版本之后提交新版本，返回版本 id；与当前版本相同的列、行索引直接共享。"""
+        if self._position < 0:
+            return self.reset(df, label or "原始数据")
+        self._discard(self._snapshots[self._position + 1:])
+        del self._snapshots[self._position + 1:]
+        version_id = self._append(df, label, parent=self._snapshots[self._position])
+
+        # 超出版本数上限时丢弃最早的非原始版本
+        while len(self._snapshots) > self.max_versions:
+            dropped = self._snapshots.pop(1)
+            self._position -= 1
+            self._discard([dropped])
+        self._enforce_budget()
+        return version_id
+
+    def undo(self) -> str:
+        if self.can_undo:
+            self._position -= 1
+        return self.current_id
+
+    def redo(self) -> str:
+        if self.can_redo:
+            self._position += 1
+        return self.current_id
+
+    def checkout(self, version_id: str) -> str:
+        """切换到历史中的任意版本 (不丢弃其后的版本，仍可重做回去)。"""
+        for position, snapshot in enumerate(self._snapshots):
+            if snapshot.id == version_id:
+                self._position = position
+                return version_id
+        raise KeyError(version_id)
+
+    @property
+    def can_undo(self) -> bool:
+        return self._position > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return 0 <= self._position < len(self._snapshots) - 1
+
+    @property
+    def current_id(self) -> str:
+        return self._snapshots[self._position].id if self._position >= 0 else None
+
+    @property
+    def root_id(self) -> str:
+        return self._snapshots[0].id if self._snapshots else None
+
+    @property
+    def at_root(self) -> bool:
+        return self._position == 0
+
+    @property
+    def current(self) -> pd.DataFrame:
+        return self.get(self.current_id) if self._position >= 0 else None
+
+    def get(self, version_id: str) -> pd.DataFrame:
+        """组装指定版本的数据框 (列数组零拷贝引用；已落盘的列以内存映射读回)。"""
+        if version_id in self._frames:
+            self._frames.move_to_end(version_id)
+            return self._frames[version_id]
+        snapshot = next(s for s in self._snapshots if s.id == version_id)
+        data = {i: column.load() for i, (_, column) in enumerate(snapshot.columns)}
+        df = pd.DataFrame(data, index=snapshot.index.load(), copy=False)
+        df.columns = pd.Index([name for name, _ in snapshot.columns])
+        self._frames[version_id] = df
+        while len(self._frames) > 2:
+            self._frames.popitem(last=False)
+        return df
+
+    # ---------- 状态查询 ----------
+
+    def history(self) -> list[dict]:
+        """按时间顺序列出各版本 (供 UI 展示)。"""
+        parent_columns = {}
+        records = []
+        for position, snapshot in enumerate(self._snapshots):
+            shared = sum(1 for name, column in snapshot.columns if parent_columns.get(name) is column)
+            records.append({
+                "id": snapshot.id,
+                "label": snapshot.label,
+                "shape": snapshot.shape,
+                "shared_columns": shared,
+                "spilled": any(column.values is None for _, column in snapshot.columns),
+                "current": position == self._position,
+            })
+            parent_columns = dict(snapshot.columns)
+        return records
+
+    def stats(self) -> dict:
+        in_memory = spilled = 0
+        for column in self._unique_columns(self._snapshots):
+            if column.values is None:
+                spilled += column.nbytes
+            else:
+                in_memory += column.nbytes
+        return {"versions": len(self._snapshots), "position": self._position,
+                "memory_mb": round(in_memory / 1024 / 1024, 2), "spilled_mb": round(spilled / 1024 / 1024, 2),
+                "spills": self.spills}
+
+    def close(self):
+        """清空历史并删除落盘目录。"""
+        self.reset(None)
+        if self.spill_dir and os.path.isdir(self.spill_dir):
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    # ---------- 内部实现 ----------
+
+    def _append(self, df: pd.DataFrame, label: str, parent: _Snapshot) -> str:
+        parent_by_name = {}
+        if parent is not None:
+            names = [name for name, _ in parent.columns]
+            parent_by_name = {name: column for name, column in parent.columns if names.count(name) == 1}
+
+        index = df.index
+        if parent is not None and parent.index.values is not None and parent.index.values.equals(index):
+            index_column = parent.index
+        else:
+            index_column = _Column(index)
+
+        columns = []
+        for position, name in enumerate(df.columns):
+            # numpy 类型列保存原始 ndarray (组装数据框时不会触发类型推断)，扩展类型保存其 ExtensionArray
+            values = df.iloc[:, position].array
+            buffer = _numpy_buffer(values)
+            values = buffer if buffer is not None else values
+            shared = parent_by_name.get(name)
+            # 父版本的列已落盘时以内存映射读回再比较，撤销到旧版本后提交的新版本仍能共享其列
+            if shared is not None and index_column is parent.index and _same_array(values, shared.load()):
+                columns.append((name, shared))
+            else:
+                columns.append((name, _Column(self._frozen(df, position, values))))
+
+        snapshot = _Snapshot(label, index_column, columns, parent.id if parent is not None else None)
+        self._snapshots.append(snapshot)
+        self._position = len(self._snapshots) - 1
+        return snapshot.id
+
+    @staticmethod
+    def _frozen(df: pd.DataFrame, position: int, values):
+        """
+        冻结入库的列数组，防止调用方就地修改数据框时改写历史版本。
+
+        调用方的数据框仍能经由其它可写视图改写同一块内存时 (如由转置视图构造的数据框)，改为保存一份只读副本。
+        """
+        _freeze(values)
+        if any(buffer.flags.writeable for buffer in _buffers(df.iloc[:, position].array)):
+            values = values.copy()
+            _freeze(values)
+        return values
+
+    @staticmethod
+    def _unique_columns(snapshots) -> list:
+        seen = {}
+        for snapshot in snapshots:
+            for column in [snapshot.index] + [column for _, column in snapshot.columns]:
+                seen[id(column)] = column
+        return list(seen.values())
+
+    def _enforce_budget(self):
+        """内存超出预算时，从最旧的版本开始把当前版本未引用的列落盘。"""
+        columns = self._unique_columns(self._snapshots)
+        used = sum(column.nbytes for column in columns if column.values is not None)
+        if used <= self.memory_budget_bytes:
+            return
+        current = self._snapshots[self._position]
+        pinned = {id(current.index)} | {id(column) for _, column in current.columns}
+        for snapshot in self._snapshots:
+            self._frames.pop(snapshot.id, None)
+            for _, column in snapshot.columns:
+                if used <= self.memory_budget_bytes:
+                    return
+                if id(column) in pinned or column.values is None:
+                    continue
+                self._spill(column)
+                used -= column.nbytes
+
+    def _spill(self, column: _Column):
+        if column.path is not None:
+            # 之前落盘过、读回后仍未变化的列直接释放内存，无需重写
+            column.values = None
+            return
+        if self.spill_dir is None:
+            os.makedirs("./temp_data", exist_ok=True)
+            self.spill_dir = tempfile.mkdtemp(prefix="data_versions_", dir="./temp_data")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        stem = os.path.join(self.spill_dir, uuid.uuid4().hex)
+        try:
+            if feather is None:
+                raise ImportError("pyarrow 不可用")
+            path = f"{stem}.feather"
+            table = pa.Table.from_pandas(pd.DataFrame({"v": column.values}, copy=False), preserve_index=False)
+            feather.write_feather(table, path, compression="uncompressed")
+        except Exception:
+            # 混合类型 object 列等无法转换为 Arrow 时退化为 pickle
+            path = f"{stem}.pkl"
+            with open(path, "wb") as f:
+                pickle.dump(column.values, f, protocol=pickle.HIGHEST_PROTOCOL)
+        column.path, column.values = path, None
+        self.spills += 1
+
+    def _discard(self, snapshots: list):
+        """删除被丢弃版本独占的落盘文件，并通知 on_discard。"""
+        if not snapshots:
+            return
+        kept = {id(column) for column in self._unique_columns(s for s in self._snapshots if s not in snapshots)}
+        for column in self._unique_columns(snapshots):
+            if id(column) not in kept and column.path:
+                try:
+                    os.remove(column.path)
+                except OSError:
+                    pass
+        for snapshot in snapshots:
+            self._frames.pop(snapshot.id, None)
+            if self.on_discard is not None:
+                self.on_discard(snapshot.id)
@@ -0,0 +1,81 @@
+import re
+
+DEFAULT_ROUTE = {"task_type": "CHAT", "need_rag": False, "preprocess_mode": "NONE"}
+
+
+class FastIntentClassifier:
+    """
+    本地快速意图分类器 (语义路由前置快车道)。
+
+    将 `semantic_router` 提示词中的强匹配判定规则固化为关键词规则，在微秒级完成明显意图的分类，
+    并给出置信度。只有当置信度低于阈值 (信号冲突、出现否定、无任何命中) 时才回退到 LLM 路由。
+    """
+
+    KNOWLEDGE_KEYWORDS = ("要求", "红线", "规则", "是什么", "定义", "知识库", "口径", "规范", "制度")
+    PLOT_KEYWORDS = ("画图", "画个", "画一", "绘制", "可视化", "图表", "分布", "折线", "柱状", "饼图", "散点",
+                     "热力图", "趋势图", "直方图", "作图")
+    DATA_OP_KEYWORDS = ("计算", "分析", "清洗", "汇总", "排序", "提取", "筛选", "统计", "去重", "删除", "剔除",
+                        "填充", "填上", "合并", "求和", "平均", "新增", "排名", "分组", "空值", "缺失", "异常")
+    CUSTOM_PREP_KEYWORDS = ("清洗", "去重", "删除", "剔除", "填充", "填上", "空值", "缺失", "异常")
+    CHAT_KEYWORDS = ("你好", "您好", "谢谢", "聊聊", "聊天", "游戏", "天气", "hello", "早上好", "晚上好",
+                     "你觉得", "你认为", "好吃", "好玩")
+    # 规则 1 明确指出"即使包含数据/清洗字眼"也属于知识问答，这些词单独出现时不构成操作意图
+    KNOWLEDGE_NEUTRAL_KEYWORDS = ("清洗", "分析", "统计")
+    NEGATION_PATTERN = re.compile(r"(不要|别|不用|无需|不需要|不必)")
+
+    def __init__(self, threshold: float = 0.8):
+        """
+        Args:
+            threshold (float, optional): 快车道放行的最低置信度。默认 0.8。
+        """
+        self.threshold = threshold
+
+    @staticmethod
+    def extract_current_query(text: str) -> str:
+        """路由输入会拼接历史上下文，仅取 `当前需求:` 之后的最新一句参与分类。"""
+        marker = "当前需求:"
+        return text.rsplit(marker, 1)[-1].strip() if marker in text else text.strip()
+
+    def classify(self, text: str) -> tuple[dict, float]:
+        """
+        对用户输入执行本地规则分类。
+
+        Args:
+            text (str): 路由输入 (可包含历史上下文)。
+
+        Returns:
+            tuple[dict, float]: (路由结果, 置信度)。置信度低于阈值时路由结果仅供参考。
+        """
+        query = self.extract_current_query(text).lower()
+        if not query:
+            return dict(DEFAULT_ROUTE), 0.0
+
+        # 否定语气 ("不要画图") 会翻转关键词语义，交给 LLM 精判
+        if self.NEGATION_PATTERN.search(query):
+            return dict(DEFAULT_ROUTE), 0.4
+
+        knowledge = any(k in query for k in self.KNOWLEDGE_KEYWORDS)
+        plot = any(k in query for k in self.PLOT_KEYWORDS)
+        data_op_hits = {k for k in self.DATA_OP_KEYWORDS if k in query}
+        data_op = bool(data_op_hits)
+        chat = any(k in query for k in self.CHAT_KEYWORDS)
+
+        if knowledge:
+            # 规则 1：知识问答优先级最高，但同时要求操作数据时意图存在歧义
+            if plot or data_op_hits.difference(self.KNOWLEDGE_NEUTRAL_KEYWORDS):
+                return {"task_type": "CHAT", "need_rag": True, "preprocess_mode": "NONE"}, 0.5
+            return {"task_type": "CHAT", "need_rag": True, "preprocess_mode": "NONE"}, 0.9
+
+        if plot:
+            # 规则 2：画图 (含"画图顺便分析") 一律判定为 PLOT
+            return {"task_type": "PLOT", "need_rag": False, "preprocess_mode": "DEFAULT"}, 0.9 if not chat else 0.6
+
+        if data_op:
+            prep = "CUSTOM" if any(k in query for k in self.CUSTOM_PREP_KEYWORDS) else "DEFAULT"
+            return {"task_type": "DATA_OP", "need_rag": False, "preprocess_mode": prep}, 0.85 if not chat else 0.6
+
+        if chat:
+            # 规则 4：完全不涉及数据的问候/闲聊
+            return dict(DEFAULT_ROUTE), 0.9
+
+        return dict(DEFAULT_ROUTE), 0.3
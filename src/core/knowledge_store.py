@@ -0,0 +1,65 @@
+import logging
+import os
+import threading
+import time
+
+import chromadb
+from chromadb.config import Settings
+
+logger = logging.getLogger(__name__)
+
+KB_COLLECTION_NAME = "business_kb"
+
+
+def open_kb_collection(persist_dir: str = None, embedding_function=None, name: str = KB_COLLECTION_NAME):
+    """
+    打开知识库向量集合。
+
+    Args:
+        persist_dir (str, optional): 持久化目录。为 None 时使用进程内临时库并清空旧集合 (旧行为)；
+            指定目录时复用磁盘上已有的集合，跨会话共享已计算的向量。
+        embedding_function (optional): 向量化函数，为 None 时使用 ChromaDB 默认模型。
+        name (str, optional): 集合名称。
+
+    Returns:
+        tuple: (chroma_client, collection)。
+    """
+    kwargs = {"embedding_function": embedding_function} if embedding_function is not None else {}
+    if persist_dir:
+        os.makedirs(persist_dir, exist_ok=True)
+        client = chromadb.PersistentClient(path=persist_dir, settings=Settings(anonymized_telemetry=False))
+        return client, client.get_or_create_collection(name, **kwargs)
+
+    client = chromadb.Client()
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    return client, client.create_collection(name, **kwargs)
+
+
+def warmup_embedding_function(embedding_function, background: bool = True):
+    """
+    预热向量化模型 (加载模型权重并完成一次推理)，避免首个检索请求承担冷启动耗时。
+
+    Args:
+        embedding_function: 待预热的向量化函数。
+        background (bool, optional): 是否在守护线程中执行。
+
+    Returns:
+        threading.Thread | None: 后台预热线程；同步执行时返回 None。
+    """
+    def _warmup():
+        start = time.perf_counter()
+        try:
+            embedding_function(["知识库预热"])
+            logger.info(f"向量化模型预热完成，耗时 {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logger.warning(f"向量化模型预热失败: {e}")
+
+    if not background:
+        _warmup()
+        return None
+    thread = threading.Thread(target=_warmup, name="kb-embedding-warmup", daemon=True)
+    thread.start()
+    return thread
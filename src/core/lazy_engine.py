@@ -0,0 +1,232 @@
+"""
+可选的惰性执行引擎 (DuckDB)：底表不再整体载入 pandas，而是以列式文件 (Arrow IPC / Parquet) 的形式交给 DuckDB 查询。
+
+列式文件以 pyarrow dataset 注册为 DuckDB 表 `data`，查询的投影 / 谓词下推到文件扫描，只读取用到的列与批次；
+超出内存上限的中间结果由 DuckDB 溢写到临时目录。生成代码拿到的连接关闭了外部文件访问并锁定了配置，
+只能查询这张表。只有最终的 result_df 会物化为 pandas 数据框，update_df 在通过校验并提交时才按批次流式写成
+新的 Parquet 文件，作为下一个版本的底表。
+"""
+import logging
+import os
+import uuid
+
+import pandas as pd
+
+try:
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # duckdb 为可选依赖，缺失时只能使用 pandas 引擎
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+LAZY_TABLE_NAME = "data"
+# 写出列式文件时每个记录批次的行数：pyarrow 扫描时会预读若干批次，批次越大查询峰值内存越高
+BATCH_ROWS = 64 * 1024
+
+
+def quote_identifier(name: str) -> str:
+    """SQL 标识符转义 (列名可能包含中文、空格或引号)。"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _require_duckdb():
+    if duckdb is None:
+        raise ImportError("惰性执行引擎需要安装 duckdb：pip install duckdb")
+
+
+def _connect(memory_limit_mb: float = None, temp_dir: str = None):
+    config = {}
+    if memory_limit_mb:
+        config["memory_limit"] = f"{int(memory_limit_mb)}MB"
+    if temp_dir:
+        os.makedirs(temp_dir, exist_ok=True)
+        config["temp_directory"] = temp_dir
+    return duckdb.connect(config=config)
+
+
+def _arrow_reader(rel):
+    """按批次流式读取关系 (新版 DuckDB 将 fetch_arrow_reader 更名为 to_arrow_reader)。"""
+    reader = getattr(rel, "to_arrow_reader", None) or rel.fetch_arrow_reader
+    return reader(BATCH_ROWS)
+
+
+def ingest_csv(source_path: str, target_path: str, memory_limit_mb: float = None, temp_dir: str = None) -> int:
+    """
+    将 CSV 流式转换为列式文件 (未压缩 Arrow IPC，与 Feather 缓存格式一致)，全程不在 pandas 中整表物化。
+
+    类型推断与解析由 DuckDB 完成，列名清理规则与 pandas 引擎一致 (去除首尾空白与换行)。
+
+    Args:
+        source_path (str): CSV 文件路径 (UTF-8)。
+        target_path (str): 输出文件路径。
+        memory_limit_mb (float, optional): DuckDB 内存上限。
+        temp_dir (str, optional): DuckDB 溢写目录。
+
+    Returns:
+        int: 写入的行数。
+    """
+    _require_duckdb()
+    con = _connect(memory_limit_mb, temp_dir)
+    tmp_path = f"{target_path}.tmp"
+    try:
+        rel = con.read_csv(source_path)
+        names = [str(col).strip().replace('\n', '') for col in rel.columns]
+        rel = rel.project(", ".join(f"{quote_identifier(col)} AS {quote_identifier(name)}"
+                                    for col, name in zip(rel.columns, names)))
+        reader = _arrow_reader(rel)
+
+        os.makedirs(os.path.dirname(os.path.abspath(target_path)), exist_ok=True)
+        rows = 0
+        with pa.ipc.new_file(tmp_path, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        os.replace(tmp_path, target_path)
+        return rows
+    finally:
+        con.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def to_pandas(value, max_rows: int = None):
+    """
+    将生成代码输出的 DuckDB 关系物化为 pandas 数据框；其余类型原样返回。
+
+    Raises:
+        ValueError: 结果行数超过 max_rows 时抛出 (提示模型先聚合 / 筛选，而不是把整表拉进内存)。
+    """
+    if duckdb is None or not isinstance(value, duckdb.DuckDBPyRelation):
+        return value
+    df = (value.limit(max_rows + 1) if max_rows else value).df()
+    if max_rows and len(df) > max_rows:
+        raise ValueError(f"result_df 超过 {max_rows} 行，无法物化为 pandas 数据框，请先聚合或筛选后再输出")
+    return df
+
+
+class LazyTable:
+    """列式文件上的惰性底表；扩展名为 .parquet 时按 Parquet 读取，否则按 Arrow IPC (Feather) 读取。"""
+
+    def __init__(self, path: str, memory_limit_mb: float = None, temp_dir: str = None):
+        """
+        Args:
+            path (str): 列式文件路径。
+            memory_limit_mb (float, optional): 查询连接的 DuckDB 内存上限，为 None 时使用 DuckDB 默认值 (物理内存的 80%)。
+            temp_dir (str, optional): 超出内存上限时的溢写目录。
+        """
+        _require_duckdb()
+        self.path = path
+        self.memory_limit_mb = memory_limit_mb
+        self.temp_dir = temp_dir
+        self.dataset = ds.dataset(path, format="parquet" if path.endswith(".parquet") else "ipc")
+        self.num_rows = self.dataset.count_rows()
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self.dataset.schema.names)
+
+    @property
+    def shape(self) -> tuple:
+        return self.num_rows, len(self.columns)
+
+    def connect(self, sandbox: bool = True):
+        """
+        创建查询连接并注册表 `data` (每次执行独立一条连接，并行候选之间互不影响)。
+
+        sandbox=True 时禁用外部文件访问 (read_csv / COPY / ATTACH / 安装扩展等) 并锁定配置；
+        数据由 pyarrow 扫描后交给 DuckDB，不受该限制影响。
+        """
+        con = _connect(self.memory_limit_mb, self.temp_dir)
+        con.register(LAZY_TABLE_NAME, self.dataset)
+        if sandbox:
+            con.execute("SET enable_external_access = false")
+            con.execute("SET lock_configuration = true")
+        return con
+
+    def head(self, n: int = 1000) -> pd.DataFrame:
+        """前 n 行预览 (只读取开头的若干批次)。"""
+        return self.dataset.head(n).to_pandas()
+
+    def profile(self) -> dict:
+        """
+        表结构画像，字段与 pandas 引擎的元信息一致；缺失值统计在一次列式扫描中完成。
+
+        Returns:
+            dict: 表为空时返回 None。
+        """
+        if self.num_rows == 0:
+            return None
+        con = self.connect()
+        try:
+            rel = con.table(LAZY_TABLE_NAME)
+            counts = con.sql("SELECT " + ", ".join(f"COUNT({quote_identifier(col)})" for col in rel.columns)
+                             + f" FROM {LAZY_TABLE_NAME}").fetchone()
+            return {
+                "engine": "duckdb",
+                "table": LAZY_TABLE_NAME,
+                "columns": list(rel.columns),
+                "dtypes": {col: str(dtype) for col, dtype in zip(rel.columns, rel.types)},
+                "shape": self.shape,
+                "missing_values": {col: self.num_rows - count for col, count in zip(rel.columns, counts)},
+                "sample_data": self.head(3).to_markdown(index=False),
+            }
+        finally:
+            con.close()
+
+    def derive(self, value, out_dir: str) -> "LazyTable":
+        """
+        将生成代码输出的新底表 (DuckDB 关系或 pandas 数据框) 写成新的 Parquet 文件并返回对应的惰性表。
+
+        DuckDB 关系按批次流式写出，不在内存中整表物化。
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"{uuid.uuid4().hex}.parquet")
+        try:
+            if isinstance(value, pd.DataFrame):
+                pq.write_table(pa.Table.from_pandas(value, preserve_index=False), path)
+            elif isinstance(value, duckdb.DuckDBPyRelation):
+                reader = _arrow_reader(value)
+                with pq.ParquetWriter(path, reader.schema) as writer:
+                    for batch in reader:
+                        writer.write_batch(batch)
+            else:
+                raise TypeError(f"update_df 必须是 DuckDB 关系或 pandas 数据框，而不是 {type(value).__name__}")
+        except Exception:
+            # 写出中途失败时不留下半截文件
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        return LazyTable(path, self.memory_limit_mb, self.temp_dir)
+
+
+class PendingUpdate:
+    """
+    生成代码输出、尚未提交的新底表 (DuckDB 关系或 pandas 数据框)。
+
+    持有产生它的查询连接，直到 `derive` 写成列式文件或 `close` 放弃；失败的重试与落选的并行候选不会留下文件。
+    """
+
+    def __init__(self, table: LazyTable, value, con):
+        if not isinstance(value, (pd.DataFrame, duckdb.DuckDBPyRelation)):
+            raise TypeError(f"update_df 必须是 DuckDB 关系或 pandas 数据框，而不是 {type(value).__name__}")
+        self.table = table
+        self.value = value
+        self.con = con
+
+    def derive(self, out_dir: str) -> LazyTable:
+        """写成新的 Parquet 文件并返回对应的惰性表，随后关闭查询连接。"""
+        try:
+            return self.table.derive(self.value, out_dir)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.con is not None:
+            self.con.close()
+            self.con = None
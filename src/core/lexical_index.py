@@ -0,0 +1,150 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict, deque
+
+# ASCII 词 (含数字与下划线) 整体成词；连续的中日韩字符切成二元组 (单字片段保留单字)
+_ASCII_WORD = re.compile(r"[a-z0-9_]+")
+_CJK_RUN = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """中英混合分词：英文按词、中文按字二元组切分，无需外部分词词典。"""
+    text = text.lower()
+    tokens = _ASCII_WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class AhoCorasickMatcher:
+    """
+    Aho-Corasick 多模式串匹配自动机 (大小写不敏感，按字符匹配，天然支持中文)。
+
+    一次扫描即可找出查询中出现的全部术语，耗时与术语表规模无关，只与查询长度和命中数相关。
+    """
+
+    def __init__(self, terms=()):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self.size = 0
+        for term in terms:
+            self._insert(term)
+        self._build()
+
+    def _insert(self, term: str):
+        node = 0
+        for ch in term.lower():
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        if term not in self._output[node]:
+            self._output[node].append(term)
+            self.size += 1
+
+    def _build(self):
+        """按 BFS 计算失配指针，并把失配链上的输出合并到当前节点。"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_all(self, text: str) -> list[str]:
+        """返回文本中出现的全部术语 (按首次出现的位置排序，去重)。"""
+        found, seen = [], set()
+        node = 0
+        for ch in text.lower():
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for term in self._output[node]:
+                if term not in seen:
+                    seen.add(term)
+                    found.append(term)
+        return found
+
+
+class BM25Index:
+    """
+    支持增量追加的 BM25 倒排索引。
+
+    文档以追加顺序编号 (与 `custom_kb_docs` 下标一致)；查询只遍历查询词的倒排表。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)  # token -> {doc_idx: tf}
+        self._doc_lengths = []
+        self._total_length = 0
+        self._norms = None  # 每篇文档的长度归一化项，追加文档后惰性重算
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def add(self, documents):
+        """追加文档到索引末尾。"""
+        for doc in documents:
+            doc_idx = len(self._doc_lengths)
+            counts = Counter(tokenize(doc))
+            for token, tf in counts.items():
+                self._postings[token][doc_idx] = tf
+            length = sum(counts.values())
+            self._doc_lengths.append(length)
+            self._total_length += length
+        self._norms = None
+
+    def search(self, query: str, top_k: int = 3) -> list[tuple[int, float, float]]:
+        """
+        检索与查询最相关的文档。
+
+        Returns:
+            list[tuple[int, float, float]]: (文档下标, BM25 得分, 查询词覆盖率) 列表，按得分降序。
+        """
+        n_docs = len(self._doc_lengths)
+        query_tokens = set(tokenize(query))
+        if not n_docs or not query_tokens:
+            return []
+
+        if self._norms is None:
+            avg_length = self._total_length / n_docs or 1.0
+            self._norms = [self.k1 * (1 - self.b + self.b * length / avg_length) for length in self._doc_lengths]
+        norms = self._norms
+        scores = defaultdict(float)
+        matched = defaultdict(int)
+        for token in query_tokens:
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            boost = idf * (self.k1 + 1)
+            for doc_idx, tf in postings.items():
+                scores[doc_idx] += boost * tf / (tf + norms[doc_idx])
+                matched[doc_idx] += 1
+
+        ranked = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(doc_idx, score, matched[doc_idx] / len(query_tokens)) for doc_idx, score in ranked]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60, top_k: int = 3) -> list[str]:
+    """倒数排名融合 (RRF)：合并多路检索的有序结果，对各路得分尺度不敏感。"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return [item for item, _ in sorted(scores.items(), key=lambda pair: pair[1], reverse=True)[:top_k]]
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """
+    内容寻址的大模型响应持久化缓存。
+
+    以 (模型, 温度, 完整 Prompt, 采样参数) 的哈希为键，将响应文本落盘到 SQLite，
+    支持 TTL 过期、LRU 淘汰与总容量上限。命中时完全跳过网络请求。
+    """
+
+    def __init__(self, db_path: str = "./temp_data/llm_cache.sqlite3", max_entries: int = 2000,
+                 ttl_seconds: float = 7 * 24 * 3600, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            db_path (str, optional): SQLite 缓存文件路径。
+            max_entries (int, optional): 最多保留的缓存条目数。
+            ttl_seconds (float, optional): 条目存活时长 (秒)，为 None 时永不过期。
+            max_bytes (int, optional): 缓存响应文本的总字节上限。
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at INTEGER NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed_at)")
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: list, **params) -> str:
+        """根据模型、温度、完整消息列表与其余采样参数生成缓存键。"""
+        payload = json.dumps({"model": model, "temperature": temperature, "messages": messages, "params": params},
+                             ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str:
+        """读取缓存；未命中或已过期返回 None。"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time_ns(), key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, content: str):
+        """写入缓存，并按 TTL / 条目数 / 容量上限执行淘汰。"""
+        if content is None:
+            return
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, content, size, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)", (key, content, size, now, time.time_ns()))
+                self._evict(now)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM 响应缓存写入失败: {e}")
+
+    def invalidate(self, key: str):
+        """删除指定条目 (例如缓存的代码执行失败时，避免重复回放错误答案)。"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def _evict(self, now: float):
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            row = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            count, total = count - 1, total - row[1]
+
+    def stats(self) -> dict:
+        """返回命中/未命中计数与当前缓存规模，供前端展示。"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "size_mb": round(total / 1024 / 1024, 3),
+        }
@@ -0,0 +1,164 @@
+import logging
+import os
+import re
+import shutil
+import threading
+import weakref
+
+import httpx
+from openai import OpenAI
+
+from src.core.knowledge_store import open_kb_collection, warmup_embedding_function
+from src.utils.helpers import estimate_frame_memory_mb
+
+logger = logging.getLogger(__name__)
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
+
+
+class SharedResources:
+    """
+    进程级共享资源池 (多会话并发)。
+
+    所有会话共用一个 keep-alive 的 HTTP 连接池、一个已预热的向量化模型与一个知识库向量集合；
+    会话私有的只有数据状态与临时目录 (`<temp_root>/<session_id>/`)，并发上传互不覆盖。
+    """
+
+    def __init__(self, temp_root: str = "./temp_data/sessions", kb_persist_dir: str = None,
+                 embedding_function=None, max_connections: int = 64, max_keepalive: int = 32,
+                 warmup: bool = True):
+        """
+        Args:
+            temp_root (str, optional): 会话临时目录的根目录。
+            kb_persist_dir (str, optional): 知识库向量持久化目录，为 None 时使用进程内临时库。
+            embedding_function (optional): 向量化函数，为 None 时使用 ChromaDB 默认模型。
+            max_connections (int, optional): HTTP 连接池的最大并发连接数。
+            max_keepalive (int, optional): 保持存活的空闲连接数上限。
+            warmup (bool, optional): 是否在后台线程中预热向量化模型。
+        """
+        self.temp_root = temp_root
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._sessions = weakref.WeakValueDictionary()  # session_id -> analyzer
+        self._registered = set()  # 曾经登记过的会话，用于识别已结束的会话
+        self.request_count = 0
+        self.new_connection_count = 0
+
+        # 强制直连 (不读取系统代理环境变量) + 底层重试，与单会话客户端配置一致
+        self.http_client = httpx.Client(
+            trust_env=False,
+            transport=httpx.HTTPTransport(retries=3, limits=httpx.Limits(
+                max_connections=max_connections, max_keepalive_connections=max_keepalive)),
+            event_hooks={"request": [self._count_request]},
+        )
+
+        if embedding_function is None:
+            from chromadb.utils import embedding_functions
+            embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        self.embedding_function = embedding_function
+        if warmup and embedding_function is not None:
+            warmup_embedding_function(embedding_function)
+
+        try:
+            self.chroma_client, self.kb_collection = open_kb_collection(kb_persist_dir, embedding_function)
+        except Exception as e:
+            logger.error(f"共享 ChromaDB 初始化失败: {e}")
+            self.chroma_client, self.kb_collection = None, None
+
+    def _count_request(self, request):
+        with self._lock:
+            self.request_count += 1
+        # httpcore 公开的 trace 扩展：只有新建 TCP 连接时才会触发 connect_tcp 事件，复用 keep-alive 连接时不会
+        upstream = request.extensions.get("trace")
+
+        def trace(event_name: str, info: dict):
+            if event_name == "connection.connect_tcp.complete":
+                with self._lock:
+                    self.new_connection_count += 1
+            if upstream is not None:
+                upstream(event_name, info)
+        request.extensions["trace"] = trace
+
+    def create_llm_client(self, api_key: str) -> OpenAI:
+        """为会话创建 OpenAI 客户端 (轻量对象)，底层复用共享连接池。"""
+        return OpenAI(api_key=api_key, base_url=DEEPSEEK_BASE_URL, http_client=self.http_client)
+
+    def _session_path(self, session_id: str) -> str:
+        return os.path.join(self.temp_root, re.sub(r"[^0-9A-Za-z_-]", "_", session_id))
+
+    def session_temp_dir(self, session_id: str) -> str:
+        """返回 (并创建) 会话私有的临时目录。"""
+        path = self._session_path(session_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def register_session(self, session_id: str, analyzer):
+        """登记会话分析器 (弱引用，会话结束后自动注销)，并顺带清理已结束会话的临时目录。"""
+        with self._lock:
+            self._sessions[session_id] = analyzer
+            self._registered.add(session_id)
+        self.prune_sessions()
+
+    def release_session(self, session_id: str):
+        """注销会话并删除其临时目录。"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._registered.discard(session_id)
+        shutil.rmtree(self._session_path(session_id), ignore_errors=True)
+
+    def prune_sessions(self) -> int:
+        """删除已结束会话 (登记过但分析器已被回收) 的临时目录，返回清理的目录数。"""
+        with self._lock:
+            ended = self._registered - set(self._sessions.keys())
+            self._registered -= ended
+        for session_id in ended:
+            shutil.rmtree(self._session_path(session_id), ignore_errors=True)
+        return len(ended)
+
+    def connection_stats(self) -> dict:
+        """
+        HTTP 连接池指标：连接数上限、累计请求数、新建连接数与复用已有连接的请求数。
+
+        由公开的 httpx 请求事件钩子与 httpcore trace 扩展统计，不读取连接池内部状态；
+        reused_requests 占 requests 的比例即连接复用率。
+        """
+        with self._lock:
+            requests, new_connections = self.request_count, self.new_connection_count
+        return {"max_connections": self.max_connections, "requests": requests, "new_connections": new_connections,
+                "reused_requests": max(requests - new_connections, 0)}
+
+    def session_stats(self, session_ids=None) -> dict:
+        """
+        各会话数据状态的内存占用 (MB)。需要逐个会话估算数据框大小，只应在用户主动查看时调用。
+
+        Args:
+            session_ids (iterable, optional): 只统计这些会话，为 None 时统计全部活跃会话。
+        """
+        with self._lock:
+            sessions = dict(self._sessions.items())
+        if session_ids is not None:
+            sessions = {session_id: sessions[session_id] for session_id in session_ids if session_id in sessions}
+        stats = {}
+        for session_id, analyzer in sessions.items():
+            raw, processed = analyzer.raw_data, analyzer.processed_data
+            memory = estimate_frame_memory_mb(raw)
+            if processed is not None and processed is not raw:
+                memory += estimate_frame_memory_mb(processed)
+            stats[session_id] = round(memory, 2)
+        return stats
+
+    def metrics(self, include_memory: bool = False) -> dict:
+        """
+        资源池指标。默认只返回廉价的计数类指标；include_memory=True 时才遍历会话统计内存占用。
+        """
+        with self._lock:
+            session_count = len(self._sessions)
+        metrics = {"connections": self.connection_stats(), "sessions": session_count}
+        if include_memory:
+            session_memory = self.session_stats()
+            metrics["session_memory_mb"] = session_memory
+            metrics["total_session_memory_mb"] = round(sum(session_memory.values()), 2)
+        return metrics
+
+    def close(self):
+        self.http_client.close()
@@ -0,0 +1,408 @@
+import io
+import logging
+import multiprocessing as mp
+import os
+import pickle
+import queue
+import threading
+import time
+import traceback
+import uuid
+from contextlib import redirect_stdout
+from multiprocessing import shared_memory
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # 缺少 pyarrow 时数据框退化为 pickle 写入共享内存
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# 内存看门狗触发时 worker 的退出码，父进程据此区分 OOM 与其它崩溃
+MEMORY_EXIT_CODE = 86
+
+
+class SandboxError(RuntimeError):
+    """进程池沙箱执行失败的基类。"""
+
+
+class SandboxTimeoutError(SandboxError):
+    """生成代码超过墙钟时间上限。"""
+
+
+class SandboxMemoryError(SandboxError):
+    """生成代码超过常驻内存 (RSS) 上限。"""
+
+
+class SandboxExecutionError(SandboxError):
+    """生成代码在 worker 中抛出异常，消息中携带 worker 端完整 Traceback。"""
+
+
+def _current_rss_bytes() -> int:
+    """读取当前进程常驻内存；非 Linux 平台退化为历史峰值。"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def _reset_peak_rss() -> bool:
+    """将进程的 RSS 峰值 (VmHWM) 重置为当前值，使随后读取的峰值只反映本次执行；仅 Linux 支持。"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes() -> int:
+    """读取进程 RSS 峰值 (VmHWM)；不可用时退化为当前常驻内存。"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return _current_rss_bytes()
+
+
+class RssSampler:
+    """
+    在一次执行期间按固定间隔采样当前进程 RSS，记录本次执行内的峰值。
+
+    用于进程内执行：不重置进程级的 VmHWM，不会干扰同一进程中其它线程 (其它会话) 的峰值统计。
+    """
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak_bytes = _current_rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, _current_rss_bytes())
+        return False
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, _current_rss_bytes())
+
+
+def _write_shared(payload: bytes, name: str = None) -> tuple[shared_memory.SharedMemory, int]:
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(len(payload), 1))
+    shm.buf[:len(payload)] = payload
+    return shm, len(payload)
+
+
+def _write_arrow_shared(df: pd.DataFrame, name: str = None) -> tuple[shared_memory.SharedMemory, int]:
+    """将数据框以 Arrow IPC 流格式直接序列化进共享内存段 (先测算大小，避免中间缓冲区拷贝)。"""
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    mock = pa.MockOutputStream()
+    with pa.ipc.new_stream(mock, table.schema) as writer:
+        writer.write_table(table)
+    size = mock.size()
+
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(size, 1))
+    target = pa.py_buffer(shm.buf)
+    try:
+        with pa.ipc.new_stream(pa.FixedSizeBufferWriter(target), table.schema) as writer:
+            writer.write_table(table)
+    finally:
+        del target
+    return shm, size
+
+
+def export_frame(df: pd.DataFrame, name: str = None) -> tuple[dict, shared_memory.SharedMemory]:
+    """
+    将数据框写入共享内存段，返回可跨进程传递的描述符。
+
+    优先使用 Arrow IPC 格式；遇到 Arrow 无法表达的混合类型列时退化为 pickle (protocol 5)。
+    name 为 None 时由系统随机命名；指定 name 便于创建方之外的进程在异常时按名回收。
+    """
+    if pa is not None:
+        try:
+            shm, size = _write_arrow_shared(df, name)
+            return {"kind": "arrow", "name": shm.name, "size": size}, shm
+        except (pa.ArrowException, TypeError, ValueError):
+            pass
+
+    shm, size = _write_shared(pickle.dumps(df, protocol=5), name)
+    return {"kind": "pickle", "name": shm.name, "size": size}, shm
+
+
+def import_frame(desc: dict) -> pd.DataFrame:
+    """根据描述符从共享内存段读回数据框 (读取后立即释放映射)。"""
+    shm = shared_memory.SharedMemory(name=desc["name"])
+    try:
+        view = shm.buf[:desc["size"]]
+        try:
+            if desc["kind"] == "arrow":
+                # 先整段 memcpy 出共享内存：to_pandas 可能零拷贝引用底层缓冲区，直接引用会导致映射无法释放
+                return pa.ipc.open_stream(pa.py_buffer(bytes(view))).read_all().to_pandas()
+            return pickle.loads(view)
+        finally:
+            view.release()
+    finally:
+        shm.close()
+
+
+def _encode_output(value, name: str) -> tuple[dict, shared_memory.SharedMemory]:
+    """worker 端输出编码：数据框写入父进程指定名称的共享内存段，其余对象直接随消息 pickle。"""
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+    if isinstance(value, pd.DataFrame):
+        return export_frame(value, name)
+    return {"kind": "object", "value": value}, None
+
+
+def _decode_output(desc: dict):
+    if desc is None:
+        return None
+    if desc["kind"] == "object":
+        return desc["value"]
+    try:
+        return import_frame(desc)
+    finally:
+        _unlink_quietly(desc["name"])
+
+
+def _unlink_quietly(name: str):
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+        shm.close()
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _memory_watchdog(limit_bytes: int, interval: float = 0.05):
+    """worker 内的 RSS 看门狗：超过上限立即终止进程 (父进程负责拉起新 worker)。"""
+    while True:
+        if _current_rss_bytes() > limit_bytes:
+            os._exit(MEMORY_EXIT_CODE)
+        time.sleep(interval)
+
+
+def _worker_main(conn, memory_limit_mb: float):
+    """常驻 worker 主循环：预热重型依赖后阻塞等待执行任务。"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    if memory_limit_mb:
+        threading.Thread(target=_memory_watchdog, args=(int(memory_limit_mb * 1024 * 1024),), daemon=True).start()
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        code_str, frame_descs, output_names = task
+        output_shms = []
+        stdout = io.StringIO()
+        try:
+            imported = {}
+
+            def load(desc):
+                # 同一数据框 (如工作表变量与 sheets 字典中的同一张表) 只从共享内存读取一次
+                if desc["name"] not in imported:
+                    imported[desc["name"]] = import_frame(desc)
+                return imported[desc["name"]]
+
+            local_vars = {name: {key: load(item) for key, item in desc["items"].items()} if desc["kind"] == "group"
+                          else load(desc) for name, desc in frame_descs.items()}
+            local_vars.update({'pd': pd, 'np': np, 'plt': plt, 'update_df': None, 'result_df': None, 'fig': None})
+
+            plt.close('all')
+            _reset_peak_rss()
+            with redirect_stdout(stdout):
+                exec(code_str, {}, local_vars)
+
+            output_fig = local_vars.get('fig')
+            if output_fig is None and plt.gcf().get_axes():
+                output_fig = plt.gcf()
+
+            outputs = {}
+            for key in ('result_df', 'update_df'):
+                value = local_vars.get(key)
+                if value is None:
+                    outputs[key] = None
+                    continue
+                desc, shm = _encode_output(value, output_names[key])
+                outputs[key] = desc
+                if shm is not None:
+                    output_shms.append(shm)
+
+            reply = {
+                "ok": True,
+                "stdout": stdout.getvalue(),
+                "fig": pickle.dumps(output_fig) if output_fig is not None else None,
+                "peak_rss_mb": round(_peak_rss_bytes() / 1024 / 1024, 1),
+                **outputs,
+            }
+        except Exception as e:
+            reply = {"ok": False, "stdout": stdout.getvalue(), "error": f"{type(e).__name__}: {e}",
+                     "traceback": traceback.format_exc()}
+
+        conn.send(reply)
+        # 输出段的所有权移交父进程 (由父进程 unlink)，worker 只关闭自己的映射
+        for shm in output_shms:
+            shm.close()
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+
+
+class SandboxPool:
+    """
+    预热的多进程沙箱池。
+
+    每个 worker 预先导入 pandas / numpy / matplotlib，数据框通过共享内存 (Arrow IPC) 传递；
+    每次执行受墙钟时间与 RSS 上限约束，超限的 worker 会被终止并由新 worker 替换，
+    主进程 (Streamlit 服务) 不会被失控代码阻塞。
+    """
+
+    def __init__(self, size: int = 2, timeout_s: float = 60, memory_limit_mb: float = 2048,
+                 start_method: str = "spawn"):
+        """
+        Args:
+            size (int, optional): 常驻 worker 数量。
+            timeout_s (float, optional): 单次执行的墙钟时间上限 (秒)。
+            memory_limit_mb (float, optional): worker 常驻内存上限 (MB)，为 None 时不限制。
+            start_method (str, optional): multiprocessing 启动方式，默认 spawn 以避免 fork 继承锁状态。
+        """
+        self.size = size
+        self.timeout_s = timeout_s
+        self.memory_limit_mb = memory_limit_mb
+        self._ctx = mp.get_context(start_method)
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn, self.memory_limit_mb), daemon=True)
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn)
+
+    def _retire(self, worker: _Worker) -> _Worker:
+        """终止异常 worker (已死亡、超时或管道中可能残留未读回复) 并补充一个新的。"""
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=5)
+        worker.conn.close()
+        return self._spawn()
+
+    def run(self, code_str: str, frames: dict) -> dict:
+        """
+        在空闲 worker 中执行生成代码。
+
+        Args:
+            code_str (str): 已通过 AST 扫描的代码。
+            frames (dict): 注入沙箱的变量名 -> 数据框 (或 键 -> 数据框 的字典，如多工作表的 `sheets`)。
+
+        Returns:
+            dict: 与进程内沙箱一致的输出，包含 result_df / update_df / fig / stdout / peak_rss_mb。
+
+        Raises:
+            SandboxTimeoutError: 超过墙钟时间上限。
+            SandboxMemoryError: 超过 RSS 上限。
+            SandboxExecutionError: 生成代码自身抛出异常。
+        """
+        if self._closed:
+            raise SandboxError("沙箱进程池已关闭")
+
+        worker = self._idle.get()
+        if not worker.process.is_alive():  # 空闲期间意外退出的 worker 直接替换
+            worker = self._retire(worker)
+        input_shms = []
+        # 输出段由父进程预先命名：worker 被强制终止时，父进程仍能按名回收它已经创建的段
+        token = uuid.uuid4().hex[:16]
+        output_names = {"result_df": f"sbx{token}_r", "update_df": f"sbx{token}_u"}
+        # 任务发出后，只有收到回复的 worker 才可复用 (进程存活且管道中没有残留消息)
+        reusable = True
+        try:
+            exported = {}
+
+            def export(df):
+                if id(df) not in exported:
+                    exported[id(df)], shm = export_frame(df)
+                    input_shms.append(shm)
+                return exported[id(df)]
+
+            descs = {name: {"kind": "group", "items": {key: export(df) for key, df in value.items()}}
+                     if isinstance(value, dict) else export(value) for name, value in frames.items()}
+
+            reusable = False
+            worker.conn.send((code_str, descs, output_names))
+            if not worker.conn.poll(self.timeout_s):
+                raise SandboxTimeoutError(f"代码执行超过 {self.timeout_s} 秒墙钟时间上限，已强制终止。")
+
+            try:
+                reply = worker.conn.recv()
+            except (EOFError, OSError):
+                worker.process.join(timeout=5)
+                exitcode = worker.process.exitcode
+                if exitcode == MEMORY_EXIT_CODE:
+                    raise SandboxMemoryError(f"代码执行超过 {self.memory_limit_mb} MB 内存上限，已强制终止。")
+                raise SandboxError(f"沙箱进程异常退出 (exitcode={exitcode})")
+            reusable = True
+
+            if not reply["ok"]:
+                raise SandboxExecutionError(f"{reply['error']}\n[沙箱进程 Traceback]\n{reply['traceback']}")
+
+            return {
+                "result_df": _decode_output(reply["result_df"]),
+                "update_df": _decode_output(reply["update_df"]),
+                "fig": pickle.loads(reply["fig"]) if reply["fig"] is not None else None,
+                "stdout": reply["stdout"],
+                "peak_rss_mb": reply["peak_rss_mb"],
+            }
+        finally:
+            for shm in input_shms:
+                shm.close()
+                shm.unlink()
+            if not reusable or not worker.process.is_alive():
+                worker = self._retire(worker)
+            # 正常路径下输出段已在解码时回收；超时 / 崩溃 / 编码失败时在此按名清理 worker 遗留的段
+            for name in output_names.values():
+                _unlink_quietly(name)
+            self._idle.put(worker)
+
+    def close(self):
+        """通知所有 worker 退出并回收进程。"""
+        self._closed = True
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            try:
+                worker.conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+            worker.conn.close()
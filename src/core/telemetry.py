@@ -0,0 +1,274 @@
+"""
+Agent 链路的分阶段追踪与指标。
+
+- `Tracer`: 每个会话一个，按轮次 (turn) 收集各阶段 span (路由 / RAG / 提示词构建 / 代码生成 / 沙箱执行 / 渲染)，
+  轮次结束时输出一行结构化 JSON 日志，并保留最近若干轮供前端展示耗时拆解。
+- `MetricsRegistry`: 进程级汇总 (阶段耗时直方图、token 用量、重试次数、沙箱峰值内存)，
+  可渲染为 Prometheus 文本格式，由任务队列服务的 /metrics 或独立的指标端口暴露。
+"""
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# 阶段耗时直方图的分桶上界 (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_FIELDS = ("prompt_tokens", "completion_tokens")
+
+
+class MetricsRegistry:
+    """线程安全的进程级指标汇总。"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}  # stage -> [各桶计数..., 总和, 总数]
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}  # (name, labels) -> value
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            hist = self._histograms.setdefault(stage, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_max(self, name: str, value: float, **labels):
+        """仅当新值更大时更新仪表值 (用于记录历史峰值)。"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = max(self._gauges.get(key, value), value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {stage: {"count": hist[-1], "sum_s": round(hist[-2], 4)}
+                           for stage, hist in self._histograms.items()},
+                "counters": {_series(name, labels): value for (name, labels), value in self._counters.items()},
+                "gauges": {_series(name, labels): value for (name, labels), value in self._gauges.items()},
+            }
+
+    def render_prometheus(self, prefix: str = "afa") -> str:
+        """渲染为 Prometheus 文本暴露格式。"""
+        lines = [f"# TYPE {prefix}_stage_duration_seconds histogram"]
+        with self._lock:
+            for stage, hist in sorted(self._histograms.items()):
+                for bound, count in zip(self.buckets, hist):
+                    lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {hist[-1]}')
+                lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{stage}"}} {hist[-2]:.6f}')
+                lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{stage}"}} {hist[-1]}')
+            for kind, series in (("counter", self._counters), ("gauge", self._gauges)):
+                declared = set()
+                for (name, labels), value in sorted(series.items()):
+                    if name not in declared:
+                        lines.append(f"# TYPE {prefix}_{name} {kind}")
+                        declared.add(name)
+                    lines.append(f"{prefix}_{_series(name, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _series(name: str, labels: tuple) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+METRICS = MetricsRegistry()
+
+
+class TurnTrace:
+    """一轮对话的追踪记录。"""
+
+    def __init__(self, query: str, session_id: str = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.session_id = session_id
+        self.query = query
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration_s = None
+        self.spans = []
+        self.attrs = {"attempts": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def elapsed_s(self) -> float:
+        return round(self.duration_s if self.duration_s is not None else time.perf_counter() - self._start, 4)
+
+    def breakdown(self) -> dict:
+        """按阶段汇总耗时 (秒)；并发执行的阶段 (元信息 / 路由 / RAG) 在时间上会重叠。"""
+        totals = {}
+        for span in self.spans:
+            totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration_s"]
+        return {name: round(seconds, 4) for name, seconds in totals.items()}
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace_id, "session_id": self.session_id, "query": self.query,
+                "started_at": self.started_at, "duration_s": self.duration_s, **self.attrs,
+                "breakdown": self.breakdown(), "spans": self.spans}
+
+
+class Tracer:
+    """会话级追踪器：span 可以在任意线程中记录 (预执行流水线与并行候选都在线程池中运行)。"""
+
+    def __init__(self, session_id: str = None, registry: MetricsRegistry = METRICS, log_path: str = None,
+                 max_traces: int = 20):
+        """
+        Args:
+            session_id (str, optional): 写入日志的会话 id。
+            registry (MetricsRegistry, optional): 汇总指标的注册表，默认使用进程级注册表。
+            log_path (str, optional): 额外写入的 JSONL 文件路径 (每轮一行)。
+            max_traces (int, optional): 内存中保留的最近轮次数。
+        """
+        self.session_id = session_id
+        self.registry = registry
+        self.log_path = log_path
+        self.current = None
+        self.history = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    def start_turn(self, query: str) -> TurnTrace:
+        self.current = TurnTrace(query, self.session_id)
+        return self.current
+
+    def end_turn(self, **attrs) -> dict:
+        """结束当前轮次：输出 JSON 日志并记入历史，返回该轮的追踪字典。"""
+        trace = self.current
+        if trace is None:
+            return None
+        self.current = None
+        trace.duration_s = round(time.perf_counter() - trace._start, 4)
+        trace.attrs.update(attrs)
+        self.history.append(trace)
+        if self.registry is not None:
+            self.registry.observe("turn", trace.duration_s)
+            self.registry.inc("turns_total", status=trace.attrs.get("status", "unknown"))
+
+        record = trace.to_dict()
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        logger.info(line)
+        if self.log_path:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                logger.warning(f"追踪日志写入失败: {e}")
+        return record
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        记录一个阶段的耗时；调用方可在 with 块内向返回的字典追加属性 (如 token 用量、峰值内存)。
+
+        不在任何轮次内时只汇总到指标注册表。
+        """
+        trace = self.current
+        start = time.perf_counter()
+        try:
+            yield attrs
+        except Exception as e:
+            attrs["error"] = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self._finish_span(trace, name, start, duration, attrs)
+
+    def record(self, name: str, duration_s: float, **attrs):
+        """记录一个已在外部计时的阶段。"""
+        self._finish_span(self.current, name, time.perf_counter() - duration_s, duration_s, attrs)
+
+    def _finish_span(self, trace, name: str, start: float, duration: float, attrs: dict):
+        if self.registry is not None:
+            self.registry.observe(name, duration)
+            for field in TOKEN_FIELDS:
+                if attrs.get(field):
+                    self.registry.inc("llm_tokens_total", attrs[field], kind=field.split("_")[0], stage=name)
+            if "peak_rss_mb" in attrs and attrs["peak_rss_mb"] is not None:
+                self.registry.set_max("sandbox_peak_rss_mb", attrs["peak_rss_mb"])
+        if trace is None:
+            return
+        span = {"name": name, "offset_s": round(start - trace._start, 4), "duration_s": round(duration, 4), **attrs}
+        with self._lock:
+            trace.spans.append(span)
+            for field in TOKEN_FIELDS:
+                trace.attrs[field] += attrs.get(field) or 0
+            if "peak_rss_mb" in attrs and attrs["peak_rss_mb"] is not None:
+                trace.attrs["sandbox_peak_rss_mb"] = max(trace.attrs.get("sandbox_peak_rss_mb", 0), attrs["peak_rss_mb"])
+
+    def count_attempt(self, kind: str = "serial"):
+        """记录一次代码生成尝试 (串行重试或并行候选)。"""
+        if self.registry is not None:
+            self.registry.inc("codegen_attempts_total", kind=kind)
+        trace = self.current
+        if trace is not None:
+            with self._lock:
+                trace.attrs["attempts"] += 1
+
+
+def usage_attrs(response) -> dict:
+    """
+    从 OpenAI 响应 (或流式响应的最后一个分块) 中提取 token 用量；接口未返回时为空字典。
+
+    旧版 SDK 的分块模型没有 usage 字段，经 extra_body 请求到的 usage 以字典形式保留在分块上。
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    attrs = {}
+    for field in TOKEN_FIELDS:
+        value = usage.get(field) if isinstance(usage, dict) else getattr(usage, field, None)
+        if isinstance(value, int):
+            attrs[field] = value
+    return attrs
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    按字符粗略估算 token 数 (中文约 0.6 token/字，其余约 0.3 token/字符)。
+
+    用于流式接收被提前断开、接口来不及返回 usage 的场景，避免 token 指标记为 0。
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    return max(1, math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3))
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1", registry: MetricsRegistry = METRICS):
+    """
+    在后台线程中启动只读的 /metrics 端点 (Prometheus 文本格式)，返回 HTTPServer 实例。
+
+    默认只监听本机回环地址；需要被其它主机抓取时显式传入 host (如 "0.0.0.0")。
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"指标端点已启动: http://{host}:{server.server_address[1]}/metrics")
+    return server
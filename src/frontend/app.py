@@ -1,33 +1,214 @@
 import streamlit as st
 import os
-from io import BytesIO
+import uuid
 from src.core.analyzer import AIDrivenFormAnalyzer
-from src.utils.helpers import set_chinese_font, make_dataframe_safe_for_ui
+from src.core.resource_pool import SharedResources
+from src.core.llm_cache import LLMResponseCache
+from src.core.sandbox_pool import SandboxPool
+from src.core.telemetry import METRICS, start_metrics_server, usage_attrs
+from src.utils.export_cache import EXPORT_FORMATS, ExportCache, export_dataframe, export_figure
+from src.utils.history_store import ChatHistoryStore
+from src.utils.helpers import set_chinese_font, make_dataframe_safe_for_ui, DataFramePager, estimate_frame_memory_mb
+
+
+@st.cache_resource
+def get_llm_cache() -> LLMResponseCache:
+    """进程级共享的大模型响应缓存 (所有会话共用同一份磁盘缓存)。"""
+    return LLMResponseCache(db_path="./temp_data/llm_cache.sqlite3")
+
+
+@st.cache_resource
+def get_sandbox_pool() -> SandboxPool:
+    """进程级共享的预热沙箱进程池 (单次执行限时 60 秒、内存上限 2GB)。"""
+    return SandboxPool(size=2, timeout_s=60, memory_limit_mb=2048)
+
+
+@st.cache_resource
+def get_shared_resources() -> SharedResources:
+    """
+    进程级共享资源池：keep-alive HTTP 连接池、后台预热的向量化模型与持久化知识库集合，
+    所有会话共用；会话的数据与临时文件位于各自独立的目录。
+    """
+    return SharedResources(temp_root="./temp_data/sessions", kb_persist_dir="./temp_data/chroma_kb")
+
+
+@st.cache_resource
+def get_metrics_server():
+    """
+    设置了环境变量 AFA_METRICS_PORT 时，在该端口暴露 Prometheus 文本格式的 /metrics 端点 (进程内只启动一次)。
+
+    默认只监听 127.0.0.1，需要对外暴露时通过 AFA_METRICS_HOST 指定监听地址。
+    """
+    port = os.environ.get("AFA_METRICS_PORT")
+    return start_metrics_server(int(port), os.environ.get("AFA_METRICS_HOST", "127.0.0.1")) if port else None
+
+
+# 耗时拆解面板展示的阶段 (按链路顺序)
+LATENCY_STAGES = {"metadata": "元信息", "router_fast": "快车道路由", "router_llm": "LLM 路由", "rag": "RAG 检索",
+                  "preprocess": "预处理", "prompt_build": "提示词构建", "codegen_llm": "代码生成",
+                  "sandbox_exec": "沙箱执行", "chat_llm": "对话生成", "render": "渲染"}
+
+
+def render_latency_panel(metric_slot, detail_slot, trace):
+    """在指标行旁实时展示本轮耗时、token 用量与各阶段耗时拆解。"""
+    attrs = trace.attrs
+    metric_slot.metric("本轮耗时", f"{trace.elapsed_s():.2f}s",
+                       delta=f"{attrs['attempts']} 次生成" if attrs["attempts"] else None, delta_color="off")
+    breakdown = trace.breakdown()
+    rows = [f"{label} {breakdown[stage] * 1000:.0f}ms" for stage, label in LATENCY_STAGES.items() if stage in breakdown]
+    tokens = attrs["prompt_tokens"] + attrs["completion_tokens"]
+    extra = [f"tokens {attrs['prompt_tokens']}+{attrs['completion_tokens']}" if tokens else None,
+             f"沙箱峰值 {attrs['sandbox_peak_rss_mb']} MB" if attrs.get("sandbox_peak_rss_mb") else None]
+    detail_slot.caption("⏱️ " + " | ".join(rows + [item for item in extra if item]))
+
+
+def render_paged_dataframe(df, data_key: str, height: int = 300, paginate: bool = True):
+    """
+    分页渲染大表：只转换并传输当前页，转换结果按数据版本缓存，同时展示总行数与内存占用。
+
+    `paginate=False` 时只展示首页 (用于一次性渲染的区域，翻页控件触发的重绘不会再次进入该区域)。
+    """
+    pager = st.session_state.df_pager
+    page_count = pager.page_count(df)
+    page = 0
+    if paginate and page_count > 1:
+        page = st.number_input(f"页码 (共 {page_count} 页，每页 {pager.page_size} 行)", min_value=1,
+                               max_value=page_count, value=1, key=f"page_{data_key}") - 1
+    st.dataframe(pager.get_page(df, data_key, page), height=height)
+    st.caption(f"当前总行数: {len(df)} 行 | 内存约 {estimate_frame_memory_mb(df)} MB")
+
+
+def render_version_control(analyzer):
+    """底表版本控制：撤销 / 重做只移动版本指针 (不重新解析文件)，并展示版本历史与当前版本底表。"""
+    versions = analyzer.versions
+    undo_col, redo_col, info_col = st.columns([1, 1, 3])
+    if undo_col.button("↩️ 撤销", disabled=not versions.can_undo, use_container_width=True):
+        analyzer.undo_data()
+        st.rerun()
+    if redo_col.button("↪️ 重做", disabled=not versions.can_redo, use_container_width=True):
+        analyzer.redo_data()
+        st.rerun()
+    stats = versions.stats()
+    info_col.caption(f"🗂️ 底表版本 {stats['position'] + 1}/{stats['versions']} | 内存 {stats['memory_mb']} MB | "
+                     f"已落盘 {stats['spilled_mb']} MB")
+
+    if stats["versions"] > 1:
+        with st.expander("🕘 底表版本历史", expanded=False):
+            for record in reversed(versions.history()):
+                rows, cols = record["shape"]
+                st.caption(f"{'👉 ' if record['current'] else ''}`{record['id'][:8]}` {record['label'] or '未命名版本'}"
+                           f" | {rows} 行 × {cols} 列 | 与上一版本共享 {record['shared_columns']} 列"
+                           f"{' | 💾 部分列已落盘' if record['spilled'] else ''}")
+            if analyzer.processed_data is not None:
+                render_paged_dataframe(analyzer.processed_data, f"version_{analyzer.version_id}")
+
+
+def build_export(history, msg, fmt: str) -> bytes:
+    """从落盘的对话历史中读回结果并生成导出字节。"""
+    if msg["type"] == "dataframe":
+        return export_dataframe(history.load(msg), fmt)
+    return export_figure(history.load_figure(msg), dpi=300)
+
+
+def render_export_center(history, max_items: int = 5):
+    """
+    导出中心：最近的表格 / 图表结果按需生成下载文件。
+
+    只有点击"生成"后才会格式化导出产物，生成的字节按 (结果, 格式) 缓存，后续重绘直接复用；
+    未被请求的格式永远不会生成。
+    """
+    artifacts = [msg for msg in history if msg["type"] in ("dataframe", "plot") and "ref" in msg][-max_items:]
+    if not artifacts:
+        return
+    cache = st.session_state.export_cache
+    with st.expander("📥 导出中心 (按需生成)", expanded=False):
+        for msg in reversed(artifacts):
+            ref = msg["ref"]
+            cols = st.columns([2, 1, 1])
+            if msg["type"] == "dataframe":
+                cols[0].caption(f"📊 数据表 ({msg['shape'][0]} 行 × {msg['shape'][1]} 列)")
+                fmt = cols[1].selectbox("格式", ["csv", "csv.gz", "parquet"], key=f"fmt_{ref}",
+                                        label_visibility="collapsed")
+            else:
+                cols[0].caption("📈 图表 (300 dpi)")
+                fmt = "png"
 
+            data = cache.get(ref, fmt)
+            if data is None and cols[2].button("生成", key=f"gen_{ref}_{fmt}"):
+                with st.spinner("正在生成导出文件..."):
+                    data = cache.get_or_create(ref, fmt, lambda: build_export(history, msg, fmt))
+            if data is not None:
+                suffix, mime = EXPORT_FORMATS[fmt]
+                cols[2].download_button("下载", data=data, file_name=f"agent_{msg['type']}_{ref[:8]}{suffix}",
+                                        mime=mime, key=f"dl_{ref}_{fmt}")
 
 
 def main():
     set_chinese_font()
 
     st.set_page_config(page_title="智能表单分析系统", page_icon="📊", layout="wide")
+    # 缓存资源的首次构建会渲染加载提示，必须放在 set_page_config 之后
+    resources = get_shared_resources()
+    get_metrics_server()
     st.title("📊 智能表单分析系统 (企业开源版)")
 
-    # 状态初始化
+    # 状态初始化 (会话 id 决定会话私有的临时目录)
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
     for key in ['analyzer', 'api_key', 'chat_history', 'data_file_path']:
         if key not in st.session_state:
             st.session_state[key] = None if key in ['analyzer', 'data_file_path'] else (
-                [] if key == 'chat_history' else "")
+                ChatHistoryStore(
+                    spill_dir=os.path.join(resources.session_temp_dir(st.session_state.session_id), "history"),
+                    memory_budget_mb=64) if key == 'chat_history' else "")
+    if 'df_pager' not in st.session_state:
+        st.session_state.df_pager = DataFramePager(page_size=500)
+    if 'export_cache' not in st.session_state:
+        st.session_state.export_cache = ExportCache()
 
     with st.sidebar:
         st.header("⚙️ 引擎设置")
         api_key = st.text_input("DeepSeek API 密钥", type="password", value=st.session_state.api_key)
         if api_key: st.session_state.api_key = api_key
 
+        chunked_ingest = st.toggle("🧱 大文件流式加载 (分块读取 + 类型降精度)", value=False)
+        ingest_limit_mb = st.number_input("加载内存上限 (MB，0 表示不限制)", min_value=0, value=0, step=256,
+                                          disabled=not chunked_ingest)
+        sheet_mode = st.selectbox("📑 多工作表 Excel", ["all", "lazy", "first"],
+                                  format_func={"all": "并行读取全部工作表", "lazy": "按需加载 (代码引用时读取)",
+                                               "first": "仅首个工作表"}.get)
+        lazy_engine = st.toggle("🦆 惰性执行引擎 (DuckDB，适用于超出内存的大表)", value=False,
+                                help="底表以列式文件交给 DuckDB 查询，只有结果表会载入内存；需要安装 duckdb。")
+        isolated_sandbox = st.toggle("🧪 进程池隔离沙箱 (限时 + 限内存)", value=True,
+                                     help="惰性执行引擎下生成代码始终在当前进程内执行。")
+        num_candidates = st.slider("🎲 并行候选代码数 (1 为串行重试)", min_value=1, max_value=4, value=1,
+                                   help="并发生成多份候选代码，取最先成功者；延迟更低，但 LLM 调用成本成倍增加。"
+                                        "开启进程池隔离沙箱时候选代码在 worker 中并行执行；否则沙箱执行在进程内串行，"
+                                        "只有 LLM 请求是并发的。")
+
         if st.button("🔄 清空上下文记忆"):
             if st.session_state.analyzer:
                 st.session_state.analyzer.last_executed_code = ""
             st.success("对话与代码记忆已清空！")
 
+        if st.session_state.analyzer:
+            stats = st.session_state.analyzer.router_stats
+            st.caption(f"🚦 路由快车道命中 {stats['fast_path']} 次 | LLM 路由 {stats['llm']} 次")
+            cache_stats = get_llm_cache().stats()
+            st.caption(f"🗄️ LLM 响应缓存：命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']} "
+                       f"(命中率 {cache_stats['hit_rate']:.0%}，{cache_stats['entries']} 条)")
+
+        pool_metrics = resources.metrics()
+        conn = pool_metrics["connections"]
+        st.caption(f"🔌 共享连接池：上限 {conn['max_connections']} 连接 | 累计请求 {conn['requests']} 次"
+                   f" (新建连接 {conn['new_connections']} / 复用 {conn['reused_requests']}) | "
+                   f"👥 活跃会话 {pool_metrics['sessions']} 个")
+        # 会话内存需要逐个估算数据框，只在点击时统计，避免每次重绘都遍历全部会话
+        if st.button("📊 统计会话内存"):
+            pool_metrics = resources.metrics(include_memory=True)
+            st.caption(f"会话数据共占 {pool_metrics['total_session_memory_mb']} MB"
+                       f" | 本会话 {pool_metrics['session_memory_mb'].get(st.session_state.session_id, 0)} MB")
+
         st.markdown("---")
         st.info("架构特性：防腐层隔离 | 智能路由 | 沙箱执行 | 全量兜底")
 
@@ -51,33 +232,66 @@ def main():
         # 引擎初始化
         if (kb_file or uploaded_file) and st.session_state.api_key:
             if not st.session_state.analyzer:
-                st.session_state.analyzer = AIDrivenFormAnalyzer(api_key=st.session_state.api_key)
+                st.session_state.analyzer = AIDrivenFormAnalyzer(api_key=st.session_state.api_key,
+                                                                 llm_cache=get_llm_cache(),
+                                                                 resources=resources,
+                                                                 session_id=st.session_state.session_id)
+                st.session_state.analyzer.stream_codegen = True
+                st.session_state.analyzer.tracer.log_path = os.path.join(
+                    resources.session_temp_dir(st.session_state.session_id), "traces.jsonl")
 
             if kb_file and ('loaded_kb' not in st.session_state or st.session_state.loaded_kb != kb_file.name):
-                with st.spinner("🧠 注入企业知识..."):
-                    success, msg = st.session_state.analyzer.load_custom_knowledge(kb_file)
-                    if success: st.session_state.loaded_kb = kb_file.name
-                    st.toast(msg)
+                kb_progress = st.progress(0.0, text="🧠 注入企业知识...")
+                success, msg = st.session_state.analyzer.load_custom_knowledge(
+                    kb_file,
+                    progress_callback=lambda done, total: kb_progress.progress(
+                        done / total, text=f"🧠 注入企业知识... {done}/{total}"))
+                kb_progress.empty()
+                if success: st.session_state.loaded_kb = kb_file.name
+                st.toast(msg)
 
             if uploaded_file and (
                     'loaded_data' not in st.session_state or st.session_state.loaded_data != uploaded_file.name):
+                analyzer = st.session_state.analyzer
+                analyzer.ingest_mode = "chunked" if chunked_ingest else "standard"
+                analyzer.ingest_memory_limit_mb = ingest_limit_mb or None
+                analyzer.excel_sheet_mode = sheet_mode
+                analyzer.execution_engine = "duckdb" if lazy_engine else "pandas"
                 with st.spinner("📊 数据落盘防腐中..."):
-                    st.session_state.data_file_path = st.session_state.analyzer.load_data(uploaded_file)
-                    st.session_state.loaded_data = uploaded_file.name
-
-        # 数据防腐 UI 呈现：使用智能安全转换，解除 5 行封印，使用 height 滚动条
+                    try:
+                        st.session_state.data_file_path = analyzer.load_data(uploaded_file)
+                        st.session_state.loaded_data = uploaded_file.name
+                        if chunked_ingest and analyzer.last_ingest_stats:
+                            stats = analyzer.last_ingest_stats
+                            st.toast(f"分块加载 {stats['rows']} 行 | 峰值内存 {stats['peak_memory_mb']} MB | "
+                                     f"{stats['rows_per_sec']:.0f} 行/秒")
+                        if analyzer.sheets is not None:
+                            st.toast(f"📑 工作簿共 {len(analyzer.sheets)} 个工作表，已加载 "
+                                     f"{len(analyzer.sheets.loaded_names)} 个")
+                        if analyzer.lazy_table is not None:
+                            st.toast(f"🦆 惰性引擎已挂载 {len(analyzer.lazy_table)} 行，内存中仅保留前 "
+                                     f"{len(analyzer.raw_data)} 行预览")
+                    except (MemoryError, ImportError) as e:
+                        st.error(f"❌ {e}")
+
+        if st.session_state.analyzer:
+            st.session_state.analyzer.sandbox_pool = get_sandbox_pool() if isolated_sandbox else None
+
+        # 数据防腐 UI 呈现：分页窗口化转换，每次重绘只处理当前页，转换结果按数据版本缓存
         if st.session_state.analyzer and st.session_state.analyzer.raw_data is not None:
             with st.expander("👀 原始数据抽样 (防腐保护生效中)", expanded=True):
-                # 传入全量数据，让前端用滚动条展示，不再切断数据
-                safe_df = make_dataframe_safe_for_ui(st.session_state.analyzer.raw_data)
-                st.dataframe(safe_df, height=300)
-                st.caption(f"当前总行数: {len(st.session_state.analyzer.raw_data)} 行")
+                analyzer = st.session_state.analyzer
+                render_paged_dataframe(analyzer.raw_data, f"raw_{analyzer.versions.root_id}")
+            render_version_control(analyzer)
 
     with col2:
         # 修复历史记录的 UI 排版
         popover = st.popover("📜 展开历史记录", use_container_width=True)
         with popover:
-            for msg in st.session_state.chat_history:
+            history = st.session_state.chat_history
+            # 弹窗内容每次重绘都会执行：表格与图表已落盘，只有展开时才按需从磁盘加载
+            show_artifacts = st.toggle("加载历史表格与图表", value=False)
+            for msg in history:
                 with st.chat_message(msg["role"]):
                     if msg["type"] == "text":
                         st.markdown(msg["content"])
@@ -85,10 +299,22 @@ def main():
                         with st.expander("👨‍💻 查看底层执行代码"):
                             st.code(msg["content"], language="python")
                     elif msg["type"] == "dataframe":
-                        # 历史记录里展示前 5 行即可，避免弹窗过长卡顿
-                        st.dataframe(make_dataframe_safe_for_ui(msg["content"].head(5)))
+                        if not show_artifacts:
+                            st.caption(f"📊 数据表 ({msg['shape'][0]} 行 × {msg['shape'][1]} 列)" if "shape" in msg
+                                       else "📊 数据表")
+                        else:
+                            # 历史记录里展示前 5 行即可，避免弹窗过长卡顿
+                            st.dataframe(make_dataframe_safe_for_ui(history.load(msg).head(5)))
                     elif msg["type"] == "plot":
-                        st.pyplot(msg["content"])
+                        if not show_artifacts:
+                            st.caption("📈 图表")
+                        else:
+                            content = history.load(msg)
+                            if isinstance(content, bytes):
+                                st.image(content)
+                            else:  # 落盘失败时退回内存保存的 Figure
+                                st.pyplot(content)
+            st.caption(f"历史缓存占用 {history.memory_usage_mb()} MB | 磁盘重载 {history.reloads} 次")
 
         st.subheader("2. 交互终端")
         query = st.text_area("输入您的分析需求...")
@@ -102,18 +328,21 @@ def main():
                 recent = [m for m in st.session_state.chat_history[:-1] if m["type"] == "text"][-6:]
                 chat_context = "\n".join([f"{m['role']}: {m['content']}" for m in recent])
 
+            tracer = st.session_state.analyzer.tracer
+            trace = tracer.start_turn(query)
             with st.spinner("🚦 网关意图识别中..."):
-                metadata = st.session_state.analyzer.get_data_metadata()
-                route = st.session_state.analyzer.semantic_router(f"{chat_context}\n当前需求: {query}")
-                task_type, need_rag, prep_mode = route.get("task_type", "DATA_OP"), route.get("need_rag",
-                                                                                              False), route.get(
-                    "preprocess_mode", "NONE")
-                rag_ctx = st.session_state.analyzer.retrieve_knowledge(query) if need_rag else ""
-
-            cols = st.columns(3)
+                # 路由、元信息画像与 RAG 检索并发预执行
+                preflight = st.session_state.analyzer.prepare_turn(query, f"{chat_context}\n当前需求: {query}")
+                metadata, route, rag_ctx = preflight["metadata"], preflight["route"], preflight["rag_context"]
+                task_type, prep_mode = route.get("task_type", "DATA_OP"), route.get("preprocess_mode", "NONE")
+
+            cols = st.columns(4)
             cols[0].metric("调度策略", task_type)
             cols[1].metric("RAG 挂载", "命中" if rag_ctx else "挂起")
             cols[2].metric("预处理动作", prep_mode)
+            latency_metric, latency_detail = cols[3].empty(), st.empty()
+            render_latency_panel(latency_metric, latency_detail, trace)
+            turn_status = "success"
 
             # 纯聊天链路防越权机制 & RAG 注入
             if task_type == "CHAT":
@@ -130,12 +359,14 @@ def main():
                                 【知识库内容】(如有):
                                 {rag_ctx}
                                 """
-                    res = st.session_state.analyzer.client.chat.completions.create(
-                        model=st.session_state.analyzer.model,
-                        messages=[{"role": "system", "content": chat_sys_prompt}] + [
-                            {"role": m["role"], "content": m["content"]} for m in st.session_state.chat_history[-4:] if
-                            m["type"] == "text"]
-                    )
+                    with tracer.span("chat_llm") as span:
+                        res = st.session_state.analyzer.client.chat.completions.create(
+                            model=st.session_state.analyzer.model,
+                            messages=[{"role": "system", "content": chat_sys_prompt}] + [
+                                {"role": m["role"], "content": m["content"]} for m in st.session_state.chat_history[-4:] if
+                                m["type"] == "text"]
+                        )
+                        span.update(usage_attrs(res))
                     ans = res.choices[0].message.content
                     # 修复 UI 问题：使用 markdown 代替 info，支持长文本自动换行
                     st.markdown(f"**🤖 助手:**\n\n{ans}")
@@ -146,9 +377,12 @@ def main():
                 with st.spinner("🧠 Agent 代码生成与沙箱执行中..."):
                     success, res_dict, code = st.session_state.analyzer.execute_agentic_code(
                         query=query, metadata=metadata, rag_context=rag_ctx,
-                        task_type=task_type, preprocess_mode=prep_mode, chat_context=chat_context
+                        task_type=task_type, preprocess_mode=prep_mode, chat_context=chat_context,
+                        num_candidates=num_candidates
                     )
 
+                render_latency_panel(latency_metric, latency_detail, trace)
+                with tracer.span("render"):
                     # 1. 记录代码（始终记录，便于调试）
                     st.session_state.chat_history.append({"role": "assistant", "type": "code", "content": code})
 
@@ -169,17 +403,8 @@ def main():
                         current_df = res_dict.get("df")
                         if current_df is not None and hasattr(current_df, 'empty') and not current_df.empty:
                             # 界面渲染
-                            st.dataframe(make_dataframe_safe_for_ui(current_df), height=400)
-
-                            # 导出按钮
-                            csv_data = current_df.to_csv(index=False).encode('utf-8-sig')
-                            st.download_button(
-                                label="📥 导出当前数据 (CSV)",
-                                data=csv_data,
-                                file_name=f"agent_data_{len(st.session_state.chat_history)}.csv",
-                                mime="text/csv",
-                                key=f"csv_btn_{len(st.session_state.chat_history)}"
-                            )
+                            render_paged_dataframe(current_df, f"result_{len(st.session_state.chat_history)}",
+                                                   height=400, paginate=False)
 
                             # 存入历史（不再重复存入）
                             st.session_state.chat_history.append(
@@ -188,22 +413,12 @@ def main():
                         # C. 图表呈现
                         if res_dict.get("fig"):
                             st.pyplot(res_dict["fig"])
-
-                            # 导出高清图
-                            img_buf = BytesIO()
-                            res_dict["fig"].savefig(img_buf, format="png", bbox_inches='tight', dpi=300)
-                            st.download_button(
-                                label="🖼️ 导出高清图表 (PNG)",
-                                data=img_buf.getvalue(),
-                                file_name=f"agent_plot_{len(st.session_state.chat_history)}.png",
-                                mime="image/png",
-                                key=f"png_btn_{len(st.session_state.chat_history)}"
-                            )
                             st.session_state.chat_history.append(
                                 {"role": "assistant", "type": "plot", "content": res_dict["fig"]})
 
                     else:
                         # 失败后的处理逻辑保持不变
+                        turn_status = "failed"
                         st.error("⚠️ 沙箱执行崩溃，触发容灾降级")
                         if task_type == "PLOT":
                             fallback_fig = st.session_state.analyzer.generate_chart({"chart_type": "line"})
@@ -212,5 +427,11 @@ def main():
                                 st.session_state.chat_history.append(
                                     {"role": "assistant", "type": "plot", "content": fallback_fig})
 
+            tracer.end_turn(status=turn_status, task_type=task_type)
+            render_latency_panel(latency_metric, latency_detail, trace)
+
+        render_export_center(st.session_state.chat_history)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,217 @@
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+logger = logging.getLogger(__name__)
+
+
+def infer_compact_dtypes(sample: pd.DataFrame, category_ratio: float = 0.5,
+                         category_max_unique: int = 1000) -> dict:
+    """
+    基于抽样数据推断每一列的紧凑存储类型。
+
+    规则：无空值整数列 -> int32 (超出范围保持 int64)；浮点列 -> float32；
+    低基数文本列 (如 `省份`/`备注`) -> category；其余列保持原样。
+
+    Args:
+        sample (pd.DataFrame): 抽样数据框。
+        category_ratio (float, optional): 唯一值占比低于该阈值的文本列才转为 category。
+        category_max_unique (int, optional): 允许转为 category 的最大唯一值数量。
+
+    Returns:
+        dict: 列名 -> 目标 dtype 字符串。
+    """
+    plan = {}
+    int32_info = np.iinfo(np.int32)
+    for col in sample.columns:
+        series = sample[col]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            if series.empty or (series.min() >= int32_info.min and series.max() <= int32_info.max):
+                plan[col] = "int32"
+        elif pd.api.types.is_float_dtype(series):
+            plan[col] = "float32"
+        elif series.dtype == "object":
+            n_unique = series.nunique(dropna=True)
+            if n_unique <= category_max_unique and n_unique <= max(1, len(series) * category_ratio):
+                plan[col] = "category"
+    return plan
+
+
+def apply_dtype_plan(chunk: pd.DataFrame, plan: dict) -> pd.DataFrame:
+    """
+    按推断计划对单个分块执行降精度转换。
+
+    若整数列在后续分块中出现空值或越界，计划会被就地降级为 float32，保证后续分块类型一致。
+    """
+    for col, dtype in list(plan.items()):
+        if col not in chunk.columns:
+            continue
+        try:
+            if dtype == "category":
+                # 统一先转 object，避免全空分块产生 float 类别导致后续无法合并
+                chunk[col] = chunk[col].astype(object).astype("category")
+            elif dtype == "int32":
+                values = chunk[col]
+                if values.isnull().any() or not pd.api.types.is_integer_dtype(values):
+                    raise ValueError("整数列出现空值或非整数值")
+                int32_info = np.iinfo(np.int32)
+                if len(values) and (values.min() < int32_info.min or values.max() > int32_info.max):
+                    raise ValueError("整数列超出 int32 范围")
+                chunk[col] = values.astype("int32")
+            else:
+                chunk[col] = chunk[col].astype(dtype)
+        except (ValueError, TypeError):
+            if dtype == "int32" and pd.api.types.is_numeric_dtype(chunk[col]):
+                plan[col] = "float32"
+                chunk[col] = chunk[col].astype("float32")
+            else:
+                plan.pop(col)
+    return chunk
+
+
+def _frame_nbytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _concat_chunks(chunks: list, plan: dict) -> pd.DataFrame:
+    """
+    逐列合并分块，category 列使用 union_categoricals 保持紧凑类型。
+
+    各分块推断出的类别类型不一致时 (如某列在前面的分块全是数字、后面出现文本)，该列退化为 object 并从计划中移除。
+    """
+    if not chunks:
+        return pd.DataFrame()
+
+    columns = list(chunks[0].columns)
+    merged = {}
+    for col in columns:
+        # 逐列 pop 释放分块内存，合并阶段的额外开销只有当前这一列
+        parts = [chunk.pop(col) for chunk in chunks]
+        if plan.get(col) == "category":
+            try:
+                merged[col] = pd.Series(union_categoricals(parts, ignore_order=True))
+                continue
+            except TypeError as e:
+                logger.warning(f"列 {col!r} 各分块的类别类型不一致，退化为 object: {e}")
+                plan.pop(col)
+                parts = [part.astype(object) for part in parts]
+        series = pd.concat(parts, ignore_index=True)
+        target = plan.get(col)
+        if target and str(series.dtype) != target:
+            series = series.astype(target)
+        merged[col] = series
+    # copy=False 不合并同类型列的数据块，避免构造数据框时再复制一份完整数据
+    return pd.DataFrame(merged, copy=False)
+
+
+def _iter_excel_chunks(file_path: str, chunksize: int):
+    """以 openpyxl 只读流模式逐块读取 Excel 首个工作表。"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(col) if col is not None else f"Unnamed: {i}" for i, col in enumerate(header)]
+
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunksize:
+                yield pd.DataFrame(buffer, columns=header).infer_objects()
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header).infer_objects()
+    finally:
+        workbook.close()
+
+
+def chunked_read(file_path: str, chunksize: int = 100_000, memory_limit_mb: float = None,
+                 sample_rows: int = 10_000) -> tuple[pd.DataFrame, dict]:
+    """
+    流式分块读取 CSV/Excel，并在读取过程中按抽样推断的类型逐块降精度。
+
+    Args:
+        file_path (str): 源文件路径。
+        chunksize (int, optional): 每个分块的行数。默认 100,000。
+        memory_limit_mb (float, optional): 已加载数据的内存上限 (MB)，为 None 时不限制。
+        sample_rows (int, optional): 用于类型推断的抽样行数。
+
+    Returns:
+        tuple[pd.DataFrame, dict]: (降精度后的数据框, 加载统计信息)。
+
+    Raises:
+        MemoryError: 已加载数据超过内存上限时抛出。
+        ValueError: 文件格式不支持时抛出。
+    """
+    file_ext = file_path.split('.')[-1].lower()
+    if file_ext == 'csv':
+        reader = pd.read_csv(file_path, encoding='utf-8', chunksize=chunksize)
+    elif file_ext == 'xlsx':
+        reader = _iter_excel_chunks(file_path, chunksize)
+    elif file_ext == 'xls':
+        # 旧版 xls 无法流式读取，退化为整表读取后再统一降精度
+        reader = iter([pd.read_excel(file_path)])
+    else:
+        raise ValueError("不支持的文件格式，请使用 Excel 或 CSV 文件")
+
+    limit_bytes = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+    start = time.perf_counter()
+    plan = None
+    chunks = []
+    loaded_bytes = 0
+    peak_bytes = 0
+    column_bytes = {}
+    total_rows = 0
+
+    for chunk in reader:
+        chunk.columns = [str(col).strip().replace('\n', '') for col in chunk.columns]
+        raw_bytes = _frame_nbytes(chunk)
+        if plan is None:
+            plan = infer_compact_dtypes(chunk.head(sample_rows))
+
+        chunk = apply_dtype_plan(chunk, plan)
+        usage = chunk.memory_usage(index=True, deep=True)
+        chunk_bytes = int(usage.sum())
+        peak_bytes = max(peak_bytes, loaded_bytes + raw_bytes)
+        loaded_bytes += chunk_bytes
+        total_rows += len(chunk)
+        chunks.append(chunk)
+        for col, nbytes in usage.drop("Index").items():
+            column_bytes[col] = column_bytes.get(col, 0) + int(nbytes)
+
+        if limit_bytes and loaded_bytes > limit_bytes:
+            raise MemoryError(
+                f"数据加载已超过内存上限 {memory_limit_mb:.0f} MB (已读取 {total_rows} 行)，请提高上限或先拆分文件。")
+
+    # 合并时最大的一列会短暂同时存在分块与合并结果两份，需计入内存上限
+    concat_peak = loaded_bytes + max(column_bytes.values(), default=0)
+    peak_bytes = max(peak_bytes, concat_peak)
+    if limit_bytes and concat_peak > limit_bytes:
+        raise MemoryError(
+            f"合并分块需要约 {concat_peak / 1024 / 1024:.0f} MB，超过内存上限 {memory_limit_mb:.0f} MB，"
+            "请提高上限或先拆分文件。")
+
+    df = _concat_chunks(chunks, plan or {})
+    elapsed = time.perf_counter() - start
+    final_bytes = _frame_nbytes(df) if not df.empty else 0
+    peak_bytes = max(peak_bytes, loaded_bytes)
+
+    stats = {
+        "rows": total_rows,
+        "chunks": len(chunks),
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(total_rows / elapsed, 1) if elapsed > 0 else float(total_rows),
+        "peak_memory_mb": round(peak_bytes / 1024 / 1024, 2),
+        "final_memory_mb": round(final_bytes / 1024 / 1024, 2),
+        "dtype_plan": dict(plan or {}),
+    }
+    logger.info(f"分块加载完成: {stats}")
+    return df, stats
@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow 为可选依赖，缺失时缓存层自动失效，退回原始解析
+    feather = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = ".columnar_cache"
+
+
+def file_content_hash(file_path: str, chunk_size: int = 4 * 1024 * 1024) -> str:
+    """
+    按块计算文件内容哈希 (BLAKE2b)，作为列式缓存的唯一键。
+
+    Args:
+        file_path (str): 源文件路径。
+        chunk_size (int, optional): 每次读取的字节数。默认 4MB。
+
+    Returns:
+        str: 十六进制哈希摘要。
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _cache_location(file_path: str, cache_dir: str = None) -> tuple[str, str]:
+    """返回 (缓存目录, 缓存文件名前缀)。"""
+    if cache_dir is None:
+        return os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIR_NAME), os.path.basename(file_path)
+    # 集中缓存目录中，不同目录下的同名源文件以路径摘要区分，互不覆盖 / 清理
+    digest = hashlib.blake2b(os.path.abspath(file_path).encode("utf-8"), digest_size=4).hexdigest()
+    return cache_dir, f"{os.path.basename(file_path)}.{digest}"
+
+
+def get_cache_path(file_path: str, content_hash: str, variant: str = None, cache_dir: str = None) -> str:
+    """
+    返回源文件对应的 Feather 缓存路径。
+
+    默认位于源文件同级的隐藏缓存目录；源文件所在目录只读或为共享目录时，可通过 cache_dir 指定集中缓存目录。
+    variant 用于区分同一源文件的多份缓存 (如多工作表 Excel 的各个工作表)。
+    """
+    cache_dir, stem = _cache_location(file_path, cache_dir)
+    suffix = f"{content_hash}.{variant}" if variant else content_hash
+    return os.path.join(cache_dir, f"{stem}.{suffix}.feather")
+
+
+def write_columnar_cache(df: pd.DataFrame, file_path: str, content_hash: str = None, variant: str = None,
+                         cache_dir: str = None) -> str:
+    """
+    将已解析的数据框写入列式缓存 (未压缩 Arrow IPC，支持内存映射零拷贝读取)。
+
+    同一源文件的历史缓存会被清理，仅保留当前内容哈希对应的版本 (含其全部 variant)。
+
+    Args:
+        df (pd.DataFrame): 已完成列名清理的数据框。
+        file_path (str): 源文件路径。
+        content_hash (str, optional): 预先计算好的内容哈希，避免重复读盘。
+        variant (str, optional): 同一源文件下的缓存分区名 (如工作表)。
+        cache_dir (str, optional): 集中缓存目录，为 None 时写在源文件同级。
+
+    Returns:
+        str: 缓存文件路径；pyarrow 不可用或类型无法序列化时返回 None。
+    """
+    if feather is None or df is None:
+        return None
+
+    try:
+        content_hash = content_hash or file_content_hash(file_path)
+        cache_path = get_cache_path(file_path, content_hash, variant, cache_dir)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+        # 先写临时文件再原子替换，防止并发刷新读到半截缓存
+        tmp_path = f"{cache_path}.tmp"
+        feather.write_feather(df.reset_index(drop=True), tmp_path, compression="uncompressed")
+        os.replace(tmp_path, cache_path)
+        prune_columnar_cache(file_path, content_hash, cache_dir)
+        return cache_path
+    except Exception as e:
+        # 混合类型 object 列等无法转换为 Arrow 时，仅放弃缓存，不影响主链路
+        logger.warning(f"列式缓存写入失败，将退回原始解析: {e}")
+        return None
+
+
+def prune_columnar_cache(file_path: str, content_hash: str, cache_dir: str = None):
+    """删除同一源文件的历史缓存，仅保留当前内容哈希对应的版本 (含其全部 variant)。"""
+    cache_dir, stem = _cache_location(file_path, cache_dir)
+    if not os.path.isdir(cache_dir):
+        return
+    prefix = f"{stem}."
+    current = f"{prefix}{content_hash}."
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name.endswith(".feather") and not name.startswith(current):
+            os.remove(os.path.join(cache_dir, name))
+
+
+def read_columnar_cache(file_path: str, content_hash: str = None, variant: str = None,
+                        cache_dir: str = None) -> pd.DataFrame:
+    """
+    以内存映射方式读取源文件对应的列式缓存。
+
+    Args:
+        file_path (str): 源文件路径。
+        content_hash (str, optional): 预先计算好的内容哈希。
+        variant (str, optional): 缓存分区名，与写入时一致。
+        cache_dir (str, optional): 集中缓存目录，与写入时一致。
+
+    Returns:
+        pd.DataFrame: 命中时返回数据框，未命中或读取失败返回 None。
+    """
+    if feather is None or not os.path.exists(file_path):
+        return None
+
+    try:
+        cache_path = get_cache_path(file_path, content_hash or file_content_hash(file_path), variant, cache_dir)
+        if not os.path.exists(cache_path):
+            return None
+        return feather.read_table(cache_path, memory_map=True).to_pandas()
+    except Exception as e:
+        logger.warning(f"列式缓存读取失败，将退回原始解析: {e}")
+        return None
@@ -0,0 +1,232 @@
+"""
+Excel 读取层：优先使用 Rust 实现的 calamine 引擎 (python-calamine)，未安装或解析失败时自动回退到 pandas 默认引擎
+(xlsx -> openpyxl，xls -> xlrd)。
+
+多工作表工作簿由 `SheetBook` 管理：各工作表可在进程池中并行读取，也可以在首次访问时按需加载；
+读取结果按工作表写入列式缓存，页面刷新恢复时不再重新解析 Excel。
+"""
+import hashlib
+import keyword
+import logging
+import multiprocessing as mp
+import os
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from src.utils.columnar_cache import file_content_hash, read_columnar_cache, write_columnar_cache
+
+try:
+    import python_calamine  # noqa: F401  (pandas 通过 engine="calamine" 调用)
+    CALAMINE_AVAILABLE = True
+except ImportError:  # calamine 为可选依赖，缺失时使用 pandas 默认引擎
+    CALAMINE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 小于该体积的工作簿串行读取即可，进程池的启动开销 (spawn + 导入 pandas) 反而更慢
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+
+
+def resolve_excel_engine(engine: str = "auto") -> str:
+    """
+    解析实际使用的读取引擎。
+
+    Args:
+        engine (str, optional): "auto" 优先 calamine；也可显式指定 "calamine" / "openpyxl" 等 pandas 支持的引擎。
+
+    Returns:
+        str: 引擎名；返回 None 表示交由 pandas 按扩展名选择默认引擎。
+    """
+    if engine in ("auto", "calamine", None):
+        if CALAMINE_AVAILABLE:
+            return "calamine"
+        if engine == "calamine":
+            logger.warning("未安装 python-calamine，回退到 pandas 默认 Excel 引擎")
+        return None
+    return engine
+
+
+def read_excel_sheet(file_path: str, sheet_name=0, engine: str = "auto", nrows: int = None) -> pd.DataFrame:
+    """
+    读取单个工作表并执行基础列名清理；指定引擎失败时回退到 pandas 默认引擎重试一次。
+
+    Args:
+        file_path (str): Excel 文件路径。
+        sheet_name (str | int, optional): 工作表名或序号，默认首个工作表。
+        engine (str, optional): 读取引擎，见 `resolve_excel_engine`。
+        nrows (int, optional): 只读取前 n 行 (0 表示只读表头)。
+
+    Returns:
+        pd.DataFrame: 工作表数据。
+    """
+    resolved = resolve_excel_engine(engine)
+    df = None
+    if resolved is not None:
+        try:
+            df = pd.read_excel(file_path, sheet_name=sheet_name, engine=resolved, nrows=nrows)
+        except Exception as e:
+            logger.warning(f"{resolved} 引擎读取工作表 {sheet_name!r} 失败，回退到 pandas 默认引擎: {e}")
+    if df is None:
+        df = pd.read_excel(file_path, sheet_name=sheet_name, nrows=nrows)
+
+    df.columns = [str(col).strip().replace('\n', '') for col in df.columns]
+    return df
+
+
+def list_sheet_names(file_path: str, engine: str = "auto") -> list[str]:
+    """列出工作簿中的全部工作表名 (只读取工作簿目录，不解析单元格)。"""
+    resolved = resolve_excel_engine(engine)
+    if resolved is not None:
+        try:
+            with pd.ExcelFile(file_path, engine=resolved) as book:
+                return list(book.sheet_names)
+        except Exception as e:
+            logger.warning(f"{resolved} 引擎读取工作表目录失败，回退到 pandas 默认引擎: {e}")
+    with pd.ExcelFile(file_path) as book:
+        return list(book.sheet_names)
+
+
+def _read_sheet_task(args: tuple) -> pd.DataFrame:
+    """进程池任务入口 (须为模块级函数以便 spawn 子进程导入)。"""
+    return read_excel_sheet(*args)
+
+
+def read_excel_sheets(file_path: str, sheet_names: list, engine: str = "auto", max_workers: int = None,
+                      parallel_min_bytes: int = PARALLEL_MIN_BYTES) -> dict:
+    """
+    读取多个工作表；文件足够大时在进程池中按工作表并行解析 (解析为 CPU 密集型，线程池受 GIL 限制)。
+
+    Args:
+        file_path (str): Excel 文件路径。
+        sheet_names (list): 待读取的工作表名。
+        engine (str, optional): 读取引擎。
+        max_workers (int, optional): 最大进程数，默认 CPU 核数。
+        parallel_min_bytes (int, optional): 文件体积低于该值时串行读取。
+
+    Returns:
+        dict: 工作表名 -> 数据框 (保持传入顺序)。
+    """
+    sheet_names = list(sheet_names)
+    workers = min(len(sheet_names), max_workers or os.cpu_count() or 1)
+    if workers > 1 and os.path.getsize(file_path) >= parallel_min_bytes:
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+                frames = pool.map(_read_sheet_task, [(file_path, name, engine) for name in sheet_names])
+                return dict(zip(sheet_names, frames))
+        except (OSError, BrokenProcessPool) as e:
+            logger.warning(f"并行读取工作表失败，改为串行读取: {e}")
+    return {name: read_excel_sheet(file_path, name, engine) for name in sheet_names}
+
+
+def sheet_variable_names(sheet_names: list, reserved=()) -> dict:
+    """
+    为每个工作表分配沙箱中的变量名：工作表名本身是合法标识符时直接使用，否则使用 `sheet_<序号>`。
+
+    Returns:
+        dict: 变量名 -> 工作表名。
+    """
+    names = {}
+    for i, sheet in enumerate(sheet_names, start=1):
+        var = str(sheet).strip()
+        if not var.isidentifier() or keyword.iskeyword(var) or var in reserved or var in names:
+            var = f"sheet_{i}"
+        names[var] = sheet
+    return names
+
+
+def _sheet_variant(sheet_name: str) -> str:
+    """工作表在列式缓存中的分区名 (工作表名可能含有不适合作为文件名的字符，取其摘要)。"""
+    return "sheet-" + hashlib.blake2b(str(sheet_name).encode("utf-8"), digest_size=6).hexdigest()
+
+
+class SheetBook(Mapping):
+    """
+    多工作表工作簿的只读映射 (工作表名 -> 数据框)。
+
+    工作表在首次访问时才解析 (优先命中列式缓存)；`load()` 可一次性并行读取全部未加载的工作表。
+    """
+
+    def __init__(self, file_path: str, sheet_names: list, engine: str = "auto", content_hash: str = None,
+                 loaded: dict = None, max_workers: int = None, cache_dir: str = None):
+        """
+        Args:
+            file_path (str): Excel 文件路径。
+            sheet_names (list): 工作簿中的全部工作表名 (按原始顺序)。
+            engine (str, optional): 读取引擎。
+            content_hash (str, optional): 源文件内容哈希，用作列式缓存键，为 None 时首次写缓存时计算。
+            loaded (dict, optional): 已解析好的工作表 (如作为主表加载的首个工作表)。
+            max_workers (int, optional): 并行读取的最大进程数。
+            cache_dir (str, optional): 集中列式缓存目录，为 None 时写在源文件同级。
+        """
+        self.file_path = file_path
+        self.sheet_names = list(sheet_names)
+        self.engine = engine
+        self.content_hash = content_hash
+        self.max_workers = max_workers
+        self.cache_dir = cache_dir
+        self._frames = dict(loaded or {})
+        self._headers = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        if name not in self.sheet_names:
+            raise KeyError(name)
+        with self._lock:
+            if name not in self._frames:
+                self._frames[name] = self._load_one(name)
+            return self._frames[name]
+
+    def __iter__(self):
+        return iter(self.sheet_names)
+
+    def __len__(self) -> int:
+        return len(self.sheet_names)
+
+    @property
+    def loaded_names(self) -> list[str]:
+        return [name for name in self.sheet_names if name in self._frames]
+
+    def load(self, names: list = None) -> dict:
+        """加载指定 (默认全部) 工作表：先查列式缓存，未命中的在进程池中并行解析。"""
+        names = self.sheet_names if names is None else names
+        with self._lock:
+            missing = []
+            for name in names:
+                if name in self._frames:
+                    continue
+                cached = read_columnar_cache(self.file_path, self._hash(), _sheet_variant(name), self.cache_dir)
+                if cached is not None:
+                    self._frames[name] = cached
+                else:
+                    missing.append(name)
+            if missing:
+                parsed = read_excel_sheets(self.file_path, missing, self.engine, self.max_workers)
+                for name, df in parsed.items():
+                    write_columnar_cache(df, self.file_path, self._hash(), _sheet_variant(name), self.cache_dir)
+                    self._frames[name] = df
+            return {name: self._frames[name] for name in names}
+
+    def columns(self, name: str) -> list[str]:
+        """工作表的列名；未加载的工作表只读取表头，不触发整表解析。"""
+        if name in self._frames:
+            return list(self._frames[name].columns)
+        if name not in self._headers:
+            self._headers[name] = list(read_excel_sheet(self.file_path, name, self.engine, nrows=0).columns)
+        return self._headers[name]
+
+    def _hash(self) -> str:
+        if self.content_hash is None:
+            self.content_hash = file_content_hash(self.file_path)
+        return self.content_hash
+
+    def _load_one(self, name: str) -> pd.DataFrame:
+        cached = read_columnar_cache(self.file_path, self._hash(), _sheet_variant(name), self.cache_dir)
+        if cached is not None:
+            return cached
+        df = read_excel_sheet(self.file_path, name, self.engine)
+        write_columnar_cache(df, self.file_path, self._hash(), _sheet_variant(name), self.cache_dir)
+        return df
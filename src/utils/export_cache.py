@@ -0,0 +1,112 @@
+import gzip
+import io
+import logging
+from collections import OrderedDict
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 导出格式 -> (文件后缀, MIME 类型)
+EXPORT_FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "csv.gz": (".csv.gz", "application/gzip"),
+    "parquet": (".parquet", "application/octet-stream"),
+    "png": (".png", "image/png"),
+}
+
+
+def iter_csv_chunks(df: pd.DataFrame, chunksize: int = 50_000):
+    """
+    分块生成 CSV 字节流 (UTF-8 BOM，兼容 Excel 直接打开)。
+
+    每次只把 `chunksize` 行格式化为文本，避免整表 to_csv 产生与结果等大的中间字符串。
+    """
+    for start in range(0, max(len(df), 1), chunksize):
+        chunk = df.iloc[start:start + chunksize].to_csv(index=False, header=start == 0)
+        yield chunk.encode("utf-8-sig" if start == 0 else "utf-8")
+
+
+def export_dataframe(df: pd.DataFrame, fmt: str = "csv", chunksize: int = 50_000) -> bytes:
+    """
+    将数据框导出为指定格式的字节串。
+
+    Args:
+        df (pd.DataFrame): 待导出的数据框。
+        fmt (str, optional): "csv" / "csv.gz" / "parquet"。
+        chunksize (int, optional): CSV 分块格式化的行数。
+
+    Returns:
+        bytes: 文件内容。
+    """
+    buf = io.BytesIO()
+    if fmt == "parquet":
+        df.to_parquet(buf, compression="zstd")
+    elif fmt == "csv.gz":
+        with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=6) as gz:
+            for chunk in iter_csv_chunks(df, chunksize):
+                gz.write(chunk)
+    elif fmt == "csv":
+        for chunk in iter_csv_chunks(df, chunksize):
+            buf.write(chunk)
+    else:
+        raise ValueError(f"不支持的数据导出格式: {fmt}")
+    return buf.getvalue()
+
+
+def export_figure(fig, dpi: int = 300) -> bytes:
+    """将图表渲染为高清 PNG 字节串。"""
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches='tight', dpi=dpi)
+    return buf.getvalue()
+
+
+class ExportCache:
+    """
+    导出产物缓存。
+
+    以 (结果 id, 格式) 为键缓存已生成的字节串，按总字节数做 LRU 淘汰；
+    同一结果在多次重绘中只生成一次，未被请求的格式永远不会生成。
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            max_bytes (int, optional): 缓存产物的总字节上限。
+        """
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, result_id: str, fmt: str) -> bytes:
+        """读取已生成的产物；不存在时返回 None (不会触发生成)。"""
+        data = self._items.get((result_id, fmt))
+        if data is not None:
+            self._items.move_to_end((result_id, fmt))
+        return data
+
+    def get_or_create(self, result_id: str, fmt: str, producer) -> bytes:
+        """
+        读取产物，未命中时调用 `producer()` 生成并缓存。
+
+        Args:
+            result_id (str): 结果的唯一 id (如对话历史中的引用)。
+            fmt (str): 导出格式。
+            producer (callable): 无参函数，返回导出字节串。
+        """
+        data = self.get(result_id, fmt)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        data = producer()
+        if len(data) <= self.max_bytes:
+            self._items[(result_id, fmt)] = data
+            self._total += len(data)
+            while self._total > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._total -= len(evicted)
+        return data
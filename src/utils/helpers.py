@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 import json5
 import re
 import logging
+from collections import OrderedDict
 import pandas as pd
 logger = logging.getLogger(__name__)
 
@@ -95,9 +96,77 @@ def make_dataframe_safe_for_ui(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return df
 
-    safe_df = df.copy()
+    # 浅拷贝即可：逐列赋值只替换副本中的列，原数据框不受影响，且不会复制未转换的数值列
+    safe_df = df.copy(deep=False)
     for col in safe_df.columns:
         # 只拦截危险的 object (混合) 类型
         if safe_df[col].dtype == 'object':
             safe_df[col] = safe_df[col].astype(str)
-    return safe_df
\ No newline at end of file
+    return safe_df
+
+
+def estimate_frame_memory_mb(df: pd.DataFrame, sample_rows: int = 10_000) -> float:
+    """
+    估算数据框的内存占用 (MB)，无需对全表做 deep 统计。
+
+    定长列直接累加底层数组字节数；object 列仅对前 `sample_rows` 行做 deep 统计后按行数外推。
+    """
+    if df is None or not hasattr(df, 'memory_usage'):
+        return 0.0
+    shallow = df.memory_usage(index=True, deep=False)
+    object_cols = [col for col in df.columns if df[col].dtype == 'object']
+    total = float(shallow.drop(labels=object_cols).sum())
+    if object_cols and len(df):
+        sample = df.head(sample_rows)[object_cols]
+        total += float(sample.memory_usage(index=False, deep=True).sum()) * len(df) / len(sample)
+    return round(total / 1024 / 1024, 2)
+
+
+class DataFramePager:
+    """
+    数据框分页预览器。
+
+    每次只对可见窗口 (一页) 做 UI 防腐转换，转换结果按 (数据键, 页码, 页大小) 做 LRU 缓存；
+    数据键应包含数据版本号 (如 `raw:{data_version}`)，数据被整体替换后旧页自然失效。
+    """
+
+    def __init__(self, page_size: int = 500, max_pages: int = 32):
+        """
+        Args:
+            page_size (int, optional): 每页行数。
+            max_pages (int, optional): 最多缓存的已转换页数。
+        """
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def page_count(self, df: pd.DataFrame) -> int:
+        return max(1, -(-len(df) // self.page_size))
+
+    def get_page(self, df: pd.DataFrame, data_key, page: int) -> pd.DataFrame:
+        """返回第 `page` 页 (从 0 开始，越界时截断到首/末页) 的 UI 安全切片。"""
+        page = min(max(page, 0), self.page_count(df) - 1)
+        cache_key = (data_key, page, self.page_size)
+        cached = self._pages.get(cache_key)
+        if cached is not None:
+            self._pages.move_to_end(cache_key)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        start = page * self.page_size
+        safe_page = make_dataframe_safe_for_ui(df.iloc[start:start + self.page_size])
+        self._pages[cache_key] = safe_page
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return safe_page
+
+    def invalidate(self, data_key=None):
+        """丢弃指定数据键 (为 None 时为全部) 的缓存页。"""
+        if data_key is None:
+            self._pages.clear()
+            return
+        for cache_key in [key for key in self._pages if key[0] == data_key]:
+            del self._pages[cache_key]
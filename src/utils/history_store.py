@@ -0,0 +1,175 @@
+import io
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import uuid
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from src.utils.helpers import estimate_frame_memory_mb
+
+try:
+    import pyarrow  # noqa: F401  (to_parquet 的引擎)
+    HAS_PARQUET = True
+except ImportError:  # 缺少 pyarrow 时数据框退化为 gzip 压缩的 pickle 落盘
+    HAS_PARQUET = False
+
+logger = logging.getLogger(__name__)
+
+SPILLED_TYPES = ("dataframe", "plot")
+
+
+class ChatHistoryStore:
+    """
+    有内存预算的对话历史存储。
+
+    文本 / 代码消息照常保存在内存中；结果数据框落盘为压缩的 Parquet 文件，图表渲染为 PNG 缩略图后关闭 Figure。
+    消息本身只保留文件引用与少量摘要，真正的内容在读取时按需加载，并在内存预算内做 LRU 缓存。
+    对外行为与列表一致 (支持迭代、len、下标与切片)，可直接替换 `st.session_state.chat_history`。
+    """
+
+    def __init__(self, spill_dir: str = None, memory_budget_mb: float = 64, thumbnail_dpi: int = 80):
+        """
+        Args:
+            spill_dir (str, optional): 落盘目录，为 None 时在 ./temp_data 下创建独立的会话目录。
+            memory_budget_mb (float, optional): 已加载内容 (数据框 / 缩略图) 的内存预算 (MB)。
+            thumbnail_dpi (int, optional): 图表缩略图分辨率。
+        """
+        if spill_dir is None:
+            os.makedirs("./temp_data", exist_ok=True)
+            spill_dir = tempfile.mkdtemp(prefix="chat_history_", dir="./temp_data")
+        os.makedirs(spill_dir, exist_ok=True)
+        self.spill_dir = spill_dir
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self.thumbnail_dpi = thumbnail_dpi
+        self._messages = []
+        self._loaded = OrderedDict()  # ref -> (内容, 字节数)
+        self._loaded_bytes = 0
+        self.reloads = 0
+
+    def __iter__(self):
+        return iter(self._messages)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def append(self, message: dict):
+        """追加消息；数据框与图表内容会被立即落盘，消息中只保留引用。"""
+        if message.get("type") not in SPILLED_TYPES or message.get("content") is None:
+            self._messages.append(message)
+            return
+
+        ref = uuid.uuid4().hex
+        content = message["content"]
+        entry = {key: value for key, value in message.items() if key != "content"}
+        entry["ref"] = ref
+        try:
+            if message["type"] == "dataframe":
+                entry["path"] = self._spill_frame(ref, content)
+                entry["shape"] = content.shape
+                self._remember(ref, content, self._frame_bytes(content))
+            else:
+                # Figure 序列化落盘，供按需重新渲染高清导出图；内存中只保留缩略图
+                entry["figure_path"] = os.path.join(self.spill_dir, f"{ref}.fig.pkl")
+                with open(entry["figure_path"], "wb") as f:
+                    pickle.dump(content, f)
+                png = self._render_thumbnail(content)
+                entry["path"] = os.path.join(self.spill_dir, f"{ref}.png")
+                with open(entry["path"], "wb") as f:
+                    f.write(png)
+                self._remember(ref, png, len(png))
+        except Exception as e:
+            # 落盘失败时退回内存保存，保证对话历史不丢失
+            logger.warning(f"对话历史落盘失败，保留在内存中: {e}")
+            self._messages.append(message)
+            return
+        self._messages.append(entry)
+
+    def load(self, message: dict):
+        """
+        读取消息内容：文本消息直接返回，落盘的消息按需从磁盘重新加载。
+
+        Returns:
+            str | pd.DataFrame | bytes: 文本、数据框或 PNG 缩略图字节。
+        """
+        if "ref" not in message:
+            return message.get("content")
+
+        ref = message["ref"]
+        cached = self._loaded.get(ref)
+        if cached is not None:
+            self._loaded.move_to_end(ref)
+            return cached[0]
+
+        self.reloads += 1
+        path = message["path"]
+        if message["type"] == "dataframe":
+            content = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_pickle(path)
+            size = self._frame_bytes(content)
+        else:
+            with open(path, "rb") as f:
+                content = f.read()
+            size = len(content)
+        self._remember(ref, content, size)
+        return content
+
+    def load_figure(self, message: dict):
+        """从磁盘还原图表消息的原始 Figure (用于高清导出，不进入内存缓存)。"""
+        if "ref" not in message:
+            return message.get("content")
+        with open(message["figure_path"], "rb") as f:
+            return pickle.load(f)
+
+    def memory_usage_mb(self) -> float:
+        return round(self._loaded_bytes / 1024 / 1024, 2)
+
+    def clear(self):
+        """清空历史并删除落盘文件。"""
+        self._messages.clear()
+        self._loaded.clear()
+        self._loaded_bytes = 0
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+    def _spill_frame(self, ref: str, df: pd.DataFrame) -> str:
+        if HAS_PARQUET:
+            path = os.path.join(self.spill_dir, f"{ref}.parquet")
+            try:
+                df.to_parquet(path, compression="zstd")
+                return path
+            except Exception as e:
+                # 混合类型列或非字符串列名无法写入 Parquet
+                logger.info(f"Parquet 落盘失败，退化为 pickle: {e}")
+                if os.path.exists(path):
+                    os.remove(path)
+        path = os.path.join(self.spill_dir, f"{ref}.pkl.gz")
+        df.to_pickle(path, compression="gzip")
+        return path
+
+    @staticmethod
+    def _frame_bytes(df: pd.DataFrame) -> int:
+        return int(estimate_frame_memory_mb(df) * 1024 * 1024)
+
+    def _render_thumbnail(self, fig) -> bytes:
+        """将图表渲染为低分辨率 PNG 并释放 Figure (Figure 对象持有完整的绘图树，常驻内存开销大)。"""
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", dpi=self.thumbnail_dpi, bbox_inches="tight")
+        plt.close(fig)
+        return buf.getvalue()
+
+    def _remember(self, ref: str, content, size: int):
+        """按 LRU 放入已加载缓存；单个内容超过预算时不缓存。"""
+        if size > self.memory_budget_bytes:
+            return
+        self._loaded[ref] = (content, size)
+        self._loaded_bytes += size
+        while self._loaded_bytes > self.memory_budget_bytes:
+            _, (_, evicted_size) = self._loaded.popitem(last=False)
+            self._loaded_bytes -= evicted_size
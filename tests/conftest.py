@@ -0,0 +1,51 @@
+import hashlib
+import io
+from unittest.mock import MagicMock
+
+import pytest
+
+
+class FakeUpload(io.BytesIO):
+    """模拟 Streamlit 的上传文件对象 (UploadedFile)"""
+
+    def __init__(self, name, data: bytes):
+        super().__init__(data)
+        self.name = name
+
+    def getbuffer(self):
+        # 返回独立的只读视图，避免导出 BytesIO 内部缓冲区后无法再读取 / 关闭
+        return memoryview(self.getvalue())
+
+
+class HashEmbedding:
+    """确定性的哈希向量化函数，避免测试中下载嵌入模型，同时记录被向量化的条目数"""
+
+    def __init__(self):
+        self.calls = 0
+        self.embedded = 0
+
+    def __call__(self, input):
+        self.calls += 1
+        self.embedded += len(input)
+        return [[b / 255 for b in hashlib.md5(text.encode("utf-8")).digest()[:8]] for text in input]
+
+
+@pytest.fixture
+def make_upload():
+    """构造模拟上传文件：make_upload("demo.csv", b"...")"""
+    return FakeUpload
+
+
+@pytest.fixture
+def embedding():
+    return HashEmbedding()
+
+
+@pytest.fixture
+def llm_reply():
+    """构造只包含一个 python 代码块的模型回复：llm_reply("update_df = df")"""
+    def _reply(code):
+        response = MagicMock()
+        response.choices[0].message.content = f"```python\n{code}\n```"
+        return response
+    return _reply
@@ -0,0 +1,254 @@
+import asyncio
+import base64
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from src.api.job_server import JobQueueServer, make_analyzer_factory
+
+CHART_CODE = ("```python\nresult_df = df.sort_values('GDP', ascending=False)\n"
+              "fig, ax = plt.subplots()\nax.bar(df['省份'], df['GDP'])\n```")
+
+
+class StubLLMClient:
+    """离线桩：按 OpenAI 客户端接口返回固定回复 (同时支持普通与流式调用)。"""
+
+    def __init__(self, content: str):
+        self.content = content
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, stream=False, **kwargs):
+        self.calls += 1
+        if stream:
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=self.content))])])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))])
+
+
+@pytest.fixture
+def stub_factory(tmp_path, monkeypatch):
+    """默认分析器工厂 + 桩 LLM；切换到 tmp_path，分析器的临时文件与列式缓存不会留在仓库目录"""
+    monkeypatch.chdir(tmp_path)
+    factory = make_analyzer_factory()
+
+    def _factory(session_id, api_key):
+        analyzer = factory(session_id, api_key)
+        analyzer.client = StubLLMClient(CHART_CODE)
+        return analyzer
+    return _factory
+
+
+async def http(server, method, path, body=None):
+    """最小 HTTP 客户端：返回 (状态码, 响应头, 响应体 bytes)。"""
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    payload = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, data = raw.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return int(lines[0].split(" ")[1]), headers, data
+
+
+async def wait_for_job(server, job_id, timeout=30):
+    for _ in range(int(timeout / 0.05)):
+        status, _, data = await http(server, "GET", f"/jobs/{job_id}")
+        info = json.loads(data)
+        if info["status"] in ("succeeded", "failed"):
+            return info
+        await asyncio.sleep(0.05)
+    raise TimeoutError(job_id)
+
+
+class TestJobQueueServer:
+    """测试异步任务队列服务：任务生命周期、结果获取、背压与错误码"""
+
+    def test_load_route_execute_over_http(self, stub_factory):
+        """测试 1：通过 HTTP 完成 加载 -> 路由 -> 执行，并以 JSON / CSV / PNG 获取结果 (桩 LLM，完全离线)"""
+        async def scenario():
+            server = JobQueueServer(analyzer_factory=stub_factory, default_api_key="sk-dummy", max_workers=2)
+            await server.start(port=0)
+            try:
+                status, _, data = await http(server, "POST", "/sessions", {})
+                assert status == 201
+                session_id = json.loads(data)["session_id"]
+
+                csv = pd.DataFrame({"省份": ["北京市", "上海市"], "GDP": [100.0, 200.0]}).to_csv(index=False)
+                status, _, data = await http(server, "POST", "/jobs", {
+                    "session_id": session_id, "type": "load",
+                    "params": {"filename": "gdp.csv", "content_base64": base64.b64encode(csv.encode()).decode()}})
+                assert status == 202
+                load = await wait_for_job(server, json.loads(data)["job_id"])
+                assert load["status"] == "succeeded"
+
+                _, _, data = await http(server, "POST", "/jobs", {
+                    "session_id": session_id, "type": "route", "params": {"query": "画个柱状图"}})
+                route_job = await wait_for_job(server, json.loads(data)["job_id"])
+                _, _, data = await http(server, "GET", f"/jobs/{route_job['job_id']}/result")
+                assert json.loads(data)["result"]["route"]["task_type"] == "PLOT"
+
+                _, _, data = await http(server, "POST", "/jobs", {
+                    "session_id": session_id, "type": "execute", "params": {"query": "画个柱状图", "max_retries": 1}})
+                job_id = json.loads(data)["job_id"]
+                assert (await wait_for_job(server, job_id))["status"] == "succeeded"
+
+                _, _, data = await http(server, "GET", f"/jobs/{job_id}/result?rows=1")
+                result = json.loads(data)["result"]
+                assert result["success"] and result["has_figure"]
+                assert result["table"]["total_rows"] == 2
+                assert result["table"]["preview"] == [{"省份": "上海市", "GDP": 200.0}]
+
+                status, headers, data = await http(server, "GET", f"/jobs/{job_id}/result?format=csv")
+                assert status == 200 and headers["Content-Type"].startswith("text/csv")
+                assert data.decode("utf-8-sig").splitlines()[1] == "上海市,200.0"
+                status, headers, data = await http(server, "GET", f"/jobs/{job_id}/result?format=png")
+                assert headers["Content-Type"] == "image/png" and data[:4] == b"\x89PNG"
+
+                # 同一会话的分析器实例被复用
+                assert server.sessions[session_id].client.calls >= 1
+                _, _, data = await http(server, "GET", "/health")
+                assert json.loads(data)["counters"]["succeeded"] == 3
+                assert "codegen_llm" in result["trace"]["breakdown"]
+                status, headers, data = await http(server, "GET", "/metrics")
+                assert headers["Content-Type"].startswith("text/plain")
+                assert 'afa_jobs_total{outcome="succeeded"} 3' in data.decode()
+            finally:
+                await server.stop()
+
+        asyncio.run(scenario())
+
+    def test_full_queue_rejects_with_429(self, tmp_path):
+        """测试 2：worker 全忙且队列已满时，新任务立即被拒绝 (429 + Retry-After)，不会无限堆积"""
+        release = threading.Event()
+
+        class BlockingAnalyzer:
+            def load_data(self, path):
+                release.wait(10)
+                raise FileNotFoundError(path)
+
+        async def scenario():
+            server = JobQueueServer(analyzer_factory=lambda sid, key: BlockingAnalyzer(), default_api_key="k",
+                                    max_workers=1, max_queue=1, upload_dir=str(tmp_path))
+            await server.start(port=0)
+            try:
+                session_id = await server.create_session()
+                job = {"session_id": session_id, "type": "load", "params": {"path": "x.csv"}}
+                first = json.loads((await http(server, "POST", "/jobs", job))[2])
+                for _ in range(100):  # 等待第一个任务被 worker 取走
+                    if server.jobs[first["job_id"]].status == "running":
+                        break
+                    await asyncio.sleep(0.01)
+                assert (await http(server, "POST", "/jobs", job))[0] == 202
+
+                status, headers, _ = await http(server, "POST", "/jobs", job)
+                assert status == 429 and headers["Retry-After"] == "1"
+                assert server.counters["rejected"] == 1
+
+                release.set()
+                info = await wait_for_job(server, first["job_id"])
+                assert info["status"] == "failed" and "FileNotFoundError" in info["error"]
+            finally:
+                release.set()
+                await server.stop()
+
+        asyncio.run(scenario())
+
+    @pytest.mark.parametrize("method, path, body, expected", [
+        ("POST", "/jobs", {"session_id": "nope", "type": "load", "params": {}}, 404),
+        ("POST", "/jobs", {"session_id": "SESSION", "type": "train", "params": {}}, 400),
+        ("GET", "/jobs/unknown", None, 404),
+        ("PUT", "/jobs", {}, 405),
+        ("GET", "/elsewhere", None, 404),
+    ])
+    def test_error_responses(self, method, path, body, expected):
+        """测试 3：未知会话 / 任务类型 / 路径与不支持的方法返回对应的错误码和 JSON 错误信息"""
+        async def scenario():
+            server = JobQueueServer(analyzer_factory=lambda sid, key: object(), default_api_key="k", max_workers=1)
+            await server.start(port=0)
+            try:
+                session_id = await server.create_session()
+                payload = json.loads(json.dumps(body).replace("SESSION", session_id)) if body else None
+                status, _, data = await http(server, method, path, payload)
+                assert status == expected
+                assert "error" in json.loads(data)
+            finally:
+                await server.stop()
+
+        asyncio.run(scenario())
+
+    def test_busy_session_does_not_block_others(self, tmp_path):
+        """测试 4：某个会话的任务执行期间，其它会话的任务不会被它的排队任务阻塞；已释放会话的排队任务干净地失败"""
+        release = threading.Event()
+
+        class Analyzer:
+            def __init__(self, blocking):
+                self.blocking = blocking
+
+            def load_data(self, path):
+                if self.blocking:
+                    release.wait(10)
+                raise FileNotFoundError(path)
+
+        async def scenario():
+            blocking = iter([True, False])
+            server = JobQueueServer(analyzer_factory=lambda sid, key: Analyzer(next(blocking)), default_api_key="k",
+                                    max_workers=2, upload_dir=str(tmp_path))
+            await server.start(port=0)
+            try:
+                busy, idle = await server.create_session(), await server.create_session()
+                busy_jobs = [server.submit("load", busy, {"path": "x.csv"}) for _ in range(3)]
+                idle_job = server.submit("load", idle, {"path": "y.csv"})
+
+                info = await wait_for_job(server, idle_job.id, timeout=5)
+                assert info["status"] == "failed" and "FileNotFoundError" in info["error"]
+                assert [job.status for job in busy_jobs] == ["running", "queued", "queued"]
+
+                assert (await http(server, "DELETE", f"/sessions/{busy}"))[0] == 200
+                release.set()
+                infos = [await wait_for_job(server, job.id) for job in busy_jobs]
+                assert "FileNotFoundError" in infos[0]["error"]
+                assert all("会话已释放" in info["error"] for info in infos[1:])
+                assert server.health()["queue_depth"] == 0 and not server._pending
+            finally:
+                release.set()
+                await server.stop()
+
+        asyncio.run(scenario())
+
+    def test_load_path_restricted_to_upload_dir(self, tmp_path, stub_factory):
+        """测试 5：load 任务的服务端路径只能位于上传目录内，且不会在上传目录中写缓存；未配置上传目录时禁止按路径加载"""
+        async def scenario():
+            upload_dir = tmp_path / "uploads"
+            upload_dir.mkdir()
+            (upload_dir / "gdp.csv").write_text("省份,GDP\n北京市,1\n", encoding="utf-8")
+            server = JobQueueServer(analyzer_factory=stub_factory, default_api_key="k", max_workers=1,
+                                    upload_dir=str(upload_dir))
+            closed = JobQueueServer(analyzer_factory=lambda sid, key: object(), default_api_key="k", max_workers=1)
+            await server.start(port=0)
+            await closed.start(port=0)
+            try:
+                session_id = await server.create_session()
+                for path in ("../secret.csv", "/etc/passwd"):
+                    status, _, data = await http(server, "POST", "/jobs", {
+                        "session_id": session_id, "type": "load", "params": {"path": path}})
+                    assert status == 403 and "上传目录" in json.loads(data)["error"]
+
+                _, _, data = await http(server, "POST", "/jobs", {
+                    "session_id": session_id, "type": "load", "params": {"path": "gdp.csv"}})
+                assert (await wait_for_job(server, json.loads(data)["job_id"]))["status"] == "succeeded"
+                assert os.listdir(upload_dir) == ["gdp.csv"]
+                assert os.path.isdir(tmp_path / "temp_data" / ".columnar_cache")
+
+                status, _, _ = await http(closed, "POST", "/jobs", {
+                    "session_id": await closed.create_session(), "type": "load", "params": {"path": "gdp.csv"}})
+                assert status == 403
+            finally:
+                await server.stop()
+                await closed.stop()
+
+        asyncio.run(scenario())
@@ -0,0 +1,61 @@
+import json
+import os
+import pandas as pd
+import pytest
+from src.core.analyzer import AIDrivenFormAnalyzer
+from src.core.batch_runner import load_manifest, run_batch
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    pd.DataFrame({"省份": ["北京市", "上海市"], "GDP": [100.0, 200.0]}).to_csv(data_dir / "a.csv", index=False)
+    pd.DataFrame({"省份": ["广东省"], "GDP": [300.0]}).to_csv(data_dir / "b.csv", index=False)
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps({
+        "files": ["data/a.csv", "data/b.csv"],
+        "queries": ["画个柱状图", "你好"],
+        "jobs": [{"file": "data/missing.csv", "query": "画个柱状图"}],
+        "options": {"max_retries": 1},
+    }, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+class TestBatchRunner:
+    """测试无界面批处理：清单展开、结果落盘与运行汇总"""
+
+    def test_manifest_expands_cross_product(self, manifest):
+        """测试 1：files × queries 做笛卡尔积并按文件分组，相对路径相对清单目录解析"""
+        parsed = load_manifest(str(manifest))
+
+        assert parsed["total"] == 5
+        assert [len(jobs) for jobs in parsed["groups"].values()] == [2, 2, 1]
+        assert all(os.path.isabs(path) for path in parsed["groups"])
+        assert parsed["options"]["max_retries"] == 1 and parsed["options"]["num_candidates"] == 1
+
+    def test_inline_run_writes_outputs_and_summary(self, manifest, tmp_path, mocker):
+        """测试 2：串行模式下成功任务落盘 CSV / PNG / 代码，闲聊任务跳过，坏文件记录为加载失败"""
+        code = ("```python\nresult_df = df.sort_values('GDP')\n"
+                "fig, ax = plt.subplots()\nax.bar(df['省份'], df['GDP'])\n```")
+        mocker.patch.object(AIDrivenFormAnalyzer, "_chat_completion", return_value=code)
+        init = mocker.spy(AIDrivenFormAnalyzer, "__init__")
+        out_dir = tmp_path / "out"
+
+        summary = run_batch(str(manifest), str(out_dir), api_key="sk-dummy-key-for-testing", max_workers=0)
+
+        assert summary["jobs"] == 5
+        assert summary["status"] == {"success": 2, "skipped_chat": 2, "load_failed": 1}
+        assert summary["latency_s"]["p95"] is not None
+        records = [json.loads(line) for line in (out_dir / "jobs.jsonl").read_text(encoding="utf-8").splitlines()]
+        outputs = [r["outputs"] for r in records if r["status"] == "success"]
+        assert all(os.path.exists(o["csv"]) and os.path.exists(o["png"]) for o in outputs)
+        assert pd.read_csv(outputs[0]["csv"])["GDP"].tolist() == [100.0, 200.0]
+        assert json.loads((out_dir / "summary.json").read_text(encoding="utf-8"))["files"] == 3
+        # 列式缓存写入输出目录，输入目录保持不变
+        assert not (tmp_path / "data" / ".columnar_cache").exists()
+        assert len(os.listdir(out_dir / ".columnar_cache")) == 2
+        # 每个文件组使用输出目录下独立的临时目录，运行结束后删除
+        temp_dirs = [call.kwargs["temp_dir"] for call in init.call_args_list]
+        assert len(set(temp_dirs)) == 3 and all(path.startswith(str(out_dir / ".temp")) for path in temp_dirs)
+        assert not (out_dir / ".temp").exists()
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.utils.chunked_ingest import chunked_read, infer_compact_dtypes
+
+
+class TestChunkedIngest:
+    """测试流式分块加载、类型推断降精度与内存上限保护"""
+
+    @pytest.fixture
+    def csv_path(self, tmp_path):
+        n = 1000
+        df = pd.DataFrame({
+            "年份": np.repeat([2019, 2020, 2021, 2022, 2023], n // 5),
+            "省份": np.tile(["北京市", "上海市", "广东省", "江苏省"], n // 4),
+            "GDP_亿元": np.linspace(1000, 50000, n),
+            "备注": np.where(np.arange(n) % 10 == 0, "待核查", "已核实"),
+        })
+        # 在靠后的分块中制造空值，检验整数列的降级逻辑
+        df["排名"] = np.arange(n)
+        df.loc[n - 1, "排名"] = np.nan
+        path = tmp_path / "big.csv"
+        df.to_csv(path, index=False)
+        return str(path)
+
+    def test_infer_compact_dtypes(self):
+        """测试 1：整数/浮点/低基数文本列应分别推断为 int32/float32/category"""
+        sample = pd.DataFrame({"年份": [2019, 2020, 2021, 2022], "GDP": [1.5, 2.5, 3.5, 4.5],
+                               "省份": ["北京市", "北京市", "上海市", "上海市"]})
+        plan = infer_compact_dtypes(sample)
+        assert plan == {"年份": "int32", "GDP": "float32", "省份": "category"}
+
+    def test_chunked_read_downcasts_and_reports(self, csv_path):
+        """测试 2：分块加载后保持行数一致，并输出峰值内存与吞吐统计"""
+        df, stats = chunked_read(csv_path, chunksize=200)
+
+        assert len(df) == 1000
+        assert stats["chunks"] == 5
+        assert str(df["年份"].dtype) == "int32"
+        assert str(df["GDP_亿元"].dtype) == "float32"
+        assert str(df["省份"].dtype) == "category"
+        assert set(df["省份"].cat.categories) == {"北京市", "上海市", "广东省", "江苏省"}
+        assert stats["peak_memory_mb"] > 0 and stats["rows_per_sec"] > 0
+
+    def test_chunked_read_memory_ceiling(self, csv_path):
+        """测试 3：超过内存上限时应立即中止加载"""
+        with pytest.raises(MemoryError):
+            chunked_read(csv_path, chunksize=200, memory_limit_mb=0.001)
+
+    def test_mixed_category_chunks_fall_back_to_object(self, tmp_path):
+        """测试 4：同一列在不同分块中推断出不同类别类型时退化为 object，而不是中止加载"""
+        path = tmp_path / "mixed.csv"
+        pd.DataFrame({"编码": ["甲", "乙"] * 50 + [1, 2] * 50, "值": np.arange(200)}).to_csv(path, index=False)
+
+        df, stats = chunked_read(str(path), chunksize=100)
+
+        assert len(df) == 200 and df["编码"].dtype == object
+        assert "编码" not in stats["dtype_plan"]
+        assert df["编码"].iloc[0] == "甲" and str(df["编码"].iloc[-1]) == "2"
+
+    def test_concat_overhead_counts_towards_ceiling(self, tmp_path):
+        """测试 5：合并分块时最大一列会短暂存在两份，这部分开销同样计入内存上限与峰值统计"""
+        path = tmp_path / "wide.csv"
+        rows = 200_000
+        pd.DataFrame({"a": np.arange(rows) * 0.5, "b": np.arange(rows)}).to_csv(path, index=False)
+        # 降精度后两列各约 0.76 MB：分块阶段共约 1.53 MB，合并阶段峰值约 2.29 MB
+        _, stats = chunked_read(str(path), chunksize=50_000)
+        assert stats["peak_memory_mb"] == pytest.approx(2.29, abs=0.01)
+
+        with pytest.raises(MemoryError, match="合并分块"):
+            chunked_read(str(path), chunksize=50_000, memory_limit_mb=1.9)
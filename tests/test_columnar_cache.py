@@ -0,0 +1,76 @@
+import os
+import pandas as pd
+import pytest
+from src.core.analyzer import AIDrivenFormAnalyzer
+from src.utils.columnar_cache import file_content_hash, get_cache_path, read_columnar_cache, write_columnar_cache
+
+
+class TestColumnarCache:
+    """测试上传数据的列式旁路缓存与静默恢复链路"""
+
+    @pytest.fixture
+    def analyzer(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        return AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+
+    def test_load_data_writes_cache(self, analyzer, make_upload):
+        """测试 1：load_data 解析后应按内容哈希写出 Feather 缓存"""
+        upload = make_upload("demo.csv", "年份,省份 \n2023,北京市\n2024,上海市\n".encode("utf-8"))
+        file_path = analyzer.load_data(upload)
+
+        cache_path = get_cache_path(file_path, file_content_hash(file_path))
+        assert os.path.exists(cache_path)
+        assert list(analyzer.raw_data.columns) == ["年份", "省份"]
+
+    def test_restore_data_hits_cache(self, analyzer, make_upload, mocker):
+        """测试 2：restore_data 命中缓存时不应再调用 pandas 解析原始文件"""
+        upload = make_upload("demo.csv", "年份,工业产值\n2023,100\n2024,200\n".encode("utf-8"))
+        file_path = analyzer.load_data(upload)
+        analyzer.raw_data = None
+
+        spy = mocker.patch("src.core.analyzer.pd.read_csv")
+        assert analyzer.restore_data(file_path)
+        spy.assert_not_called()
+        assert analyzer.raw_data["工业产值"].tolist() == [100, 200]
+
+    def test_cache_invalidated_by_content_change(self, analyzer, make_upload):
+        """测试 3：源文件内容变化后，旧缓存不应被命中"""
+        upload = make_upload("demo.csv", "a\n1\n".encode("utf-8"))
+        file_path = analyzer.load_data(upload)
+
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("a\n2\n")
+        assert read_columnar_cache(file_path) is None
+
+        assert analyzer.restore_data(file_path)
+        assert analyzer.raw_data["a"].tolist() == [2]
+
+    def test_central_cache_dir_keeps_same_named_sources_apart(self, tmp_path):
+        """测试 4：集中缓存目录中，不同目录下的同名源文件各自保留缓存，源文件目录不写入任何文件"""
+        cache_dir = str(tmp_path / "cache")
+        paths = []
+        for sub, value in (("x", 1), ("y", 2)):
+            (tmp_path / sub).mkdir()
+            path = str(tmp_path / sub / "demo.csv")
+            pd.DataFrame({"a": [value]}).to_csv(path, index=False)
+            write_columnar_cache(pd.read_csv(path), path, cache_dir=cache_dir)
+            paths.append(path)
+
+        assert [read_columnar_cache(path, cache_dir=cache_dir)["a"].tolist() for path in paths] == [[1], [2]]
+        assert not (tmp_path / "x" / ".columnar_cache").exists()
+
+    def test_chunked_cache_kept_apart_from_standard(self, analyzer, make_upload):
+        """测试 5：分块加载降精度后的缓存与标准解析的缓存分开存放，标准模式恢复时仍得到原始精度"""
+        upload = make_upload("demo.csv", "年份,GDP\n2023,1.1\n2024,2.2\n".encode("utf-8"))
+        analyzer.ingest_mode = "chunked"
+        analyzer.ingest_chunksize = 1
+        file_path = analyzer.load_data(upload)
+        assert analyzer.raw_data["GDP"].dtype == "float32"
+
+        analyzer.ingest_mode = "standard"
+        assert analyzer.restore_data(file_path)
+        assert analyzer.raw_data["GDP"].dtype == "float64"
+        assert analyzer.raw_data["GDP"].tolist() == [1.1, 2.2]
+
+        analyzer.ingest_mode = "chunked"
+        assert analyzer.restore_data(file_path) and analyzer.raw_data["GDP"].dtype == "float32"
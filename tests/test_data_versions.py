@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from src.core.analyzer import AIDrivenFormAnalyzer
+from src.core.data_versions import DataVersionStore
+
+
+def base_frame(rows=50_000):
+    return pd.DataFrame({"省份": np.where(np.arange(rows) % 2, "北京市", "上海市").astype(object),
+                         "GDP": np.arange(rows, dtype="float64"),
+                         "年份": pd.Categorical(np.full(rows, 2023))})
+
+
+class TestDataVersionStore:
+    """测试底表版本历史：列级结构共享、撤销 / 重做与超出内存预算时的落盘"""
+
+    def test_unchanged_columns_are_shared(self):
+        """测试 1：新增列的版本与父版本共享未变化的列 (零拷贝)，撤销 / 重做只移动指针"""
+        store = DataVersionStore()
+        root = store.reset(base_frame())
+        with pd.option_context("mode.copy_on_write", True):
+            derived = store.current.assign(GDP_万元=lambda d: d["GDP"] * 1e4)
+        # 经过进程边界 / 深拷贝的结果与父版本不再共享内存，按值比较后同样复用父版本的列
+        copied = derived.copy(deep=True)
+        copied["GDP"] = copied["GDP"] + 1
+
+        v1 = store.commit(derived, "新增 GDP_万元")
+        v2 = store.commit(copied, "GDP 加一")
+
+        history = store.history()
+        assert [record["shared_columns"] for record in history] == [0, 3, 3]
+        assert np.shares_memory(store.get(root)["GDP"].to_numpy(), store.get(v1)["GDP"].to_numpy())
+        assert np.shares_memory(store.get(v1)["GDP_万元"].to_numpy(), store.get(v2)["GDP_万元"].to_numpy())
+
+        assert store.undo() == v1 and store.undo() == root and store.undo() == root
+        pd.testing.assert_frame_equal(store.current, base_frame())
+        assert store.redo() == v1 and store.can_redo
+
+        # 撤销后提交新版本会丢弃被撤销的分支
+        v3 = store.commit(store.current.head(10), "取前 10 行")
+        assert [record["id"] for record in store.history()] == [root, v1, v3] and not store.can_redo
+
+    def test_old_versions_spill_to_disk_within_budget(self, tmp_path):
+        """测试 2：超出内存预算时旧版本独占的列落盘，当前版本常驻内存；切回旧版本时数据完整读回"""
+        store = DataVersionStore(memory_budget_mb=0, spill_dir=str(tmp_path / "versions"))
+        store.reset(base_frame())
+        frames = [base_frame()]
+        for step in range(3):
+            df = frames[-1].copy()
+            df["GDP"] = df["GDP"] * 2
+            frames.append(df)
+            store.commit(df, f"第 {step + 1} 次翻倍")
+
+        stats = store.stats()
+        # 共享的 省份 / 年份 列被当前版本引用，始终常驻；只有各旧版本独占的 GDP 列落盘
+        assert stats["spills"] == 3 and stats["spilled_mb"] == pytest.approx(3 * 50_000 * 8 / 1024 / 1024, abs=0.01)
+        assert [record["spilled"] for record in store.history()] == [True, True, True, False]
+
+        while store.can_undo:
+            store.undo()
+        pd.testing.assert_frame_equal(store.current, frames[0])
+        store.redo()
+        pd.testing.assert_frame_equal(store.current, frames[1])
+
+        store.close()
+        assert not os.path.exists(tmp_path / "versions")
+
+    def test_committed_frames_are_read_only(self):
+        """测试 3：对已提交的数据框就地修改会报错而不是改写历史；经由可写视图构造的数据框改存副本"""
+        store = DataVersionStore()
+        df = pd.DataFrame({"a": [1, 2, 3], "b": [1, 2, 3]})
+        root = store.reset(df)
+        v1 = store.commit(df.assign(c=1), "新增列")
+        with pytest.raises(ValueError, match="read-only"):
+            df.loc[1, "b"] = -5
+        assert store.get(root)["b"].tolist() == store.get(v1)["b"].tolist() == [1, 2, 3]
+
+        matrix = np.arange(6, dtype="float64").reshape(2, 3)
+        transposed = pd.DataFrame(matrix.T, copy=False)
+        store.reset(transposed)
+        transposed.iloc[0, 0] = -1.0  # 转置视图仍可写，但历史中保存的是副本
+        assert store.current.iloc[0, 0] == 0.0
+
+    def test_spilled_columns_shared_after_undo(self, tmp_path):
+        """测试 4：撤销到列已落盘的旧版本后提交新版本，仍共享读回的列，且不重复落盘"""
+        store = DataVersionStore(memory_budget_mb=0, spill_dir=str(tmp_path / "versions"))
+        store.reset(base_frame())
+        store.commit(base_frame().assign(GDP=lambda d: d["GDP"] * 2), "翻倍")
+        assert store.stats()["spills"] == 1 and store.history()[0]["spilled"]
+
+        store.undo()
+        store.commit(store.current.assign(备注="无"), "新增备注")
+        assert store.history()[-1]["shared_columns"] == 3
+        assert store.stats()["spills"] == 1
+
+
+class TestAnalyzerVersioning:
+    """测试分析器接入版本历史：update_df 生成新版本，撤销后元信息按版本 id 命中缓存"""
+
+    @pytest.fixture
+    def analyzer(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        agent.raw_data = pd.DataFrame({"省份": ["北京市", "上海市"], "GDP": [100.0, None]})
+        return agent
+
+    def test_undo_redo_after_bad_cleaning(self, analyzer, mocker, llm_reply):
+        """测试 5：错误的清洗步骤可撤销回原始底表，无需重新上传；版本 id 作为元信息缓存键"""
+        root = analyzer.version_id
+        root_metadata = analyzer.get_data_metadata()
+        mocker.patch.object(analyzer.client.chat.completions, "create",
+                            side_effect=[llm_reply("update_df = df.dropna()"),
+                                         llm_reply("update_df = df.assign(GDP=df['GDP'] * 2)")])
+
+        assert analyzer.execute_agentic_code(query="删除空值", metadata="{}")[0]
+        cleaned = analyzer.version_id
+        assert cleaned != root and len(analyzer.processed_data) == 1
+        assert analyzer.versions.history()[-1]["label"] == "删除空值"
+
+        spy = mocker.spy(AIDrivenFormAnalyzer, "_build_metadata_profile")
+        assert analyzer.undo_data()
+        assert analyzer.version_id == root and analyzer.processed_data is None
+        assert analyzer.get_data_metadata() == root_metadata
+        spy.assert_not_called()
+        assert not analyzer.undo_data()
+
+        assert analyzer.redo_data() and analyzer.version_id == cleaned
+        assert analyzer.processed_data["省份"].tolist() == ["北京市"]
+
+        analyzer.undo_data()
+        assert analyzer.execute_agentic_code(query="GDP 翻倍", metadata="{}")[0]
+        assert analyzer.processed_data["GDP"].tolist()[0] == 200.0
+        assert not analyzer.versions.can_redo and len(analyzer.versions.history()) == 2
@@ -0,0 +1,108 @@
+import json
+
+import pandas as pd
+import pytest
+from src.core.analyzer import AIDrivenFormAnalyzer
+from src.core.sandbox_pool import SandboxPool
+from src.utils import excel_reader
+from src.utils.excel_reader import SheetBook, read_excel_sheet, read_excel_sheets
+
+SHEETS = {
+    "汇总": pd.DataFrame({"省份": ["北京市", "上海市"], "GDP": [100.5, 200.5]}),
+    "1月": pd.DataFrame({"省份": ["北京市", "上海市"], "排放量": [1.5, 2.5]}),
+    "detail": pd.DataFrame({"省份": ["北京市", "北京市"], "企业": ["甲", "乙"]}),
+}
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "monthly.xlsx"
+    with pd.ExcelWriter(path) as writer:
+        for name, df in SHEETS.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def analyzer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+
+
+class TestExcelReader:
+    """测试 Excel 引擎回退、多工作表并行/懒加载与沙箱中的工作表变量"""
+
+    def test_engine_falls_back_when_calamine_unusable(self, workbook, monkeypatch):
+        """测试 1：calamine 引擎不可用 (未安装或解析失败) 时自动回退到 pandas 默认引擎"""
+        monkeypatch.setattr(excel_reader, "CALAMINE_AVAILABLE", True)
+        calls = []
+        original = pd.read_excel
+
+        def flaky_read_excel(*args, engine=None, **kwargs):
+            calls.append(engine)
+            if engine == "calamine":
+                raise ImportError("python-calamine 未安装")
+            return original(*args, engine=engine, **kwargs)
+
+        monkeypatch.setattr(excel_reader.pd, "read_excel", flaky_read_excel)
+        df = read_excel_sheet(workbook, "1月")
+
+        assert calls == ["calamine", None]
+        pd.testing.assert_frame_equal(df, SHEETS["1月"])
+
+    def test_parallel_read_matches_serial(self, workbook):
+        """测试 2：进程池并行读取多个工作表，结果与串行读取一致且保持工作表顺序"""
+        parallel = read_excel_sheets(workbook, list(SHEETS), max_workers=2, parallel_min_bytes=0)
+        serial = read_excel_sheets(workbook, list(SHEETS), max_workers=1)
+
+        assert list(parallel) == list(SHEETS)
+        for name, df in SHEETS.items():
+            pd.testing.assert_frame_equal(parallel[name], df)
+            pd.testing.assert_frame_equal(serial[name], df)
+
+    def test_all_sheets_exposed_to_sandbox(self, analyzer, workbook):
+        """测试 3：首个工作表作为底表，其余工作表按变量名与 sheets 字典注入沙箱，并写入元信息"""
+        analyzer.load_data(workbook)
+
+        assert analyzer.sheets.loaded_names == list(SHEETS)
+        pd.testing.assert_frame_equal(analyzer.raw_data, SHEETS["汇总"])
+        catalog = json.loads(analyzer.get_data_metadata())["sheets"]
+        assert catalog["sheet_2"] == {"sheet": "1月", "columns": ["省份", "排放量"], "shape": [2, 2]}
+        assert catalog["detail"]["sheet"] == "detail"
+
+        code = ("result_df = df.merge(sheet_2, on='省份')\n"
+                "result_df['企业数'] = result_df['省份'].map(sheets['detail'].groupby('省份').size()).fillna(0)")
+        outputs = analyzer._run_sandbox(code, analyzer.raw_data)
+        assert outputs["result_df"]["排放量"].tolist() == [1.5, 2.5]
+        assert outputs["result_df"]["企业数"].tolist() == [2, 0]
+
+    def test_lazy_mode_loads_only_referenced_sheets(self, analyzer, workbook, mocker):
+        """测试 4：懒加载模式下只解析生成代码引用的工作表，刷新恢复时命中按工作表划分的列式缓存"""
+        analyzer.excel_sheet_mode = "lazy"
+        analyzer.load_data(workbook)
+        assert analyzer.sheets.loaded_names == ["汇总"]
+        assert analyzer.sheets.columns("detail") == ["省份", "企业"]
+
+        outputs = analyzer._run_sandbox("result_df = detail.drop_duplicates('省份')", analyzer.raw_data)
+        assert len(outputs["result_df"]) == 1
+        assert analyzer.sheets.loaded_names == ["汇总", "detail"]
+
+        restored = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        restored.excel_sheet_mode = "lazy"
+        spy = mocker.spy(excel_reader, "read_excel_sheets")
+        parse = mocker.spy(excel_reader, "read_excel_sheet")
+        assert restored.restore_data(workbook)
+        pd.testing.assert_frame_equal(restored.sheets["detail"], SHEETS["detail"])
+        assert isinstance(restored.sheets, SheetBook) and spy.call_count == 0 and parse.call_count == 0
+
+    def test_sheets_passed_to_process_sandbox(self, analyzer, workbook):
+        """测试 5：进程池沙箱同样可以访问工作表变量与 sheets 字典"""
+        analyzer.load_data(workbook)
+        pool = SandboxPool(size=1, timeout_s=30)
+        analyzer.sandbox_pool = pool
+        try:
+            outputs = analyzer._run_sandbox(
+                "result_df = pd.DataFrame({'n': [len(sheets), len(sheet_2), len(raw_df)]})", analyzer.raw_data)
+        finally:
+            pool.close()
+        assert outputs["result_df"]["n"].tolist() == [3, 2, 2]
@@ -0,0 +1,51 @@
+import gzip
+import io
+import matplotlib.pyplot as plt
+import pandas as pd
+import pytest
+from src.utils.export_cache import ExportCache, export_dataframe, export_figure, iter_csv_chunks
+from src.utils.history_store import ChatHistoryStore
+
+
+class TestExportCache:
+    """测试按需导出：分块 CSV、压缩格式与产物缓存"""
+
+    @pytest.fixture
+    def df(self):
+        return pd.DataFrame({"省份": ["北京市", "上海市", "广东省"] * 4, "GDP": range(12)})
+
+    def test_chunked_csv_matches_full_export(self, df):
+        """测试 1：分块生成的 CSV / gzip 与整表 to_csv 字节一致，Parquet 可无损读回"""
+        expected = df.to_csv(index=False).encode("utf-8-sig")
+
+        assert b"".join(iter_csv_chunks(df, chunksize=5)) == expected
+        assert gzip.decompress(export_dataframe(df, "csv.gz", chunksize=5)) == expected
+        pd.testing.assert_frame_equal(pd.read_parquet(io.BytesIO(export_dataframe(df, "parquet"))), df)
+
+    def test_cache_generates_once_and_evicts(self):
+        """测试 2：同一 (结果, 格式) 只生成一次；超过容量上限时淘汰最久未用的产物"""
+        cache = ExportCache(max_bytes=10)
+        calls = []
+
+        def producer():
+            calls.append(1)
+            return b"12345678"
+
+        assert cache.get("r1", "csv") is None
+        cache.get_or_create("r1", "csv", producer)
+        cache.get_or_create("r1", "csv", producer)
+        assert len(calls) == 1 and (cache.hits, cache.misses) == (1, 1)
+
+        cache.get_or_create("r2", "csv", producer)
+        assert cache.get("r1", "csv") is None and cache.get("r2", "csv") is not None
+
+    def test_high_dpi_export_from_spilled_history(self, tmp_path):
+        """测试 3：历史中只保留缩略图，高清导出时从磁盘还原 Figure 重新渲染"""
+        store = ChatHistoryStore(spill_dir=str(tmp_path / "history"), thumbnail_dpi=20)
+        fig, ax = plt.subplots()
+        ax.plot([1, 3, 2])
+        store.append({"role": "assistant", "type": "plot", "content": fig})
+
+        png = export_figure(store.load_figure(store[0]), dpi=150)
+
+        assert png.startswith(b"\x89PNG") and len(png) > len(store.load(store[0]))
@@ -1,6 +1,8 @@
 import pandas as pd
 import pytest
-from src.utils.helpers import extract_json_from_response, make_dataframe_safe_for_ui
+from src.utils import helpers
+from src.utils.helpers import (extract_json_from_response, make_dataframe_safe_for_ui, DataFramePager,
+                               estimate_frame_memory_mb)
 
 
 class TestHelpers:
@@ -47,4 +49,34 @@ class TestHelpers:
         # 2. 断言混合列和纯文本列变成了 object (在 Pandas 中 str 就是 object)
         # 并且其中的元素变成了纯粹的字符串格式
         assert type(safe_df['混合列'].iloc[0]) == str
-        assert safe_df['混合列'].iloc[0] == "1"
\ No newline at end of file
+        assert safe_df['混合列'].iloc[0] == "1"
+
+    def test_make_dataframe_safe_for_ui_keeps_source_intact(self):
+        """测试 UI 防腐函数不修改原数据框 (内部只做浅拷贝)"""
+        df = pd.DataFrame({'混合列': [1, "字符串"], '数值列': [1.0, 2.0]})
+
+        make_dataframe_safe_for_ui(df)
+
+        assert df['混合列'].iloc[0] == 1
+
+    def test_pager_converts_only_visible_window(self, mocker):
+        """测试分页预览：只转换可见页，同一数据版本的页命中缓存，版本变化后重新转换"""
+        df = pd.DataFrame({'id': range(1050), '混合列': [1, "a", 2.5] * 350})
+        pager = DataFramePager(page_size=500, max_pages=2)
+        spy = mocker.spy(helpers, "make_dataframe_safe_for_ui")
+
+        last = pager.get_page(df, "raw_1", 99)
+        assert pager.page_count(df) == 3 and len(last) == 50 and last['id'].iloc[0] == 1000
+        assert type(last['混合列'].iloc[0]) == str
+        assert len(spy.call_args.args[0]) == 50
+
+        pager.get_page(df, "raw_1", 2)
+        pager.get_page(df, "raw_2", 2)
+        assert (pager.hits, pager.misses) == (1, 2)
+
+    def test_estimate_frame_memory(self):
+        """测试内存估算：定长列精确，object 列按抽样外推"""
+        df = pd.DataFrame({'数值列': range(100_000), '文本列': ["北京市"] * 100_000})
+        exact = df.memory_usage(index=True, deep=True).sum() / 1024 / 1024
+
+        assert estimate_frame_memory_mb(df, sample_rows=1000) == pytest.approx(exact, rel=0.05)
@@ -0,0 +1,49 @@
+import matplotlib.pyplot as plt
+import pandas as pd
+import pytest
+from src.utils.history_store import ChatHistoryStore
+
+
+class TestChatHistoryStore:
+    """测试对话历史的落盘、内存预算与按需重载"""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        return ChatHistoryStore(spill_dir=str(tmp_path / "history"), memory_budget_mb=1)
+
+    def test_list_compatible_and_spills_artifacts(self, store):
+        """测试 1：行为与列表一致；数据框 / 图表落盘后消息中不再持有原对象"""
+        df = pd.DataFrame({"省份": ["北京市", "上海市"], "GDP": [1.5, 2.5]})
+        fig, ax = plt.subplots()
+        ax.plot([1, 2, 3])
+
+        store.append({"role": "user", "type": "text", "content": "画个图"})
+        store.append({"role": "assistant", "type": "dataframe", "content": df})
+        store.append({"role": "assistant", "type": "plot", "content": fig})
+
+        assert len(store) == 3 and [m["type"] for m in store[-2:]] == ["dataframe", "plot"]
+        assert all("content" not in m for m in store[1:])
+        assert not plt.fignum_exists(fig.number)
+        pd.testing.assert_frame_equal(store.load(store[1]), df)
+        assert store.load(store[2]).startswith(b"\x89PNG")
+        assert store.load(store[0]) == "画个图"
+
+    def test_lru_budget_and_lazy_reload(self, store):
+        """测试 2：超过内存预算时淘汰最久未访问的内容，再次读取时从磁盘重载且内容一致"""
+        frames = [pd.DataFrame({"值": range(60_000)}).assign(批次=i) for i in range(3)]  # 每个约 0.9MB
+        for df in frames:
+            store.append({"role": "assistant", "type": "dataframe", "content": df})
+
+        assert store.memory_usage_mb() <= 1
+        assert store.reloads == 0
+        pd.testing.assert_frame_equal(store.load(store[0]), frames[0])
+        assert store.reloads == 1
+
+    def test_unparquetable_frame_falls_back_to_pickle(self, store):
+        """测试 3：混合类型列无法写入 Parquet 时退化为压缩 pickle，内容无损"""
+        df = pd.DataFrame({"混合列": [1, "字符串", 3.5]})
+        store.append({"role": "assistant", "type": "dataframe", "content": df})
+        store._loaded.clear()
+
+        assert store[0]["path"].endswith(".pkl.gz")
+        pd.testing.assert_frame_equal(store.load(store[0]), df)
@@ -0,0 +1,120 @@
+import pandas as pd
+import pytest
+from src.core.analyzer import AIDrivenFormAnalyzer
+from src.core.knowledge_store import warmup_embedding_function
+from src.core.lexical_index import AhoCorasickMatcher, BM25Index, reciprocal_rank_fusion, tokenize
+
+
+class TestKnowledgeIngest:
+    """测试知识库的向量化构建、分批写入、持久化去重与检索隔离"""
+
+    @pytest.fixture
+    def make_agent(self, tmp_path, embedding):
+        def _make():
+            agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing", kb_persist_dir=str(tmp_path / "kb"),
+                                         embedding_function=embedding)
+            agent.kb_batch_size = 2
+            return agent
+        return _make
+
+    def test_table_sentences_match_row_format(self):
+        """测试 1：按列拼接的条目文本与逐行 iterrows 的格式完全一致"""
+        df = pd.DataFrame({"指标": ["TEGDP", "GDP"], "阈值": [1.5, None]})
+        expected = [", ".join([f"{col}: {row[col]}" for col in df.columns]) for _, row in df.iterrows()]
+
+        assert AIDrivenFormAnalyzer._build_table_sentences(df) == expected
+
+    def test_batched_upsert_with_progress(self, make_agent, make_upload):
+        """测试 2：条目按批次写入，进度回调最终到达总数"""
+        agent = make_agent()
+        csv = "规则,说明\n" + "\n".join(f"R{i},说明{i}" for i in range(5))
+        progress = []
+
+        success, msg = agent.load_custom_knowledge(make_upload("kb.csv", csv.encode("utf-8")),
+                                                   progress_callback=lambda done, total: progress.append((done, total)))
+
+        assert success and "新向量化 5 条" in msg
+        assert len(progress) == 3 and progress[-1] == (5, 5)
+        assert agent.collection.count() == 5
+
+    def test_persistent_store_skips_reembedding(self, make_agent, embedding, make_upload):
+        """测试 3：新会话重复上传未变化的知识库时直接复用磁盘向量，不再调用向量化模型"""
+        data = "规则,说明\nR1,不允许负值\nR1,不允许负值\nR2,缺失值填 0\n".encode("utf-8")
+
+        first = make_agent()
+        assert "新向量化 2 条" in first.load_custom_knowledge(make_upload("kb.csv", data))[1]
+        embedded_before = embedding.embedded
+
+        second = make_agent()
+        success, msg = second.load_custom_knowledge(make_upload("kb.csv", data))
+
+        assert success and "新向量化 0 条" in msg and "复用 2 条" in msg
+        assert embedding.embedded == embedded_before
+        assert len(second.custom_kb_docs) == 2
+        assert second.collection.count() == 2
+
+    def test_retrieval_scoped_to_session_sources(self, make_agent, make_upload):
+        """测试 4：共享向量库中其它会话挂载的知识不会泄漏到本会话的检索结果"""
+        other = make_agent()
+        other.load_custom_knowledge(make_upload("other.txt", "其它会话的保密规则：利润率不得公开。".encode("utf-8")))
+
+        agent = make_agent()
+        assert agent.retrieve_knowledge("利润率") == ""
+
+        agent.load_custom_knowledge(make_upload("kb.txt", "本会话规则：GDP 单位统一为亿元。".encode("utf-8")))
+        context = agent.retrieve_knowledge("GDP 单位")
+        assert "亿元" in context and "利润率" not in context
+
+    def test_warmup_runs_embedding_once(self, embedding):
+        """测试 5：后台预热线程完成一次推理"""
+        warmup_embedding_function(embedding).join(timeout=5)
+
+        assert embedding.calls == 1
+
+    def test_decisive_lexical_hit_skips_vector_query(self, make_agent, mocker, make_upload):
+        """测试 6：BM25 命中决定性时跳过向量检索，否则与向量结果融合"""
+        agent = make_agent()
+        agent.load_custom_knowledge(make_upload("kb.csv", "规则,说明\n绿色发展指数,等于 GDP 除以能耗\n配色规范,统一使用绿色系\n"
+                                                .encode("utf-8")))
+        spy = mocker.spy(agent, "_vector_search")
+
+        assert "等于 GDP 除以能耗" in agent.retrieve_knowledge("绿色发展指数")
+        spy.assert_not_called()
+
+        agent.retrieve_knowledge("图表颜色怎么选")
+        spy.assert_called_once()
+        assert agent.retrieval_stats == {"lexical_only": 1, "hybrid": 1}
+
+
+class TestLexicalIndex:
+    """测试 Aho-Corasick 术语匹配、BM25 倒排索引与 RRF 融合"""
+
+    def test_aho_corasick_overlapping_terms(self):
+        """测试 1：重叠术语与中英混合术语一次扫描全部命中，大小写不敏感"""
+        matcher = AhoCorasickMatcher(["TEGDP", "GDP", "绿色发展", "发展指数", "未出现"])
+
+        assert matcher.find_all("请解释 tegdp 与绿色发展指数") == ["TEGDP", "GDP", "绿色发展", "发展指数"]
+
+    def test_glossary_lookup_matches_substring_scan(self):
+        """测试 2：内置词典检索结果与逐词子串扫描一致，新增或替换词条后自动重建自动机"""
+        agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        assert "能源消耗 / 工业产值" in agent.retrieve_knowledge("tegdp 怎么算")
+
+        agent.business_kb["绿色发展指数"] = "绿色发展指数 = GDP / 能源消耗。"
+        assert "GDP / 能源消耗" in agent.retrieve_knowledge("算一下绿色发展指数")
+
+        # 条目数不变、键被替换时同样重建，不能残留旧术语
+        agent.business_kb = {"能耗强度": "能耗强度 = 能源消耗 / GDP。", "TEGDP": agent.business_kb["TEGDP"]}
+        assert "能源消耗 / GDP" in agent.retrieve_knowledge("能耗强度是多少")
+        assert "绿色发展指数" not in agent.retrieve_knowledge("算一下绿色发展指数")
+
+    def test_bm25_ranking_and_rrf(self):
+        """测试 3：BM25 按相关度排序并给出覆盖率；RRF 优先选择多路共同命中的条目"""
+        index = BM25Index()
+        index.add(["GDP 单位统一为亿元", "利润率不得公开", "绿色发展指数计算公式"])
+
+        hits = index.search("绿色发展指数怎么计算")
+        assert hits[0][0] == 2 and 0 < hits[0][2] <= 1
+        assert index.search("完全无关") == []
+        assert tokenize("GDP的口径") == ["gdp", "的口", "口径"]
+        assert reciprocal_rank_fusion([["a", "b"], ["b", "c"]])[0] == "b"
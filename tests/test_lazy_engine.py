@@ -0,0 +1,111 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from src.core.analyzer import AIDrivenFormAnalyzer
+
+duckdb = pytest.importorskip("duckdb")
+
+ROWS = 5_000
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "large.csv"
+    pd.DataFrame({"省份 ": np.where(np.arange(ROWS) % 2, "北京市", "上海市"),
+                  "GDP": np.where(np.arange(ROWS) % 10 == 0, np.nan, np.arange(ROWS) * 1.5)}).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def analyzer(tmp_path, monkeypatch, csv_file):
+    monkeypatch.chdir(tmp_path)
+    agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+    agent.execution_engine = "duckdb"
+    agent.lazy_preview_rows = 100
+    agent.load_data(csv_file)
+    return agent
+
+
+class TestLazyEngine:
+    """测试 DuckDB 惰性执行引擎：流式落盘、只物化 result_df、update_df 生成可撤销的新版本"""
+
+    def test_csv_ingested_without_pandas(self, tmp_path, monkeypatch, csv_file, mocker):
+        """测试 1：CSV 由 DuckDB 流式转为列式文件，内存中只保留预览，元信息按整表统计"""
+        monkeypatch.chdir(tmp_path)
+        agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        agent.execution_engine = "duckdb"
+        agent.lazy_preview_rows = 100
+        read_csv = mocker.spy(pd, "read_csv")
+        agent.load_data(csv_file)
+
+        read_csv.assert_not_called()
+        assert len(agent.raw_data) == 100 and len(agent.lazy_table) == ROWS
+        profile = json.loads(agent.get_data_metadata())
+        assert profile["shape"] == [ROWS, 2] and profile["columns"] == ["省份", "GDP"]
+        assert profile["missing_values"] == {"省份": 0, "GDP": ROWS // 10}
+
+        restored = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        restored.execution_engine = "duckdb"
+        ingest = mocker.patch("src.core.analyzer.ingest_csv")
+        assert restored.restore_data(csv_file)
+        ingest.assert_not_called()
+        assert len(restored.lazy_table) == ROWS
+
+    def test_only_result_is_materialized(self, analyzer, csv_file):
+        """测试 2：result_df 为 DuckDB 关系时由系统物化；连接禁止访问外部文件，超大结果要求先聚合"""
+        outputs = analyzer._run_sandbox(
+            "result_df = con.sql('SELECT 省份, SUM(GDP) AS GDP FROM data WHERE GDP > 0 GROUP BY 1 ORDER BY 1')",
+            analyzer.raw_data)
+        expected = pd.read_csv(csv_file)
+        expected = expected[expected["GDP"] > 0].groupby("省份 ")["GDP"].sum().sort_index()
+        assert isinstance(outputs["result_df"], pd.DataFrame)
+        assert outputs["result_df"]["GDP"].tolist() == pytest.approx(expected.tolist())
+
+        with pytest.raises(duckdb.PermissionException):
+            analyzer._run_sandbox("result_df = con.sql(\"SELECT * FROM read_csv('/etc/passwd')\")", analyzer.raw_data)
+
+        analyzer.lazy_result_max_rows = 1000
+        with pytest.raises(ValueError, match="请先聚合"):
+            analyzer._run_sandbox("result_df = df", analyzer.raw_data)
+
+    def test_update_creates_undoable_lazy_version(self, analyzer, mocker, llm_reply):
+        """测试 3：update_df 流式写成新的列式文件作为新版本，撤销后切回原始惰性表"""
+        root, root_table = analyzer.version_id, analyzer.lazy_table
+        mocker.patch.object(analyzer.client.chat.completions, "create",
+                            return_value=llm_reply("update_df = df.filter('GDP IS NOT NULL')"))
+
+        success, result, _ = analyzer.execute_agentic_code(query="删除空值", metadata="{}")
+        assert success and "4500 行" in result["text"]
+        assert len(analyzer.lazy_table) == ROWS - ROWS // 10 and analyzer.lazy_table.path.endswith(".parquet")
+        assert len(analyzer.processed_data) == analyzer.lazy_preview_rows
+        assert json.loads(analyzer.get_data_metadata())["missing_values"]["GDP"] == 0
+
+        assert analyzer.undo_data()
+        assert analyzer.version_id == root and analyzer.lazy_table is root_table
+        assert json.loads(analyzer.get_data_metadata())["missing_values"]["GDP"] == ROWS // 10
+        assert analyzer.redo_data() and len(analyzer.lazy_table) == ROWS - ROWS // 10
+
+    def test_derived_files_follow_version_history(self, analyzer, mocker, llm_reply):
+        """测试 4：只有提交的版本写出 Parquet 文件；版本被丢弃 (超出上限 / 撤销后提交) 时其文件一并删除"""
+        lazy_dir = analyzer._lazy_dir()
+        analyzer.versions.max_versions = 3
+        mocker.patch.object(analyzer.client.chat.completions, "create",
+                            return_value=llm_reply("update_df = df.filter('GDP IS NOT NULL')"))
+
+        # 并行候选全部执行成功，只有胜出者写出文件
+        assert analyzer.execute_agentic_code(query="删除空值", metadata="{}", num_candidates=3)[0]
+        assert [name.endswith(".parquet") for name in os.listdir(lazy_dir)].count(True) == 1
+
+        for step in range(3):
+            assert analyzer.execute_agentic_code(query=f"第 {step + 1} 次", metadata="{}")[0]
+        analyzer.undo_data()
+        assert analyzer.execute_agentic_code(query="撤销后重新提交", metadata="{}")[0]
+
+        kept = [record["id"] for record in analyzer.versions.history()]
+        parquet = sorted(name for name in os.listdir(lazy_dir) if name.endswith(".parquet"))
+        assert len(kept) == 3 and set(analyzer._lazy_tables) == set(kept)
+        # 原始版本使用源文件的列式缓存，不计入会话目录
+        assert parquet == sorted(os.path.basename(analyzer._lazy_tables[v].path) for v in kept[1:])
@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+from unittest.mock import MagicMock
+from src.core.analyzer import AIDrivenFormAnalyzer
+from src.core.llm_cache import LLMResponseCache
+
+
+class TestLLMResponseCache:
+    """测试大模型响应缓存的命中、淘汰与在 Agent 链路中的接入"""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return LLMResponseCache(db_path=str(tmp_path / "llm_cache.sqlite3"), max_entries=2)
+
+    def test_lru_eviction_and_ttl(self, cache):
+        """测试 1：超过条目上限时淘汰最久未访问的条目，过期条目视为未命中"""
+        cache.set("a", "A")
+        cache.set("b", "B")
+        assert cache.get("a") == "A"  # 刷新 a 的访问时间
+        cache.set("c", "C")
+
+        assert cache.get("b") is None
+        assert cache.get("a") == "A" and cache.get("c") == "C"
+
+        cache.ttl_seconds = -1
+        assert cache.get("a") is None
+        assert cache.stats()["hits"] == 3
+
+    def test_key_covers_model_temperature_and_prompt(self):
+        """测试 2：模型、温度或 Prompt 任一变化都必须产生不同的缓存键"""
+        messages = [{"role": "user", "content": "画个图"}]
+        base = LLMResponseCache.make_key("deepseek-chat", 0.1, messages, max_tokens=5000)
+        assert base == LLMResponseCache.make_key("deepseek-chat", 0.1, list(messages), max_tokens=5000)
+        assert base != LLMResponseCache.make_key("deepseek-chat", 0.0, messages, max_tokens=5000)
+        assert base != LLMResponseCache.make_key("deepseek-reasoner", 0.1, messages, max_tokens=5000)
+        assert base != LLMResponseCache.make_key("deepseek-chat", 0.1, [{"role": "user", "content": "画图"}],
+                                                 max_tokens=5000)
+
+    def test_agent_cache_hit_skips_network(self, cache, mocker):
+        """测试 3：相同的代码生成请求第二次直接命中缓存；执行失败的代码不会被缓存"""
+        agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing", llm_cache=cache)
+        agent.raw_data = pd.DataFrame({"工业产值": [100, 200]})
+        ok_response = MagicMock()
+        ok_response.choices[0].message.content = "```python\nresult_df = df.describe()\n```"
+        spy = mocker.patch.object(agent.client.chat.completions, 'create', return_value=ok_response)
+
+        assert agent.execute_agentic_code(query="描述统计", metadata="{}", max_retries=1)[0]
+        agent.last_executed_code = ""
+        assert agent.execute_agentic_code(query="描述统计", metadata="{}", max_retries=1)[0]
+        assert spy.call_count == 1
+
+        bad_response = MagicMock()
+        bad_response.choices[0].message.content = "```python\nraise ValueError('boom')\n```"
+        spy.return_value = bad_response
+        assert not agent.execute_agentic_code(query="出错", metadata="{}", max_retries=1)[0]
+        assert not agent.execute_agentic_code(query="出错", metadata="{}", max_retries=1)[0]
+        assert spy.call_count == 3
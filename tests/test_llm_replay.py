@@ -0,0 +1,66 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from src.core.analyzer import AIDrivenFormAnalyzer
+
+# 与基准脚本一致，从 benchmarks 目录直接导入 (该目录不是包，且可能与同名的第三方包冲突)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from llm_replay import CassetteMissError, RecordReplayLLM, request_key  # noqa: E402
+
+CODEGEN_MESSAGES = [{"role": "user", "content": '用户的最新需求："按年份汇总 GDP"\n请输出代码'}]
+
+
+class StubUpstream:
+    """录制模式的上游桩：返回固定回复与 token 用量，并记录调用次数"""
+
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, stream=False, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))],
+            usage=SimpleNamespace(prompt_tokens=12, completion_tokens=5, total_tokens=17))
+
+
+class TestRecordReplayLLM:
+    """测试基准用的 LLM 录制 / 回放替身：录制往返一致，回放未命中必须暴露出来"""
+
+    def test_record_round_trip(self, tmp_path):
+        """测试 1：录制模式写入 cassette，回放模式按相同的键返回相同的回复、用量与流式分片"""
+        cassette = str(tmp_path / "cassette.json")
+        upstream = StubUpstream("```python\nresult_df = df\n```")
+        recorder = RecordReplayLLM(cassette, mode="record", upstream=upstream)
+
+        recorder.chat.completions.create(messages=CODEGEN_MESSAGES, temperature=0.1)
+        recorder.chat.completions.create(messages=CODEGEN_MESSAGES, temperature=0.1)
+        assert upstream.calls == 1 and recorder.misses == 1
+        assert list(json.load(open(cassette, encoding="utf-8"))["entries"]) == ["codegen|0|按年份汇总 GDP"]
+
+        player = RecordReplayLLM(cassette)
+        response = player.chat.completions.create(messages=CODEGEN_MESSAGES)
+        assert response.choices[0].message.content == upstream.content
+        assert response.usage.total_tokens == 17
+        chunks = player.chat.completions.create(messages=CODEGEN_MESSAGES, stream=True)
+        assert "".join(chunk.choices[0].delta.content for chunk in chunks) == upstream.content
+        player.check_complete()
+
+    def test_replay_miss_raises(self, tmp_path):
+        """测试 2：回放未命中时抛出异常；即使分析器吞掉了异常，check_complete 仍会报告未命中的键"""
+        player = RecordReplayLLM(str(tmp_path / "empty.json"))
+        with pytest.raises(CassetteMissError, match="codegen"):
+            player.chat.completions.create(messages=CODEGEN_MESSAGES)
+
+        agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        agent.fast_router = None
+        agent.client = player
+        assert agent.semantic_router("随便聊聊")["task_type"] == "CHAT"  # 路由降级，异常被吞掉
+
+        with pytest.raises(CassetteMissError, match="2 个请求未命中"):
+            player.check_complete()
+        assert player.missing[0] == request_key(CODEGEN_MESSAGES)
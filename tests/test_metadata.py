@@ -0,0 +1,50 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from unittest.mock import MagicMock
+from src.core.analyzer import AIDrivenFormAnalyzer
+
+
+class TestMetadataProfile:
+    """测试按数据版本缓存、增量维护的元信息画像"""
+
+    @pytest.fixture
+    def analyzer(self):
+        agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        agent.raw_data = pd.DataFrame({
+            "省份": ["北京市", "北京市", None, "上海市"],
+            "GDP": [100.0, 100.0, None, np.nan],
+        })
+        return agent
+
+    def test_metadata_cached_per_version(self, analyzer, mocker):
+        """测试 1：同一数据版本重复查询时不再重新统计"""
+        first = analyzer.get_data_metadata()
+        spy = mocker.spy(AIDrivenFormAnalyzer, "_build_metadata_profile")
+
+        assert analyzer.get_data_metadata() == first
+        spy.assert_not_called()
+
+        # 整体替换底表后版本号递增，缓存随之失效
+        version = analyzer.data_version
+        analyzer.processed_data = analyzer.raw_data.head(1)
+        assert analyzer.data_version == version + 1
+        assert json.loads(analyzer.get_data_metadata())["shape"] == [1, 2]
+
+    def test_default_preprocess_updates_profile_incrementally(self, analyzer, mocker):
+        """测试 2：DEFAULT 预处理去重去空后，元信息增量更新且与全量重算一致"""
+        analyzer.get_data_metadata()
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = "```python\nprint('ok')\n```"
+        mocker.patch.object(analyzer.client.chat.completions, 'create', return_value=mock_response)
+        spy = mocker.spy(AIDrivenFormAnalyzer, "_build_metadata_profile")
+
+        success, _, _ = analyzer.execute_agentic_code(query="分析", metadata="{}", preprocess_mode="DEFAULT")
+        incremental = json.loads(analyzer.get_data_metadata())
+
+        assert success
+        spy.assert_not_called()
+        assert incremental == json.loads(analyzer.get_data_metadata(analyzer.processed_data))
+        assert incremental["shape"] == [2, 2]
+        assert incremental["missing_values"] == {"省份": 0, "GDP": 1}
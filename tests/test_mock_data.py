@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+from generate_mock_data import PROVINCES, generate_chunks, generate_environmental_data
+
+
+class TestMockDataGenerator:
+    """测试向量化压测数据生成器：默认形态、可复现性、脏数据比例与分块输出"""
+
+    def test_default_panel_matches_original_layout(self, tmp_path):
+        """测试 1：默认生成 31 省 × 5 年 (2019-2023) 的 Excel，行按 年份 × 省份 铺开"""
+        path = generate_environmental_data(seed=0, output_path=str(tmp_path / "mock.xlsx"))
+        df = pd.read_excel(path)
+
+        assert len(df) == len(PROVINCES) * 5
+        assert df.columns.tolist() == ["年份", "省份", "GDP_亿元", "工业排放量_万吨", "备注"]
+        assert df["年份"].tolist()[::len(PROVINCES)] == [2019, 2020, 2021, 2022, 2023]
+        assert df["省份"].tolist()[:len(PROVINCES)] == PROVINCES
+        assert set(df["备注"]) <= {"已核实", "待核查", "数据异常"}
+
+    def test_seed_reproducible_and_chunking_invariant(self):
+        """测试 2：同一种子结果可复现，且分块大小相同时输出前缀与总行数无关 (含末尾不满的块)"""
+        first = pd.concat(generate_chunks(rows=2_500, seed=7, chunksize=1_000), ignore_index=True)
+        again = pd.concat(generate_chunks(rows=2_500, seed=7, chunksize=1_000), ignore_index=True)
+        longer = pd.concat(generate_chunks(rows=5_000, seed=7, chunksize=1_000), ignore_index=True)
+
+        pd.testing.assert_frame_equal(first, again)
+        pd.testing.assert_frame_equal(first, longer.head(2_500))
+
+    def test_dirty_data_rates_and_year_range(self):
+        """测试 3：空值 / 异常值比例与年份范围可配置，并与备注严格对应"""
+        df = pd.concat(generate_chunks(rows=200_000, seed=1, year_start=2010, year_end=2023,
+                                       nan_rate=0.1, outlier_rate=0.02), ignore_index=True)
+
+        missing = df["工业排放量_万吨"].isna()
+        outlier = df["GDP_亿元"] == -999
+        assert missing.mean() == pytest.approx(0.1, abs=0.005)
+        assert outlier.mean() == pytest.approx(0.02, abs=0.002)
+        assert (df.loc[missing, "备注"] == "待核查").all() and (df.loc[outlier, "备注"] == "数据异常").all()
+        assert df["年份"].min() == 2010 and df["年份"].max() == 2023
+
+    @pytest.mark.parametrize("fmt", ["csv", "parquet"])
+    def test_chunked_output_roundtrip(self, tmp_path, fmt):
+        """测试 4：分块写出的 CSV / Parquet 与内存中生成的数据一致"""
+        path = generate_environmental_data(rows=3_000, seed=3, fmt=fmt, chunksize=1_000,
+                                           output_path=str(tmp_path / f"mock.{fmt}"))
+        expected = pd.concat(generate_chunks(rows=3_000, seed=3, chunksize=1_000), ignore_index=True)
+
+        loaded = pd.read_csv(path, encoding="utf-8-sig") if fmt == "csv" else pd.read_parquet(path)
+
+        assert len(loaded) == 3_000
+        pd.testing.assert_frame_equal(loaded.astype({"省份": str, "备注": str}),
+                                      expected.astype({"省份": str, "备注": str}))
@@ -0,0 +1,64 @@
+import time
+import pandas as pd
+import pytest
+from src.core.analyzer import AIDrivenFormAnalyzer
+
+
+class TestPreflightPipeline:
+    """测试单轮对话的并发预执行流水线 (路由 / 元信息 / RAG)"""
+
+    @pytest.fixture
+    def analyzer(self):
+        agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        agent.raw_data = pd.DataFrame({"省份": ["北京市"], "GDP": [100.0]})
+        return agent
+
+    def test_rag_overlaps_with_llm_router(self, analyzer, mocker):
+        """测试 1：LLM 路由飞行期间投机启动的 RAG 检索应与之重叠执行"""
+        def slow_router(query, **kwargs):
+            time.sleep(0.3)
+            return {"task_type": "DATA_OP", "need_rag": True, "preprocess_mode": "NONE"}
+
+        def slow_rag(query):
+            time.sleep(0.3)
+            return "【系统内置知识】: TEGDP"
+
+        mocker.patch.object(analyzer, "semantic_router", side_effect=slow_router)
+        mocker.patch.object(analyzer, "retrieve_knowledge", side_effect=slow_rag)
+
+        result = analyzer.prepare_turn("再改一下")
+
+        assert result["rag_context"] == "【系统内置知识】: TEGDP"
+        assert result["route"]["task_type"] == "DATA_OP"
+        assert '"shape"' in result["metadata"]
+        assert result["seconds"] < 0.5
+
+    def test_speculative_rag_discarded(self, analyzer, mocker):
+        """测试 2：路由判定无需 RAG 时，投机检索的结果必须被丢弃"""
+        mocker.patch.object(analyzer, "semantic_router",
+                            return_value={"task_type": "DATA_OP", "need_rag": False, "preprocess_mode": "NONE"})
+        mocker.patch.object(analyzer, "retrieve_knowledge", return_value="不应出现的知识")
+
+        assert analyzer.prepare_turn("再改一下")["rag_context"] == ""
+
+    def test_fast_path_skips_speculation(self, analyzer, mocker):
+        """测试 3：本地快车道已判定无需 RAG 时，不应发起任何检索"""
+        spy = mocker.patch.object(analyzer, "retrieve_knowledge")
+
+        result = analyzer.prepare_turn("画个柱状图")
+
+        assert result["route"]["task_type"] == "PLOT"
+        spy.assert_not_called()
+
+    def test_fast_path_classifies_once(self, analyzer, mocker):
+        """测试 4：快车道未命中回退 LLM 路由时，本地分类器在本轮只运行一次"""
+        classify = mocker.spy(analyzer.fast_router, "classify")
+        mocker.patch.object(analyzer, "_chat_completion",
+                            return_value='{"task_type": "DATA_OP", "need_rag": false, "preprocess_mode": "NONE"}')
+        mocker.patch.object(analyzer, "retrieve_knowledge", return_value="")
+
+        result = analyzer.prepare_turn("再改一下")
+
+        assert result["route"]["task_type"] == "DATA_OP"
+        assert classify.call_count == 1
+        assert analyzer.router_stats == {"fast_path": 0, "llm": 1}
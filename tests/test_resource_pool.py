@@ -0,0 +1,83 @@
+import gc
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+import pytest
+from src.core.analyzer import AIDrivenFormAnalyzer
+from src.core.resource_pool import SharedResources
+
+
+class TestSharedResources:
+    """测试多会话共享资源池：重量级资源共享、会话数据与临时目录隔离、指标"""
+
+    @pytest.fixture
+    def resources(self, tmp_path, embedding):
+        pool = SharedResources(temp_root=str(tmp_path / "sessions"), embedding_function=embedding, warmup=False)
+        yield pool
+        pool.close()
+
+    def test_sessions_share_heavy_resources(self, resources):
+        """测试 1：各会话复用同一个 HTTP 连接池与知识库集合"""
+        a = AIDrivenFormAnalyzer(api_key="sk-a", resources=resources, session_id="a")
+        b = AIDrivenFormAnalyzer(api_key="sk-b", resources=resources, session_id="b")
+
+        assert a.client._client is b.client._client is resources.http_client
+        assert a.collection is b.collection is resources.kb_collection
+        assert a.client.api_key != b.client.api_key
+
+    def test_concurrent_uploads_do_not_collide(self, resources, make_upload):
+        """测试 2：两个会话上传同名扩展的文件时落盘路径互不覆盖"""
+        a = AIDrivenFormAnalyzer(api_key="sk-a", resources=resources, session_id="a")
+        b = AIDrivenFormAnalyzer(api_key="sk-b", resources=resources, session_id="b")
+
+        path_a = a.load_data(make_upload("x.csv", "省份,GDP\n北京市,1\n".encode("utf-8")))
+        path_b = b.load_data(make_upload("y.csv", "省份,GDP\n上海市,2\n上海市,3\n".encode("utf-8")))
+
+        assert path_a != path_b
+        assert a.restore_data(path_a) and a.raw_data["省份"].tolist() == ["北京市"]
+        assert len(b.raw_data) == 2
+
+    def test_metrics_and_session_cleanup(self, resources):
+        """测试 3：指标包含各会话内存；会话结束 (分析器被回收) 后其临时目录被清理"""
+        a = AIDrivenFormAnalyzer(api_key="sk-a", resources=resources, session_id="a")
+        a.raw_data = pd.DataFrame({"值": range(1000)})
+        temp_dir = a.temp_dir
+
+        metrics = resources.metrics()
+        assert metrics["sessions"] == 1 and "session_memory_mb" not in metrics
+        assert set(metrics["connections"]) == {"requests", "max_connections", "new_connections", "reused_requests"}
+        metrics = resources.metrics(include_memory=True)
+        assert metrics["session_memory_mb"]["a"] > 0
+        assert resources.session_stats(["a", "不存在"]) == {"a": metrics["session_memory_mb"]["a"]}
+
+        del a
+        gc.collect()
+        assert resources.prune_sessions() == 1
+        assert not os.path.exists(temp_dir)
+
+    def test_connection_reuse_is_observable(self, resources):
+        """测试 4：连接指标区分新建连接与复用连接的请求 (本地 keep-alive 服务，三次请求只建一次连接)"""
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            for _ in range(3):
+                resources.http_client.get(f"http://127.0.0.1:{server.server_port}/")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        stats = resources.connection_stats()
+        assert (stats["requests"], stats["new_connections"], stats["reused_requests"]) == (3, 1, 2)
@@ -8,8 +8,10 @@ class TestSemanticRouter:
 
     @pytest.fixture
     def analyzer(self):
-        """Pytest Fixture：为每个测试用例初始化一个带假 Key 的 Analyzer"""
-        return AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        """Pytest Fixture：为每个测试用例初始化一个带假 Key 的 Analyzer (关闭本地快车道，专测 LLM 解析)"""
+        agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        agent.fast_router = None
+        return agent
 
     def test_router_normal_json_parsing(self, analyzer, mocker):
         """测试 1：当大模型正常返回标准 JSON 时，路由能否正确解析"""
@@ -61,4 +63,41 @@ class TestSemanticRouter:
         # 断言是否成功降级为了最安全的默认状态
         assert result["task_type"] == "CHAT"
         assert result["need_rag"] is False
-        assert result["preprocess_mode"] == "NONE"
\ No newline at end of file
+        assert result["preprocess_mode"] == "NONE"
+
+
+class TestFastIntentRouter:
+    """测试本地快车道分类器：明显意图本地秒判，歧义意图回退 LLM"""
+
+    @pytest.fixture
+    def analyzer(self):
+        return AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+
+    @pytest.mark.parametrize("query, expected", [
+        ("画个柱状图", {"task_type": "PLOT", "need_rag": False, "preprocess_mode": "DEFAULT"}),
+        ("数据清洗红线都有什么", {"task_type": "CHAT", "need_rag": True, "preprocess_mode": "NONE"}),
+        ("帮我把空值填上", {"task_type": "DATA_OP", "need_rag": False, "preprocess_mode": "CUSTOM"}),
+        ("和我聊聊游戏", {"task_type": "CHAT", "need_rag": False, "preprocess_mode": "NONE"}),
+    ])
+    def test_fast_path_skips_llm(self, analyzer, mocker, query, expected):
+        """测试 1：Few-Shot 中的明显意图应由本地规则直接命中，不发起网络调用"""
+        spy = mocker.patch.object(analyzer.client.chat.completions, 'create')
+
+        result = analyzer.semantic_router(f"user: 你好\n当前需求: {query}")
+
+        assert result == expected
+        spy.assert_not_called()
+        assert analyzer.router_stats == {"fast_path": 1, "llm": 0}
+
+    @pytest.mark.parametrize("query", ["查一下数据清洗红线，然后把空值全删了", "不要画图，给我看看前5行", "再改一下"])
+    def test_ambiguous_query_falls_back_to_llm(self, analyzer, mocker, query):
+        """测试 2：信号冲突、否定语气或无法判定的输入必须回退到 LLM 路由"""
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = '{"task_type": "DATA_OP", "need_rag": true, "preprocess_mode": "CUSTOM"}'
+        spy = mocker.patch.object(analyzer.client.chat.completions, 'create', return_value=mock_response)
+
+        result = analyzer.semantic_router(query)
+
+        spy.assert_called_once()
+        assert result["task_type"] == "DATA_OP"
+        assert analyzer.router_stats == {"fast_path": 0, "llm": 1}
@@ -1,5 +1,7 @@
+import time
 import pytest
 import pandas as pd
+from types import SimpleNamespace
 from unittest.mock import MagicMock
 from src.core.analyzer import AIDrivenFormAnalyzer
 
@@ -58,4 +60,138 @@ class TestAgentSandbox:
         assert success
         # 【核心断言】：全局底层 processed_data 被成功唤醒并覆写
         assert analyzer.processed_data is not None
-        assert "新列" in analyzer.processed_data.columns
\ No newline at end of file
+        assert "新列" in analyzer.processed_data.columns
+
+    def test_copy_on_write_isolation(self, analyzer, mocker):
+        """测试 4：CoW 零拷贝注入下，沙箱内的原地修改不能穿透到全局底表"""
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = (
+            "```python\n"
+            "df.loc[0, '工业产值'] = -1\n"
+            "raw_df.drop(columns=['日期'], inplace=True)\n"
+            "result_df = df\n"
+            "```"
+        )
+        mocker.patch.object(analyzer.client.chat.completions, 'create', return_value=mock_response)
+
+        success, res_dict, code = analyzer.execute_agentic_code(query="改一下第一行", metadata="{}")
+
+        assert success
+        assert res_dict["df"]["工业产值"].iloc[0] == -1
+        # 【核心断言】：原始底表的取值与列结构均保持不变
+        assert analyzer.raw_data["工业产值"].tolist() == [100, 200]
+        assert list(analyzer.raw_data.columns) == ["日期", "工业产值"]
+        assert analyzer.processed_data is None
+
+    def test_view_falls_back_to_deep_copy_without_cow(self, analyzer):
+        """测试 5：进程级 CoW 被外部关闭时，沙箱注入退回深拷贝，原地修改同样不能穿透到全局底表"""
+        assert pd.get_option("mode.copy_on_write")
+        with pd.option_context("mode.copy_on_write", False):
+            outputs = analyzer._run_sandbox("df.loc[0, '工业产值'] = -1\nresult_df = df", analyzer.raw_data)
+        assert outputs["result_df"]["工业产值"].iloc[0] == -1
+        assert analyzer.raw_data["工业产值"].tolist() == [100, 200]
+
+
+class FakeStream:
+    """模拟 OpenAI 流式响应：记录被消费的分片数量与是否被主动关闭"""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for piece in self.pieces:
+            self.consumed += 1
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    def close(self):
+        self.closed = True
+
+
+class TestStreamingCodegen:
+    """测试流式代码生成：代码块闭合即断流并进入执行"""
+
+    def test_stream_stops_at_closing_fence(self, mocker):
+        """测试 1：闭合围栏之后的解释性文字不再被消费，且流被主动关闭"""
+        agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        agent.raw_data = pd.DataFrame({"工业产值": [100, 200]})
+        agent.stream_codegen = True
+        stream = FakeStream(["好的：\n``", "`python\nresult_df = df", ".head(1)\n`", "``", "\n\n解释", "说明很长"])
+        spy = mocker.patch.object(agent.client.chat.completions, 'create', return_value=stream)
+
+        success, res_dict, code = agent.execute_agentic_code(query="取第一行", metadata="{}")
+
+        assert success
+        assert code == "result_df = df.head(1)"
+        assert len(res_dict["df"]) == 1
+        assert spy.call_args.kwargs["stream"] is True
+        assert stream.consumed == 4
+        assert stream.closed
+
+
+class TestParallelCandidates:
+    """测试投机式并行候选生成：取最先通过校验的候选，全部失败才串行反思"""
+
+    @pytest.fixture
+    def analyzer(self):
+        agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+        agent.raw_data = pd.DataFrame({"日期": ["2023", "2024"], "工业产值": [100, 200]})
+        return agent
+
+    @staticmethod
+    def _response(content):
+        response = MagicMock()
+        response.choices[0].message.content = content
+        return response
+
+    def test_first_passing_candidate_wins(self, analyzer, mocker):
+        """测试 1：低温候选崩溃、高温候选成功时，直接返回成功候选且不触发串行重试"""
+        def fake_create(**kwargs):
+            if kwargs["temperature"] == 0.1:
+                return self._response("```python\nresult_df = df['不存在的列']\n```")
+            return self._response("```python\nresult_df = df[['工业产值']].sum().to_frame()\n```")
+
+        spy = mocker.patch.object(analyzer.client.chat.completions, 'create', side_effect=fake_create)
+
+        success, res_dict, code = analyzer.execute_agentic_code(query="求和", metadata="{}", num_candidates=3)
+
+        assert success
+        assert res_dict["df"].iloc[0, 0] == 300
+        assert spy.call_count == 3
+        assert {call.kwargs["temperature"] for call in spy.call_args_list} == {0.1, 0.4, 0.7}
+
+    def test_all_candidates_fail_then_serial_repair(self, analyzer, mocker):
+        """测试 2：所有候选都失败时回退到串行反思重试链路"""
+        responses = [self._response("```python\nraise ValueError('候选失败')\n```")] * 2 + \
+                    [self._response("```python\nresult_df = df.head(1)\n```")]
+        spy = mocker.patch.object(analyzer.client.chat.completions, 'create', side_effect=responses)
+
+        success, res_dict, code = analyzer.execute_agentic_code(query="取一行", metadata="{}", num_candidates=2)
+
+        assert success
+        assert code == "result_df = df.head(1)"
+        assert spy.call_count == 3
+        repair_prompt = spy.call_args_list[2].kwargs["messages"][0]["content"]
+        assert "[并行候选均失败]" in repair_prompt and "候选失败" in repair_prompt
+
+    def test_losing_candidates_stopped_before_return(self, analyzer, mocker):
+        """测试 3：胜出后等待落选候选退出，慢速候选拿到回复后不再进入沙箱执行"""
+        finished = []
+
+        def fake_create(**kwargs):
+            if kwargs["temperature"] == 0.4:
+                time.sleep(0.3)
+                finished.append(kwargs["temperature"])
+                return self._response("```python\nupdate_df = df.head(0)\n```")
+            return self._response("```python\nresult_df = df.head(1)\n```")
+
+        mocker.patch.object(analyzer.client.chat.completions, 'create', side_effect=fake_create)
+        run_sandbox = mocker.spy(analyzer, "_run_sandbox")
+
+        success, res_dict, code = analyzer.execute_agentic_code(query="取一行", metadata="{}", num_candidates=2)
+
+        assert success and code == "result_df = df.head(1)"
+        assert finished == [0.4]
+        assert run_sandbox.call_count == 1
+        assert analyzer.processed_data is None
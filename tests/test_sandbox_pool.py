@@ -0,0 +1,94 @@
+from multiprocessing import shared_memory
+
+import pandas as pd
+import pytest
+from unittest.mock import MagicMock
+from src.core.analyzer import AIDrivenFormAnalyzer
+from src.core.sandbox_pool import (SandboxExecutionError, SandboxMemoryError, SandboxPool, SandboxTimeoutError,
+                                   export_frame, import_frame)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    """整个测试模块共用一个单 worker 的预热进程池"""
+    sandbox_pool = SandboxPool(size=1, timeout_s=5, memory_limit_mb=700)
+    yield sandbox_pool
+    sandbox_pool.close()
+
+
+class TestSandboxPool:
+    """测试多进程沙箱：共享内存传输、输出契约与资源上限"""
+
+    def test_shared_memory_round_trip(self):
+        """测试 1：Arrow 与 pickle 两条共享内存通道都能无损往返"""
+        frames = [pd.DataFrame({"省份": ["北京市", "上海市"], "GDP": [1.5, 2.5]}),
+                  pd.DataFrame({"混合列": [1, "字符串"]})]
+        for df in frames:
+            desc, shm = export_frame(df)
+            try:
+                pd.testing.assert_frame_equal(import_frame(desc), df)
+            finally:
+                shm.close()
+                shm.unlink()
+
+    def test_run_returns_sandbox_contract(self, pool):
+        """测试 2：worker 返回与进程内沙箱一致的 result_df / update_df / fig / stdout"""
+        df = pd.DataFrame({"日期": ["2023", "2024"], "工业产值": [100, 200]})
+        code = ("result_df = df[df['工业产值'] > 150]\n"
+                "update_df = df.assign(新列=1)\n"
+                "fig, ax = plt.subplots()\nax.plot(df['工业产值'])\n"
+                "print('完成')")
+
+        outputs = pool.run(code, {"df": df})
+
+        assert outputs["result_df"]["工业产值"].tolist() == [200]
+        assert "新列" in outputs["update_df"].columns
+        assert outputs["fig"].get_axes()
+        assert outputs["stdout"].strip() == "完成"
+
+    def test_errors_and_limits(self, pool):
+        """测试 3：异常携带 worker 端 Traceback，超时与超内存的 worker 被替换后池仍可用"""
+        with pytest.raises(SandboxExecutionError, match="ZeroDivisionError"):
+            pool.run("x = 1 / 0", {})
+        with pytest.raises(SandboxTimeoutError):
+            pool.run("while True:\n    pass", {})
+        with pytest.raises(SandboxMemoryError):
+            pool.run("blob = np.ones(150_000_000)", {})
+
+        assert pool.run("print('alive')", {})["stdout"].strip() == "alive"
+
+    def test_analyzer_executes_in_pool(self, pool, mocker):
+        """测试 4：配置进程池后，Agent 链路的读写分离状态机行为保持不变"""
+        agent = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing", sandbox_pool=pool)
+        agent.raw_data = pd.DataFrame({"日期": ["2023", "2024"], "工业产值": [100, 200]})
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = "```python\nupdate_df = df.copy()\nupdate_df['新列'] = 1\n```"
+        mocker.patch.object(agent.client.chat.completions, 'create', return_value=mock_response)
+
+        success, res_dict, code = agent.execute_agentic_code(query="新增一列", metadata="{}")
+
+        assert success
+        assert "新列" in agent.processed_data.columns
+        assert "新列" not in agent.raw_data.columns
+
+    def test_dead_worker_replaced(self, pool):
+        """测试 5：空闲期间被杀死的 worker 不会被复用，执行仍然成功"""
+        worker = pool._idle.queue[0]
+        worker.process.kill()
+        worker.process.join()
+
+        assert pool.run("print('alive')", {})["stdout"].strip() == "alive"
+        assert pool._idle.queue[0].process.is_alive()
+
+    def test_timeout_reclaims_output_segments(self, pool, mocker):
+        """测试 6：worker 被强制终止时，父进程按名回收其遗留的输出共享内存段"""
+        token = "0123456789abcdef"
+        mocker.patch("src.core.sandbox_pool.uuid.uuid4", return_value=MagicMock(hex=token))
+        leftover = shared_memory.SharedMemory(name=f"sbx{token}_r", create=True, size=16)
+        leftover.close()
+
+        with pytest.raises(SandboxTimeoutError):
+            pool.run("while True:\n    pass", {})
+
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=f"sbx{token}_r")
@@ -0,0 +1,146 @@
+import json
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from openai.resources.chat import Completions
+from src.core.analyzer import AIDrivenFormAnalyzer
+from src.core.telemetry import MetricsRegistry, Tracer, estimate_tokens, start_metrics_server
+
+CODE = "```python\nresult_df = df.groupby('省份', as_index=False)['GDP'].sum()\n```"
+
+
+def completion(content, prompt_tokens=120, completion_tokens=30):
+    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                            total_tokens=prompt_tokens + completion_tokens)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+@pytest.fixture
+def traced_analyzer():
+    analyzer = AIDrivenFormAnalyzer(api_key="sk-dummy-key-for-testing")
+    analyzer.raw_data = pd.DataFrame({"省份": ["北京市", "上海市", "北京市"], "GDP": [1.0, 2.0, 3.0]})
+    analyzer.tracer = Tracer(registry=MetricsRegistry())
+    return analyzer
+
+
+class TestTelemetry:
+    """测试分阶段追踪、token 统计与 Prometheus 指标导出"""
+
+    def test_turn_collects_spans_tokens_and_json_log(self, tmp_path):
+        """测试 1：一轮内的 span 按阶段汇总耗时与 token，结束时写出一行 JSON 日志并计入指标"""
+        registry = MetricsRegistry()
+        tracer = Tracer(session_id="s1", registry=registry, log_path=str(tmp_path / "traces.jsonl"))
+
+        tracer.start_turn("按省份汇总")
+        with tracer.span("codegen_llm") as span:
+            span.update(prompt_tokens=100, completion_tokens=20)
+        with tracer.span("codegen_llm") as span:
+            span.update(prompt_tokens=50, completion_tokens=10)
+        with pytest.raises(ValueError):
+            with tracer.span("sandbox_exec", peak_rss_mb=321.5):
+                raise ValueError("boom")
+        tracer.count_attempt()
+        record = tracer.end_turn(status="success")
+
+        assert set(record["breakdown"]) == {"codegen_llm", "sandbox_exec"}
+        assert (record["prompt_tokens"], record["completion_tokens"], record["attempts"]) == (150, 30, 1)
+        assert record["sandbox_peak_rss_mb"] == 321.5
+        assert record["spans"][-1]["error"] == "ValueError"
+        logged = json.loads((tmp_path / "traces.jsonl").read_text(encoding="utf-8"))
+        assert logged["trace_id"] == record["trace_id"] and logged["session_id"] == "s1"
+        assert tracer.current is None and len(tracer.history) == 1
+
+        snapshot = registry.snapshot()
+        assert snapshot["stages"]["codegen_llm"]["count"] == 2
+        assert snapshot["counters"]['llm_tokens_total{kind="prompt",stage="codegen_llm"}'] == 150
+        assert snapshot["counters"]['turns_total{status="success"}'] == 1
+
+    def test_prometheus_rendering(self):
+        """测试 2：直方图桶为累计计数，并包含 +Inf / sum / count 与计数器、仪表的类型声明"""
+        registry = MetricsRegistry(buckets=(0.1, 1))
+        registry.observe("rag", 0.05)
+        registry.observe("rag", 0.5)
+        registry.inc("codegen_attempts_total", kind="retry")
+        registry.set_max("sandbox_peak_rss_mb", 200)
+        registry.set_max("sandbox_peak_rss_mb", 150)
+
+        text = registry.render_prometheus()
+
+        assert 'afa_stage_duration_seconds_bucket{stage="rag",le="0.1"} 1' in text
+        assert 'afa_stage_duration_seconds_bucket{stage="rag",le="1"} 2' in text
+        assert 'afa_stage_duration_seconds_bucket{stage="rag",le="+Inf"} 2' in text
+        assert 'afa_stage_duration_seconds_count{stage="rag"} 2' in text
+        assert "# TYPE afa_codegen_attempts_total counter" in text
+        assert 'afa_codegen_attempts_total{kind="retry"} 1' in text
+        assert "afa_sandbox_peak_rss_mb 200" in text
+
+    def test_analyzer_pipeline_is_instrumented(self, traced_analyzer, mocker):
+        """测试 3：分析器各阶段 (快车道路由 / 元信息 / 提示词 / 代码生成 / 沙箱) 均被记录，含 token 用量、重试与峰值内存"""
+        create = mocker.patch.object(traced_analyzer.client.chat.completions, "create",
+                                     side_effect=[completion("```python\nresult_df = df['不存在']\n```"),
+                                                  completion(CODE)])
+        tracer = traced_analyzer.tracer
+
+        tracer.start_turn("按省份汇总 GDP")
+        preflight = traced_analyzer.prepare_turn("按省份汇总 GDP")
+        success, res_dict, _ = traced_analyzer.execute_agentic_code(
+            query="按省份汇总 GDP", metadata=preflight["metadata"], max_retries=2)
+        record = tracer.end_turn(status="success")
+
+        assert success and res_dict["df"]["GDP"].tolist() == [2.0, 4.0]
+        assert create.call_count == 2
+        assert {"router_fast", "metadata", "prompt_build", "codegen_llm", "sandbox_exec"} <= set(record["breakdown"])
+        assert record["attempts"] == 2
+        assert (record["prompt_tokens"], record["completion_tokens"]) == (240, 60)
+        assert record["sandbox_peak_rss_mb"] > 0
+        counters = tracer.registry.snapshot()["counters"]
+        assert counters['codegen_attempts_total{kind="retry"}'] == 1
+
+    def test_streamed_codegen_reports_tokens(self, traced_analyzer, mocker):
+        """测试 4：流式代码生成请求 usage；提前断流拿不到 usage 时按文本估算，token 指标不为 0"""
+        def chunk(content=None, usage=None):
+            choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+            return SimpleNamespace(choices=choices, usage=usage)
+
+        traced_analyzer.stream_codegen = True
+        full = [chunk("无法生成代码"), chunk(usage=SimpleNamespace(prompt_tokens=300, completion_tokens=40))]
+        early = [chunk(CODE), chunk("\n以上代码按省份汇总"), chunk(usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1))]
+        create = mocker.patch.object(traced_analyzer.client.chat.completions, "create", side_effect=[iter(early)])
+
+        tracer = traced_analyzer.tracer
+        tracer.start_turn("按省份汇总 GDP")
+        assert traced_analyzer.execute_agentic_code(query="按省份汇总 GDP", metadata="{}")[0]
+        span = next(span for span in tracer.end_turn()["spans"] if span["name"] == "codegen_llm")
+
+        assert create.call_args.kwargs["stream_options"] == {"include_usage": True}
+        assert span["tokens_estimated"] and span["completion_tokens"] == estimate_tokens(CODE)
+        assert span["prompt_tokens"] > 0
+
+        # 没有代码块、完整接收到流末尾的 usage 分块时使用接口返回的真实用量
+        span = {}
+        create.side_effect = [iter(full)]
+        traced_analyzer._stream_until_code_block([{"role": "user", "content": "x"}], 0.1, 100, span)
+        assert (span["prompt_tokens"], span["completion_tokens"]) == (300, 40) and "tokens_estimated" not in span
+
+    def test_metrics_server_binds_loopback_by_default(self):
+        """测试 5：独立指标端点默认只监听本机回环地址"""
+        server = start_metrics_server(0, registry=MetricsRegistry())
+        try:
+            assert server.server_address[0] == "127.0.0.1"
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_stream_request_binds_installed_sdk(self, traced_analyzer, mocker):
+        """测试 6：流式请求参数按已安装 openai SDK 的真实签名绑定，旧版 SDK 下 usage 经 extra_body 请求并以字典返回"""
+        chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="无法生成代码"))], usage=None),
+                  SimpleNamespace(choices=[], usage={"prompt_tokens": 300, "completion_tokens": 40})]
+        create = mocker.patch.object(Completions, "create", autospec=True, return_value=iter(chunks))
+
+        span = {}
+        traced_analyzer._stream_until_code_block([{"role": "user", "content": "x"}], 0.1, 100, span)
+        kwargs = create.call_args.kwargs
+        options = kwargs.get("stream_options") or kwargs["extra_body"]["stream_options"]
+        assert options == {"include_usage": True}
+        assert (span["prompt_tokens"], span["completion_tokens"]) == (300, 40)